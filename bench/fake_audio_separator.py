@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Stand-in for the audio-separator CLI used by the benchmark harness.
+
+Accepts the arguments server.py passes (inputs, --output_dir, --model_filename,
+--model_file_dir, --single_stem, --list_models, --download_model_only). For
+each input it decodes the audio with FFmpeg, spends CPU time in proportion to
+the audio length, prints tqdm-style bars on stderr and log lines on stdout
+like the real separator, and writes one FLAC file per stem.
+
+FAKE_SEPARATOR_RTF sets the compute seconds spent per second of audio (default
+0.1) and FAKE_SEPARATOR_PASSES the model passes per input (default 4, like
+htdemucs_ft).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+SAMPLE_RATE = 44100
+BLOCK_FRAMES = 4096
+STEMS = ['Vocals', 'Drums', 'Bass', 'Other']
+
+# Frequency bands (Hz) kept in each fake stem
+STEM_BANDS = {
+    'Bass': (20, 250),
+    'Vocals': (250, 4000),
+    'Drums': (4000, 16000),
+    'Other': (16000, SAMPLE_RATE // 2)
+}
+
+
+def decode(ffmpeg_path, path):
+    """Decode an input to stereo float32 at SAMPLE_RATE"""
+    result = subprocess.run(
+        [ffmpeg_path, '-nostdin', '-i', path, '-f', 'f32le', '-ar', str(SAMPLE_RATE), '-ac', '2', 'pipe:1'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True
+    )
+    return np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, 2)
+
+
+def encode(ffmpeg_path, samples, path):
+    """Encode stereo float32 samples to FLAC"""
+    subprocess.run(
+        [ffmpeg_path, '-nostdin', '-y', '-f', 'f32le', '-ar', str(SAMPLE_RATE), '-ac', '2', '-i', 'pipe:0',
+         '-c:a', 'flac', path],
+        input=np.ascontiguousarray(samples, dtype=np.float32).tobytes(),
+        stderr=subprocess.DEVNULL,
+        check=True
+    )
+
+
+def print_bar(done, total, started):
+    """Print a tqdm-style progress bar line on stderr"""
+    percent = int(100 * done / total)
+    filled = percent // 10
+    elapsed = time.time() - started
+    rate = done / elapsed if elapsed > 0 else 0.0
+    remaining = (total - done) / rate if rate > 0 else 0.0
+    sys.stderr.write(
+        f"{percent:3d}%|{'#' * filled}{' ' * (10 - filled)}| {done}/{total} "
+        f"[{int(elapsed) // 60:02d}:{int(elapsed) % 60:02d}<{int(remaining) // 60:02d}:{int(remaining) % 60:02d}, "
+        f"{rate:.2f}it/s]\n"
+    )
+    sys.stderr.flush()
+
+
+def model_pass(samples, budget_seconds):
+    """Burn about budget_seconds of CPU on block FFTs, reporting progress like a model pass"""
+    steps = 20
+    started = time.time()
+    blocks = max(1, len(samples) // BLOCK_FRAMES)
+    block = 0
+    print_bar(0, steps, started)
+    for step in range(1, steps + 1):
+        deadline = started + budget_seconds * step / steps
+        while True:
+            start = (block % blocks) * BLOCK_FRAMES
+            spectrum = np.fft.rfft(samples[start:start + BLOCK_FRAMES], axis=0)
+            np.fft.irfft(spectrum * 0.5, axis=0)
+            block += 1
+            if time.time() >= deadline:
+                break
+        print_bar(step, steps, started)
+
+
+def band_filter(samples, low, high):
+    """Keep one frequency band of the samples, block by block"""
+    output = np.empty_like(samples)
+    frequencies = np.fft.rfftfreq(BLOCK_FRAMES, 1.0 / SAMPLE_RATE)
+    mask = ((frequencies >= low) & (frequencies < high)).astype(np.float32)[:, None]
+    for start in range(0, len(samples), BLOCK_FRAMES):
+        block = samples[start:start + BLOCK_FRAMES]
+        spectrum = np.fft.rfft(block, n=BLOCK_FRAMES, axis=0)
+        output[start:start + len(block)] = np.fft.irfft(spectrum * mask, n=BLOCK_FRAMES, axis=0)[:len(block)]
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake audio-separator for benchmarks')
+    parser.add_argument('inputs', nargs='*')
+    parser.add_argument('--output_dir', default='.')
+    parser.add_argument('--model_filename', default='htdemucs_ft.yaml')
+    parser.add_argument('--model_file_dir', default='/tmp/audio-separator-models/')
+    parser.add_argument('--single_stem', default=None)
+    parser.add_argument('-l', '--list_models', action='store_true')
+    parser.add_argument('--download_model_only', action='store_true')
+    args, _ = parser.parse_known_args()
+
+    if args.list_models:
+        print(json.dumps({'htdemucs_ft.yaml': {
+            'Name': 'Demucs v4: htdemucs_ft',
+            'Type': 'Demucs',
+            'Stems': [stem.lower() for stem in STEMS]
+        }}, indent=2))
+        return 0
+    if args.download_model_only:
+        # A Demucs-style .yaml naming one weights file by its signature
+        os.makedirs(args.model_file_dir, exist_ok=True)
+        with open(os.path.join(args.model_file_dir, args.model_filename), 'w') as f:
+            f.write("models: ['fa4e0000']\n")
+        with open(os.path.join(args.model_file_dir, 'fa4e0000-00000000.th'), 'wb') as f:
+            f.write(os.urandom(1024 * 1024))
+        return 0
+
+    ffmpeg_path = os.environ.get('FFMPEG_PATH') or 'ffmpeg'
+    realtime_factor = float(os.environ.get('FAKE_SEPARATOR_RTF', '0.1'))
+    passes = int(os.environ.get('FAKE_SEPARATOR_PASSES', '4'))
+    model_name = os.path.splitext(args.model_filename)[0]
+
+    print(f"INFO - Loading model {args.model_filename}...", flush=True)
+    for path in args.inputs:
+        print(f"INFO - Starting separation process for audio_file_path: {path}", flush=True)
+        samples = decode(ffmpeg_path, path)
+        duration = len(samples) / SAMPLE_RATE
+        for _ in range(passes):
+            model_pass(samples, realtime_factor * duration / passes)
+
+        base = os.path.splitext(os.path.basename(path))[0]
+        for stem in STEMS:
+            if args.single_stem and args.single_stem.lower() != stem.lower():
+                continue
+            output_path = os.path.join(args.output_dir, f"{base}_({stem})_{model_name}.flac")
+            encode(ffmpeg_path, band_filter(samples, *STEM_BANDS[stem]), output_path)
+            print(f"INFO - Saving {stem} stem to {os.path.basename(output_path)}...", flush=True)
+        print(f"INFO - Separation duration: {duration:.1f}s of audio", flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
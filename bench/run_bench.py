@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""End-to-end benchmark of server.py with a stand-in separator.
+
+Starts a copy of server.py in a scratch directory, with fake_audio_separator.py
+as its audio-separator, generates synthetic audio, and drives /api/separate,
+/api/progress, /api/result and /api/download at the given concurrency. Prints
+(or writes with --output) a JSON report of throughput, latency percentiles,
+time to first byte and the peak RSS, open file descriptors and child processes
+of the server. --compare prints the change against an earlier report.
+
+Example:
+    python bench/run_bench.py --jobs 8 --concurrency 4 --duration 30 --formats mp3 --output run.json
+"""
+import argparse
+import concurrent.futures
+import http.client
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import wave
+from urllib.parse import quote, urlsplit
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+SAMPLE_RATE = 44100
+REQUEST_TIMEOUT = 600
+RESOURCE_SAMPLE_INTERVAL = 0.2
+
+
+def generate_audio(path, duration, seed):
+    """Write a stereo 16-bit WAV of chords, noise and clicks; the seed makes every file unique"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    mix = np.zeros_like(t)
+    for frequency in rng.uniform(60, 2000, size=6):
+        mix += np.sin(2 * np.pi * frequency * t) * rng.uniform(0.05, 0.15)
+    mix += rng.normal(0, 0.02, size=len(t))
+    clicks = (t * 2) % 1 < 0.01
+    mix[clicks] += rng.uniform(-0.3, 0.3, size=int(clicks.sum()))
+    stereo = np.stack([mix, np.roll(mix, 200)], axis=1)
+    pcm = (np.clip(stereo, -1, 1) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as output:
+        output.setnchannels(2)
+        output.setsampwidth(2)
+        output.setframerate(SAMPLE_RATE)
+        output.writeframes(pcm.tobytes())
+
+
+def prepare_inputs(folder, count, duration, audio_format, ffmpeg_path):
+    """Generate count distinct input files in audio_format"""
+    paths = []
+    for index in range(count):
+        wav_path = os.path.join(folder, f'input_{index:03d}.wav')
+        generate_audio(wav_path, duration, index)
+        if audio_format != 'wav':
+            path = os.path.join(folder, f'input_{index:03d}.{audio_format}')
+            subprocess.run([ffmpeg_path, '-nostdin', '-y', '-i', wav_path, path],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            os.remove(wav_path)
+            wav_path = path
+        paths.append(wav_path)
+    return paths
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workdir, port, args):
+    """Start a copy of server.py in workdir with the fake separator first on PATH"""
+    shutil.copy(os.path.join(REPO_DIR, 'server.py'), workdir)
+    bin_dir = os.path.join(workdir, 'bin')
+    os.makedirs(bin_dir, exist_ok=True)
+    wrapper = os.path.join(bin_dir, 'audio-separator')
+    with open(wrapper, 'w') as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(BENCH_DIR, "fake_audio_separator.py")}" "$@"\n')
+    os.chmod(wrapper, 0o755)
+
+    env = os.environ.copy()
+    env['PATH'] = bin_dir + os.pathsep + env.get('PATH', '')
+    env['USE_SEPARATOR_WORKERS'] = 'false'
+    env['MODEL_FILE_DIR'] = os.path.join(workdir, 'models')
+    env['FAKE_SEPARATOR_RTF'] = str(args.rtf)
+    env['PYTHONUNBUFFERED'] = '1'
+    cmd = [sys.executable, 'server.py', '--port', str(port)]
+    if args.production:
+        cmd += ['--production', '--workers', str(args.workers)]
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+                               start_new_session=True)
+    return process, log
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def wait_until_ready(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            status, _, _, _, _ = request(base_url, 'GET', '/api/models')
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f'Server at {base_url} did not become ready within {timeout}s')
+
+
+def request(base_url, method, path, body=None, headers=None):
+    """Send one request; returns (status, headers, body, seconds to first byte, total seconds)"""
+    parts = urlsplit(base_url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=REQUEST_TIMEOUT)
+    try:
+        started = time.perf_counter()
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        first_byte = time.perf_counter() - started
+        data = response.read()
+        return response.status, dict(response.getheaders()), data, first_byte, time.perf_counter() - started
+    finally:
+        connection.close()
+
+
+def multipart(fields, files):
+    """Encode form fields and (name, filename, bytes) files as multipart/form-data"""
+    boundary = uuid.uuid4().hex
+    chunks = []
+    for name, value in fields.items():
+        chunks.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data in files:
+        chunks.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode()
+        )
+        chunks.append(data)
+        chunks.append(b'\r\n')
+    chunks.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(chunks), f'multipart/form-data; boundary={boundary}'
+
+
+class Recorder:
+    """Thread-safe collection of timings per operation"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.bytes = 0
+
+    def add(self, operation, seconds, first_byte=None, size=0):
+        with self.lock:
+            entry = self.samples.setdefault(operation, {'latency': [], 'ttfb': []})
+            entry['latency'].append(seconds)
+            if first_byte is not None:
+                entry['ttfb'].append(first_byte)
+            self.bytes += size
+
+    def error(self, operation, message):
+        with self.lock:
+            self.errors.setdefault(operation, []).append(message)
+
+    def summary(self):
+        with self.lock:
+            operations = {}
+            for operation, entry in sorted(self.samples.items()):
+                operations[operation] = {
+                    'count': len(entry['latency']),
+                    'errors': len(self.errors.get(operation, [])),
+                    'latency': describe(entry['latency']),
+                    'ttfb': describe(entry['ttfb'])
+                }
+            for operation, messages in self.errors.items():
+                operations.setdefault(operation, {'count': 0, 'errors': len(messages)})
+                operations[operation]['first_error'] = messages[0]
+            return operations
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+
+def describe(values):
+    if not values:
+        return None
+    return {
+        'p50': round(percentile(values, 0.5), 4),
+        'p99': round(percentile(values, 0.99), 4),
+        'mean': round(sum(values) / len(values), 4),
+        'max': round(max(values), 4)
+    }
+
+
+class ResourceSampler:
+    """Samples RSS, open file descriptors and child processes of the server's process tree via /proc"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.peaks = {'rss_bytes': 0, 'open_fds': 0, 'child_processes': 0}
+        self.available = os.path.isdir(f'/proc/{pid}')
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        if self.available:
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        return self.peaks if self.available else None
+
+    def _tree(self):
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The command name may contain spaces, so split after its closing parenthesis
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+        tree = [self.pid]
+        for pid in tree:
+            tree.extend(children.get(pid, []))
+        return tree
+
+    def _run(self):
+        while not self.stopped.wait(RESOURCE_SAMPLE_INTERVAL):
+            rss = fds = 0
+            tree = self._tree()
+            for pid in tree:
+                try:
+                    with open(f'/proc/{pid}/status') as f:
+                        for line in f:
+                            if line.startswith('VmRSS:'):
+                                rss += int(line.split()[1]) * 1024
+                    fds += len(os.listdir(f'/proc/{pid}/fd'))
+                except OSError:
+                    continue
+            self.peaks['rss_bytes'] = max(self.peaks['rss_bytes'], rss)
+            self.peaks['open_fds'] = max(self.peaks['open_fds'], fds)
+            self.peaks['child_processes'] = max(self.peaks['child_processes'], len(tree) - 1)
+
+
+def run_job(base_url, path, args, recorder):
+    """Separate one file and download its stems; returns True when everything succeeded"""
+    with open(path, 'rb') as f:
+        body, content_type = multipart({'model': 'htdemucs_ft.yaml', 'stems': args.stems},
+                                       [('file', os.path.basename(path), f.read())])
+    submitted = time.perf_counter()
+    while True:
+        status, headers, data, first_byte, seconds = request(
+            base_url, 'POST', '/api/separate', body, {'Content-Type': content_type}
+        )
+        if status != 429:
+            break
+        recorder.add('separate_rejected', seconds)
+        time.sleep(float(headers.get('Retry-After', '1')))
+    if status != 200:
+        recorder.error('separate', f'{status}: {data[:200]!r}')
+        return False
+    recorder.add('separate', seconds, first_byte)
+    job_id = json.loads(data)['job_id']
+
+    while True:
+        status, _, data, first_byte, seconds = request(base_url, 'GET', f'/api/progress/{job_id}')
+        if status != 200:
+            recorder.error('progress', f'{status}: {data[:200]!r}')
+            return False
+        recorder.add('progress', seconds, first_byte)
+        progress = json.loads(data)
+        if progress.get('complete'):
+            break
+        time.sleep(args.poll_interval)
+    if progress.get('error'):
+        recorder.error('job', progress['error'][-200:])
+        return False
+    recorder.add('job', time.perf_counter() - submitted)
+
+    status, _, data, first_byte, seconds = request(base_url, 'GET', f'/api/result/{job_id}')
+    if status != 200:
+        recorder.error('result', f'{status}: {data[:200]!r}')
+        return False
+    recorder.add('result', seconds, first_byte)
+
+    succeeded = True
+    for filename in json.loads(data).get('output_files', []):
+        for requested_format in [None] + args.formats:
+            operation = f'download_{requested_format}' if requested_format else 'download'
+            url = f'/api/download/{job_id}/{quote(filename)}'
+            if requested_format:
+                url += f'?format={requested_format}'
+            status, _, data, first_byte, seconds = request(base_url, 'GET', url)
+            if status != 200:
+                recorder.error(operation, f'{status}: {data[:200]!r}')
+                succeeded = False
+                continue
+            recorder.add(operation, seconds, first_byte, len(data))
+    return succeeded
+
+
+def compare(previous, current):
+    """Print p50/p99 latency and throughput changes between two reports"""
+    def change(old, new):
+        if not old or new is None:
+            return 'n/a'
+        return f'{(new - old) / old * 100:+.1f}%'
+
+    print(f"{'operation':<22}{'p50':>12}{'p99':>12}{'ttfb p50':>12}")
+    for operation, entry in current['operations'].items():
+        old = previous['operations'].get(operation, {})
+        row = [operation]
+        for key, field in [('latency', 'p50'), ('latency', 'p99'), ('ttfb', 'p50')]:
+            row.append(change((old.get(key) or {}).get(field), (entry.get(key) or {}).get(field)))
+        print(f'{row[0]:<22}{row[1]:>12}{row[2]:>12}{row[3]:>12}')
+    for key in ['jobs_per_second', 'download_bytes_per_second']:
+        print(f"{key:<34}{change(previous['throughput'][key], current['throughput'][key]):>12}")
+    for key in ['rss_bytes', 'open_fds', 'child_processes']:
+        old = (previous.get('resources') or {}).get(key)
+        new = (current.get('resources') or {}).get(key)
+        print(f"peak {key:<29}{change(old, new):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark server.py end to end with a fake separator')
+    parser.add_argument('--jobs', type=int, default=8, help='Separations to run')
+    parser.add_argument('--concurrency', type=int, default=4, help='Clients running jobs at the same time')
+    parser.add_argument('--duration', type=float, default=30, help='Length of each input in seconds')
+    parser.add_argument('--audio-format', default='wav', help='Format of the inputs (wav, or any FFmpeg can write)')
+    parser.add_argument('--same-audio', action='store_true', help='Upload the same file for every job (result cache hits)')
+    parser.add_argument('--formats', default='mp3', help='Comma-separated ?format= downloads besides the original stem')
+    parser.add_argument('--stems', default='all', help='stems option sent with every job')
+    parser.add_argument('--rtf', type=float, default=0.1, help='Fake separator compute seconds per audio second')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='Seconds between progress polls')
+    parser.add_argument('--production', action='store_true', help='Start the server in production mode')
+    parser.add_argument('--workers', type=int, default=2, help='HTTP workers in production mode')
+    parser.add_argument('--url', help='Benchmark an already running server instead of starting one')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+    parser.add_argument('--compare', help='Earlier JSON report to compare this run with')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch directory with the server log')
+    args = parser.parse_args()
+    args.formats = [f.strip() for f in args.formats.split(',') if f.strip()]
+
+    ffmpeg_path = shutil.which('ffmpeg')
+    if not ffmpeg_path:
+        sys.exit('FFmpeg is required to run the benchmark')
+
+    workdir = tempfile.mkdtemp(prefix='separator-bench-')
+    server = log = sampler = None
+    try:
+        audio_dir = os.path.join(workdir, 'audio')
+        os.makedirs(audio_dir)
+        inputs = prepare_inputs(audio_dir, 1 if args.same_audio else args.jobs, args.duration, args.audio_format, ffmpeg_path)
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            port = free_port()
+            base_url = f'http://127.0.0.1:{port}'
+            server, log = start_server(workdir, port, args)
+            wait_until_ready(base_url)
+            sampler = ResourceSampler(server.pid)
+            sampler.start()
+
+        recorder = Recorder()
+        started = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            futures = [executor.submit(run_job, base_url, inputs[index % len(inputs)], args, recorder)
+                       for index in range(args.jobs)]
+            completed = 0
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    completed += 1 if future.result() else 0
+                except Exception as e:
+                    recorder.error('client', str(e))
+        wall_seconds = time.perf_counter() - started
+
+        report = {
+            'config': {
+                'jobs': args.jobs,
+                'concurrency': args.concurrency,
+                'duration': args.duration,
+                'audio_format': args.audio_format,
+                'same_audio': args.same_audio,
+                'formats': args.formats,
+                'stems': args.stems,
+                'rtf': args.rtf,
+                'production': args.production,
+                'workers': args.workers if args.production else None,
+                'url': args.url
+            },
+            'wall_seconds': round(wall_seconds, 3),
+            'completed_jobs': completed,
+            'throughput': {
+                'jobs_per_second': round(completed / wall_seconds, 4),
+                'download_bytes_per_second': round(recorder.bytes / wall_seconds)
+            },
+            'operations': recorder.summary(),
+            'resources': sampler.stop() if sampler else None
+        }
+    finally:
+        if sampler:
+            sampler.stop()
+        if server:
+            stop_server(server)
+            log.close()
+        if args.keep:
+            print(f'Scratch directory kept at {workdir}', file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
 import os
+import sys
 import tempfile
 import subprocess
 import uuid
@@ -10,42 +11,237 @@ import json
 import threading
 import queue
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import ClosingIterator
 import argparse
 import io
-import select
+import multiprocessing
+import multiprocessing.connection
+import traceback
+import heapq
+import hashlib
+import re
+import concurrent.futures
+import zipfile
+import functools
+import bisect
+import contextlib
+import weakref
+import sqlite3
+import atexit
+import signal
+import asyncio
+import codecs
+import wave
+import urllib.parse
 import fcntl
+import math
+import numpy as np
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['Upload-Offset', 'Content-Disposition', 'Content-Range', 'Accept-Ranges', 'ETag'])
 
 # Configuration
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 OUTPUT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outputs')
+CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+RESULT_CACHE_FOLDER = os.path.join(CACHE_FOLDER, 'results')
+RENDITION_CACHE_FOLDER = os.path.join(CACHE_FOLDER, 'renditions')
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'ogg', 'flac', 'm4a'}
 
-# Dictionary to store progress information
+# Persistent separation workers (set USE_SEPARATOR_WORKERS=false to always use the CLI)
+USE_SEPARATOR_WORKERS = os.environ.get('USE_SEPARATOR_WORKERS', 'true').lower() == 'true'
+SEPARATOR_WORKERS = int(os.environ.get('SEPARATOR_WORKERS', '1'))
+SEPARATOR_OUTPUT_FORMAT = 'FLAC'
+SEPARATOR_WORKER_MAX_RESTARTS = 5
+
+# Stems the separation model writes. The stems option picks one of them (written alone),
+# or vocals plus an instrumental derived as the mix minus the vocals
+SEPARATOR_STEMS = ['Vocals', 'Drums', 'Bass', 'Other']
+RESIDUAL_STEMS = {'Vocals': 'Instrumental'}
+
+# Push-based progress: long-poll requests wait at most this long for a change,
+# and event streams send a keep-alive comment when nothing changed for this long
+PROGRESS_LONG_POLL_MAX_TIMEOUT = 60
+PROGRESS_STREAM_HEARTBEAT = 15
+
+# Job scheduling: how many separations run at once and how many may wait
+MAX_CONCURRENT_JOBS = int(os.environ.get('MAX_CONCURRENT_JOBS', '1'))
+MAX_QUEUED_JOBS = int(os.environ.get('MAX_QUEUED_JOBS', '20'))
+DEFAULT_JOB_DURATION_ESTIMATE = 60
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+
+# Cancellation: a cancelled job's processes get CANCEL_GRACE_SECONDS to exit before they are
+# killed, and jobs whose progress nobody polled for JOB_IDLE_CANCEL_SECONDS are cancelled
+# (0 disables that). Polls are recorded in the job queue at most every JOB_POLL_RECORD_INTERVAL.
+CANCEL_GRACE_SECONDS = 5
+JOB_IDLE_CANCEL_SECONDS = int(os.environ.get('JOB_IDLE_CANCEL_SECONDS', '0'))
+JOB_IDLE_CHECK_INTERVAL = 10
+JOB_POLL_RECORD_INTERVAL = 5
+
+# Separation subprocesses are owned by one asyncio supervisor thread, which reads their
+# output and stops any that runs longer than JOB_TIMEOUT_SECONDS (0 disables the limit)
+JOB_TIMEOUT_SECONDS = int(os.environ.get('JOB_TIMEOUT_SECONDS', str(6 * 3600)))
+LINE_END_PATTERN = re.compile(r'\r\n|\r|\n')
+
+# Progress parsing: tqdm bars audio-separator prints per model pass, and how many
+# passes each model makes over the audio (htdemucs_ft is a bag of four models)
+TQDM_PERCENT_PATTERN = re.compile(r'(\d{1,3})%\|')
+MODEL_PROGRESS_PASSES = {'htdemucs_ft.yaml': 4}
+MODEL_STATS_PATH = os.path.join(CACHE_FOLDER, 'model_stats.json')
+MODEL_SPEED_SMOOTHING = 0.3
+
+# Model registry: the configured MODELS are downloaded into MODEL_FILE_DIR and checksummed
+# at startup (MODEL_PREFETCH) and loaded by the persistent workers, which can warm each one
+# up with a short dummy separation (MODEL_WARMUP)
+MODELS = [m.strip() for m in os.environ.get('MODELS', 'htdemucs_ft.yaml').split(',') if m.strip()]
+MODEL_FILE_DIR = os.environ.get('MODEL_FILE_DIR', '/tmp/audio-separator-models/')
+MODEL_PREFETCH = os.environ.get('MODEL_PREFETCH', 'true').lower() == 'true'
+MODEL_WARMUP = os.environ.get('MODEL_WARMUP', 'false').lower() == 'true'
+MODEL_REGISTRY_PATH = os.path.join(CACHE_FOLDER, 'model_registry.json')
+MODEL_LIST_TIMEOUT = 120
+MODEL_DOWNLOAD_TIMEOUT = 1800
+MODEL_WARMUP_SECONDS = 2
+# Stems of models audio-separator's model list does not describe
+MODEL_STEMS = {'htdemucs_ft.yaml': SEPARATOR_STEMS}
+
+# Long-input mode: separate overlapping segments in parallel and crossfade them back
+# together. Requested with long_input=true, or automatic above LONG_INPUT_AUTO_SECONDS
+# (0 disables the automatic switch).
+LONG_INPUT_AUTO_SECONDS = float(os.environ.get('LONG_INPUT_AUTO_SECONDS', '1200'))
+SEGMENT_SECONDS = float(os.environ.get('SEGMENT_SECONDS', '300'))
+SEGMENT_OVERLAP_SECONDS = float(os.environ.get('SEGMENT_OVERLAP_SECONDS', '5'))
+SEGMENT_PARALLELISM = int(os.environ.get('SEGMENT_PARALLELISM', str(max(1, min(4, (os.cpu_count() or 2) // 2)))))
+SEGMENT_SAMPLE_RATE = 44100
+
+# Previews (preview=true on /api/separate): a PREVIEW_EXCERPT_SECONDS window starting
+# PREVIEW_EXCERPT_OFFSET seconds in is separated first, at high priority, and the full
+# track is queued behind it or held until the client starts it
+PREVIEW_EXCERPT_SECONDS = float(os.environ.get('PREVIEW_EXCERPT_SECONDS', '20'))
+PREVIEW_EXCERPT_OFFSET = float(os.environ.get('PREVIEW_EXCERPT_OFFSET', '30'))
+PREVIEW_EXCERPT_MAX_SECONDS = 60
+
+# Finished separations are reused for identical uploads until the cache exceeds this size
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(5 * 1024 ** 3)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Largest upload accepted, enforced while the data streams in (multipart and chunked)
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(1024 ** 3)))
+UPLOAD_SNIFF_BYTES = 16
+
+# Most tracks accepted in one batch; their combined size is limited by MAX_UPLOAD_BYTES
+MAX_BATCH_TRACKS = int(os.environ.get('MAX_BATCH_TRACKS', '50'))
+
+# Retention: job outputs expire after OUTPUT_TTL_SECONDS since their last download and are
+# evicted least recently used first above OUTPUT_QUOTA_BYTES (0 disables either rule)
+OUTPUT_TTL_SECONDS = int(os.environ.get('OUTPUT_TTL_SECONDS', str(7 * 24 * 3600)))
+OUTPUT_QUOTA_BYTES = int(os.environ.get('OUTPUT_QUOTA_BYTES', str(20 * 1024 ** 3)))
+PROGRESS_TTL_SECONDS = int(os.environ.get('PROGRESS_TTL_SECONDS', str(24 * 3600)))
+UPLOAD_TTL_SECONDS = int(os.environ.get('UPLOAD_TTL_SECONDS', str(24 * 3600)))
+RETENTION_INTERVAL_SECONDS = int(os.environ.get('RETENTION_INTERVAL_SECONDS', '300'))
+ERROR_TEXT_LIMIT = 4000
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# Download formats: FFmpeg encoder settings, container and MIME type of each
+FORMAT_ENCODER_ARGS = {
+    'mp3': ['-c:a', 'libmp3lame', '-q:a', '2'],
+    'aac': ['-c:a', 'aac', '-b:a', '256k'],
+    'wav': ['-c:a', 'pcm_s16le'],
+    'flac': ['-c:a', 'flac']
+}
+FORMAT_CONTAINERS = {'mp3': 'mp3', 'aac': 'adts', 'wav': 'wav', 'flac': 'flac'}
+FORMAT_MIMETYPES = {'mp3': 'audio/mpeg', 'aac': 'audio/aac', 'wav': 'audio/wav', 'flac': 'audio/flac'}
+
+# After separation each stem is decoded once into min/max waveform peaks at several
+# resolutions (audio frames per peak) and a low-bitrate AAC preview (STEM_ANALYSIS=false skips it)
+STEM_ANALYSIS = os.environ.get('STEM_ANALYSIS', 'true').lower() == 'true'
+PEAK_RESOLUTIONS = [256, 1024, 4096, 16384]
+PREVIEW_ENCODER_ARGS = ['-c:a', 'aac', '-b:a', os.environ.get('PREVIEW_BITRATE', '64k')]
+RENDITION_SETTINGS = dict(FORMAT_ENCODER_ARGS, preview=PREVIEW_ENCODER_ARGS, peaks=PEAK_RESOLUTIONS)
+# Short hash of each rendition's settings, part of its cache key and of its URL and ETag,
+# so changed encoder settings never serve new bytes under an old immutable URL
+RENDITION_SETTINGS_TAGS = {
+    name: hashlib.sha256(json.dumps(settings).encode('utf-8')).hexdigest()[:8]
+    for name, settings in RENDITION_SETTINGS.items()
+}
+
+# Each finished job gets a manifest describing its stems, which /api/result serves (revalidated
+# on every use). The content-addressed stem URLs it lists never change, so the stems may be
+# cached this long (seconds)
+MANIFEST_FILENAME = '.manifest.json'
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Lock file in each job directory that downloads hold shared and eviction takes exclusively
+DOWNLOAD_LOCK_FILENAME = '.downloading'
+
+# Remixes of a job's stems (/api/mix) are summed MIX_BLOCK_SECONDS at a time. Samples above
+# MIX_LIMIT_THRESHOLD are compressed smoothly towards full scale instead of clipping.
+MIX_BLOCK_SECONDS = 10
+MIX_LIMIT_THRESHOLD = 0.9
+MIX_MAX_GAIN = 4.0
+STEM_MARKER_PATTERN = re.compile(r'\(([^()]+)\)[^()]*$')
+
+# Transcoded downloads are kept on disk until the cache exceeds this size. Renditions used
+# in the last RENDITION_EVICT_GRACE_SECONDS are never evicted, so a hit can still be sent,
+# and temporary files older than RENDITION_TEMP_MAX_AGE are left by conversions that died.
+RENDITION_CACHE_MAX_BYTES = int(os.environ.get('RENDITION_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+RENDITION_EVICT_GRACE_SECONDS = 60
+RENDITION_TEMP_MAX_AGE = 3600
+
+# Optional eager encoding of every stem after separation, e.g. PRETRANSCODE_FORMATS=mp3,aac
+PRETRANSCODE_FORMATS = [f.strip().lower() for f in os.environ.get('PRETRANSCODE_FORMATS', '').split(',') if f.strip()]
+PRETRANSCODE_CONCURRENCY = int(os.environ.get('PRETRANSCODE_CONCURRENCY', '2'))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# ZIP downloads transcode stems in parallel; already-compressed formats are stored as-is
+ZIP_TRANSCODE_CONCURRENCY = int(os.environ.get('ZIP_TRANSCODE_CONCURRENCY', str(os.cpu_count() or 2)))
+ZIP_STORED_FORMATS = {'mp3', 'aac', 'flac'}
+
+# Job progress is shared through a job store so several server processes see the same
+# jobs and finished jobs survive a restart: 'sqlite' (WAL, default) or 'memory' (one process)
+JOB_STORE = os.environ.get('JOB_STORE', 'sqlite').lower()
+JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH', os.path.join(CACHE_FOLDER, 'jobs.sqlite3'))
+JOB_STORE_FLUSH_INTERVAL = float(os.environ.get('JOB_STORE_FLUSH_INTERVAL', '0.5'))
+JOB_STORE_POLL_INTERVAL = 0.5
+
+# Production serving (server.py --production): gunicorn worker processes with a thread
+# pool each for HTTP, and one separate job runner process for separation
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', str(min(4, os.cpu_count() or 1))))
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '32'))
+SERVER_KEEPALIVE_SECONDS = int(os.environ.get('SERVER_KEEPALIVE_SECONDS', '5'))
+JOB_RUNNER_POLL_INTERVAL = 0.2
+
+# /metrics histogram buckets in seconds; in production mode each process shares its
+# metrics through METRICS_FOLDER every METRICS_SHARE_INTERVAL seconds
+METRICS_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800]
+METRICS_FOLDER = os.path.join(CACHE_FOLDER, 'metrics')
+METRICS_SHARE_INTERVAL = 5
+
+# Progress of the jobs this process created; the job store has everyone's
 progress_data = {}
 
+# Every change to a job's progress bumps its version and wakes waiting streams
+progress_versions = {}
+progress_snapshots = {}
+progress_changed = threading.Condition()
+
 # Cache for model names
 cached_models = []
 
+# Werkzeug rejects larger request bodies with 413 before reading them
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + UPLOAD_CHUNK_SIZE
+
 # Create folders if they don't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+os.makedirs(RESULT_CACHE_FOLDER, exist_ok=True)
+os.makedirs(RENDITION_CACHE_FOLDER, exist_ok=True)
 
 def preload_models():
-    """Preload the list of available models on server startup"""
+    """Preload the list of configured models on server startup"""
     global cached_models
-    try:
-        print("Preloading model list...")
-        # Only return htdemucs_ft model
-        cached_models = ['htdemucs_ft.yaml']
-        print(f"Preloaded {len(cached_models)} models")
-    except Exception as e:
-        print(f"Error preloading models: {str(e)}")
-        # Set htdemucs_ft as fallback
-        cached_models = ['htdemucs_ft.yaml']
-    
+    print("Preloading model list...")
+    cached_models = list(MODELS)
+    print(f"Preloaded {len(cached_models)} models")
     return cached_models
 
 # Preload models on startup
@@ -54,6 +250,515 @@ preload_models()
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+class Metrics:
+    """Counters, gauges and histograms exposed in the Prometheus text format on /metrics.
+
+    An update takes one lock and changes one dict entry, so it is cheap enough for
+    the request and job paths. In production mode every process also writes its
+    values to METRICS_FOLDER every few seconds and /metrics adds them all up.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.kinds = {}
+        self.help = {}
+        self.values = {}
+        self.collectors = []
+        self.shared_folder = None
+
+    def describe(self, name, kind, help_text):
+        self.kinds[name] = kind
+        self.help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = value
+
+    def observe(self, name, value, **labels):
+        """Add one observation to a histogram"""
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(METRICS_BUCKETS, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # Per-bucket counts (the last one is +Inf), then sum and count
+                entry = self.values[key] = [0] * (len(METRICS_BUCKETS) + 1) + [0.0, 0]
+            entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+    def add_collector(self, collector):
+        """Register a function that sets gauges just before values are read"""
+        self.collectors.append(collector)
+
+    def snapshot(self):
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {str(e)}")
+        with self.lock:
+            return [[name, list(labels), value if not isinstance(value, list) else list(value)]
+                    for (name, labels), value in self.values.items()]
+
+    def share(self, folder):
+        """Write this process's values to folder periodically so /metrics can merge them"""
+        self.shared_folder = folder
+        os.makedirs(folder, exist_ok=True)
+        threading.Thread(target=self._write_shared, name='metrics-writer', daemon=True).start()
+
+    def _write_shared(self):
+        path = os.path.join(self.shared_folder, f'{os.getpid()}.json')
+        while True:
+            try:
+                temp_path = path + '.tmp'
+                with open(temp_path, 'w') as f:
+                    json.dump(self.snapshot(), f)
+                os.replace(temp_path, path)
+            except OSError as e:
+                print(f"Could not write metrics: {str(e)}")
+            time.sleep(METRICS_SHARE_INTERVAL)
+
+    def _shared_snapshots(self):
+        """Values written by the other live processes; files of dead processes are removed"""
+        snapshots = []
+        for name in os.listdir(self.shared_folder):
+            if not name.endswith('.json'):
+                continue
+            pid = int(name[:-len('.json')])
+            path = os.path.join(self.shared_folder, name)
+            if pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                os.remove(path)
+                continue
+            except PermissionError:
+                pass
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self):
+        """All processes' values in the Prometheus text exposition format"""
+        snapshots = [self.snapshot()]
+        if self.shared_folder:
+            snapshots.extend(self._shared_snapshots())
+        
+        merged = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot:
+                key = (name, tuple(tuple(label) for label in labels))
+                if isinstance(value, list):
+                    current = merged.setdefault(key, [0] * len(value))
+                    merged[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    merged[key] = merged.get(key, 0) + value
+        
+        # Hit ratios are derived after merging; per-process ratios cannot be added up
+        lookups = {}
+        for (name, labels), value in merged.items():
+            if name == 'separator_cache_requests_total':
+                labels = dict(labels)
+                counts = lookups.setdefault(labels['cache'], {})
+                counts[labels['result']] = counts.get(labels['result'], 0) + value
+        for cache, counts in lookups.items():
+            total = sum(counts.values())
+            merged[('separator_cache_hit_ratio', (('cache', cache),))] = round(counts.get('hit', 0) / total, 4)
+        
+        lines = []
+        for name in sorted({name for name, _ in merged}):
+            kind = self.kinds.get(name, 'untyped')
+            lines.append(f'# HELP {name} {self.help.get(name, name)}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (metric_name, labels), value in sorted(merged.items()):
+                if metric_name != name:
+                    continue
+                if kind != 'histogram':
+                    lines.append(f'{name}{format_metric_labels(labels)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(METRICS_BUCKETS + ['+Inf'], value):
+                    cumulative += count
+                    bucket_labels = format_metric_labels(labels + (('le', str(bound)),))
+                    lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+                lines.append(f'{name}_sum{format_metric_labels(labels)} {value[-2]}')
+                lines.append(f'{name}_count{format_metric_labels(labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_metric_labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+metrics = Metrics()
+metrics.describe('separator_jobs_queued', 'gauge', 'Jobs waiting for an execution slot')
+metrics.describe('separator_jobs_running', 'gauge', 'Jobs currently separating')
+metrics.describe('separator_jobs_total', 'counter', 'Separation requests by outcome')
+metrics.describe('separator_stage_seconds', 'histogram', 'Time spent in each stage of a job')
+metrics.describe('separator_transcode_seconds', 'histogram', 'Time to transcode one stem, by format and mode')
+metrics.describe('separator_bytes_served_total', 'counter', 'Response body bytes of downloads')
+metrics.describe('separator_cache_requests_total', 'counter', 'Result and rendition cache lookups by result')
+metrics.describe('separator_cache_hit_ratio', 'gauge', 'Share of cache lookups that were hits')
+metrics.describe('separator_ffmpeg_processes', 'gauge', 'FFmpeg and ffprobe processes currently running')
+metrics.describe('separator_ffmpeg_processes_started_total', 'counter', 'FFmpeg and ffprobe processes started, by purpose')
+
+# FFmpeg processes started with popen_ffmpeg, and run_ffmpeg calls in progress
+ffmpeg_processes = weakref.WeakSet()
+ffmpeg_runs = {'active': 0}
+
+def run_ffmpeg(purpose, cmd, **kwargs):
+    """subprocess.run an ffmpeg or ffprobe command, counted in the FFmpeg metrics"""
+    metrics.inc('separator_ffmpeg_processes_started_total', purpose=purpose)
+    with metrics.lock:
+        ffmpeg_runs['active'] += 1
+    try:
+        return subprocess.run(cmd, **kwargs)
+    finally:
+        with metrics.lock:
+            ffmpeg_runs['active'] -= 1
+
+def popen_ffmpeg(purpose, cmd, **kwargs):
+    """subprocess.Popen an ffmpeg command, counted in the FFmpeg metrics"""
+    process = subprocess.Popen(cmd, **kwargs)
+    metrics.inc('separator_ffmpeg_processes_started_total', purpose=purpose)
+    with metrics.lock:
+        ffmpeg_processes.add(process)
+    return process
+
+def collect_ffmpeg_metrics():
+    with metrics.lock:
+        processes = list(ffmpeg_processes)
+        active = ffmpeg_runs['active']
+    metrics.set('separator_ffmpeg_processes', active + sum(1 for process in processes if process.poll() is None))
+
+metrics.add_collector(collect_ffmpeg_metrics)
+
+
+class MemoryJobStore:
+    """Job store for a single server process: progress_data already holds every job"""
+
+    persistent = False
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.producers = {}
+
+    def save(self, rows):
+        pass
+
+    def delete(self, job_ids):
+        pass
+
+    def load(self, job_id):
+        return None
+
+    def load_unfinished(self):
+        return []
+
+    def purge_finished(self, before):
+        pass
+
+    def claim_producer(self, key, job_id):
+        with self.lock:
+            return self.producers.setdefault(key, job_id)
+
+    def replace_producer(self, key, old_job_id, job_id):
+        with self.lock:
+            if self.producers.get(key) != old_job_id:
+                return False
+            self.producers[key] = job_id
+            return True
+
+    def release_producer(self, key, job_id):
+        with self.lock:
+            if self.producers.get(key) == job_id:
+                del self.producers[key]
+
+
+class SQLiteJobStore:
+    """Job store shared by every server process through one SQLite database in WAL mode.
+
+    WAL lets other processes keep reading while a batch of progress is committed.
+    Each row holds a job's progress as JSON together with its version, so long-polls
+    and event streams served by another process see the same versions.
+    """
+
+    persistent = True
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, version INTEGER NOT NULL, '
+                'complete INTEGER NOT NULL, finished_at REAL, data TEXT NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (complete, finished_at)')
+            # The job producing each result cache key, so identical uploads attach to it
+            conn.execute('CREATE TABLE IF NOT EXISTS producers (cache_key TEXT PRIMARY KEY, job_id TEXT NOT NULL)')
+
+    def _connect(self):
+        """One connection per thread and process; sqlite3 connections must not be shared"""
+        conn = getattr(self.local, 'conn', None)
+        # A forked HTTP worker must not reuse a connection opened by its parent
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def save(self, rows):
+        """Write (job_id, version, fields) rows in one transaction"""
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO jobs (job_id, version, complete, finished_at, data) VALUES (?, ?, ?, ?, ?)',
+                [
+                    (job_id, version, int(bool(fields.get('complete'))), fields.get('finished_at'), json.dumps(fields))
+                    for job_id, version, fields in rows
+                ]
+            )
+
+    def delete(self, job_ids):
+        with self._connect() as conn:
+            conn.executemany('DELETE FROM jobs WHERE job_id = ?', [(job_id,) for job_id in job_ids])
+
+    def load(self, job_id):
+        """Return (version, fields) of a job, or None if the store has never seen it"""
+        row = self._connect().execute('SELECT version, data FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def load_unfinished(self):
+        rows = self._connect().execute('SELECT job_id, version, data FROM jobs WHERE complete = 0').fetchall()
+        return [(job_id, version, json.loads(data)) for job_id, version, data in rows]
+
+    def purge_finished(self, before):
+        """Delete jobs that finished before the given time"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM jobs WHERE complete = 1 AND finished_at < ?', (before,))
+
+    def claim_producer(self, key, job_id):
+        """Record job_id as the producer of a cache key unless one is recorded; returns the producer"""
+        with self._connect() as conn:
+            conn.execute('INSERT OR IGNORE INTO producers (cache_key, job_id) VALUES (?, ?)', (key, job_id))
+            return conn.execute('SELECT job_id FROM producers WHERE cache_key = ?', (key,)).fetchone()[0]
+
+    def replace_producer(self, key, old_job_id, job_id):
+        """Take over a cache key from a producer that is gone; False if another job got there first"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE producers SET job_id = ? WHERE cache_key = ? AND job_id = ?', (job_id, key, old_job_id)
+            )
+            return cursor.rowcount == 1
+
+    def release_producer(self, key, job_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM producers WHERE cache_key = ? AND job_id = ?', (key, job_id))
+
+
+def create_job_store():
+    if JOB_STORE == 'memory':
+        return MemoryJobStore()
+    if JOB_STORE == 'sqlite':
+        return SQLiteJobStore(JOB_STORE_PATH)
+    raise ValueError(f"Unknown JOB_STORE '{JOB_STORE}', expected 'sqlite' or 'memory'")
+
+job_store = create_job_store()
+
+# Progress changes are written to the job store in batches: new and finished jobs
+# right away, everything else every JOB_STORE_FLUSH_INTERVAL seconds
+progress_dirty = set()
+progress_deleted = set()
+progress_flush_lock = threading.Lock()
+progress_writer = None
+
+def flush_progress():
+    """Write pending progress changes to the job store in one transaction"""
+    # Serialized so an older batch can never be committed after a newer one
+    with progress_flush_lock:
+        with progress_changed:
+            rows = [
+                (job_id, progress_versions.get(job_id, 0), dict(progress_data[job_id]))
+                for job_id in progress_dirty if job_id in progress_data
+            ]
+            deleted = list(progress_deleted)
+            progress_dirty.clear()
+            progress_deleted.clear()
+        try:
+            if rows:
+                job_store.save(rows)
+            if deleted:
+                job_store.delete(deleted)
+        except Exception as e:
+            print(f"Error writing progress to the job store: {str(e)}")
+            with progress_changed:
+                progress_dirty.update(job_id for job_id, _, _ in rows if job_id not in progress_deleted)
+                progress_deleted.update(job_id for job_id in deleted if job_id not in progress_data)
+
+def write_progress_batches():
+    while True:
+        time.sleep(JOB_STORE_FLUSH_INTERVAL)
+        flush_progress()
+
+def start_progress_writer():
+    """Start the batch writer the first time this process changes a job (call with progress_changed held)"""
+    global progress_writer
+    if progress_writer is None:
+        progress_writer = threading.Thread(target=write_progress_batches, name='progress-writer', daemon=True)
+        progress_writer.start()
+        atexit.register(flush_progress)
+
+def recover_interrupted_jobs(keep=()):
+    """Mark jobs a previous run left queued or running as failed, except those in keep.
+
+    Full tracks waiting for confirmation after a preview keep waiting: their arguments are on disk.
+    """
+    interrupted = [
+        (job_id, version, fields) for job_id, version, fields in job_store.load_unfinished()
+        if job_id not in keep and not (fields.get('awaiting_confirmation') and os.path.exists(held_job_path(job_id)))
+    ]
+    for job_id, version, fields in interrupted:
+        fields.update(
+            status='Error: The server restarted before this job finished. Please try again.',
+            error='Interrupted by a server restart',
+            complete=True,
+            finished_at=time.time(),
+            queue_position=None,
+            estimated_start=None
+        )
+        job_store.save([(job_id, version + 1, fields)])
+    if interrupted:
+        print(f"Marked {len(interrupted)} interrupted jobs as failed")
+
+def update_progress(job_id, replace=False, **fields):
+    """Update a job's progress and notify listeners if anything changed"""
+    with progress_changed:
+        current = progress_data.get(job_id)
+        if replace or current is None:
+            progress_data[job_id] = dict(fields)
+        elif all(current.get(key) == value for key, value in fields.items()):
+            return
+        else:
+            current.update(fields)
+        progress_versions[job_id] = progress_versions.get(job_id, 0) + 1
+        progress_changed.notify_all()
+        
+        if not job_store.persistent:
+            return
+        progress_dirty.add(job_id)
+        progress_deleted.discard(job_id)
+        start_progress_writer()
+        # Other processes must see new jobs and final results without waiting for a batch
+        write_now = current is None or fields.get('complete')
+    if write_now:
+        flush_progress()
+
+def remove_progress(job_id):
+    """Forget a job's progress and wake anyone waiting on it"""
+    with progress_changed:
+        progress_data.pop(job_id, None)
+        progress_versions.pop(job_id, None)
+        progress_snapshots.pop(job_id, None)
+        progress_changed.notify_all()
+        if job_store.persistent:
+            progress_dirty.discard(job_id)
+            progress_deleted.add(job_id)
+            start_progress_writer()
+
+def adopt_progress(job_id):
+    """Take over a job another process created, so this process publishes its progress"""
+    stored = job_store.load(job_id)
+    if stored is None:
+        return
+    with progress_changed:
+        progress_versions[job_id], progress_data[job_id] = stored
+        progress_snapshots.pop(job_id, None)
+
+def hand_off_progress(job_id):
+    """Write a job's progress to the job store and drop this process's copy of it"""
+    flush_progress()
+    with progress_changed:
+        progress_data.pop(job_id, None)
+        progress_versions.pop(job_id, None)
+        progress_snapshots.pop(job_id, None)
+        progress_dirty.discard(job_id)
+
+def get_job(job_id):
+    """Return a copy of a job's progress from this process or the job store, or None"""
+    with progress_changed:
+        if job_id in progress_data:
+            return dict(progress_data[job_id])
+    stored = job_store.load(job_id)
+    return stored[1] if stored else None
+
+def get_progress_snapshot(job_id):
+    """Return (version, JSON text) of a job's progress, serialized once per version"""
+    with progress_changed:
+        if job_id in progress_data:
+            version = progress_versions.get(job_id, 0)
+            snapshot = progress_snapshots.get(job_id)
+            if snapshot is None or snapshot[0] != version:
+                payload = dict(progress_data[job_id])
+                payload['version'] = version
+                snapshot = (version, json.dumps(payload))
+                progress_snapshots[job_id] = snapshot
+            return snapshot
+    
+    # Jobs created by another server process are only in the job store
+    stored = job_store.load(job_id)
+    if stored is None:
+        return None, None
+    version, payload = stored
+    payload['version'] = version
+    return version, json.dumps(payload)
+
+def wait_for_progress(job_id, since, timeout):
+    """Block until a job's progress version is newer than since or timeout expires"""
+    deadline = time.time() + timeout
+    with progress_changed:
+        if job_id in progress_data:
+            while job_id in progress_data and progress_versions.get(job_id, 0) <= since:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                progress_changed.wait(remaining)
+            return get_progress_snapshot(job_id)
+    
+    # Nothing in this process is notified about other processes' jobs, so poll the store
+    while True:
+        version, snapshot = get_progress_snapshot(job_id)
+        remaining = deadline - time.time()
+        if version is None or version > since or remaining <= 0:
+            return version, snapshot
+        time.sleep(min(JOB_STORE_POLL_INTERVAL, remaining))
+
 def check_ffmpeg():
     """Check if FFmpeg is installed and accessible in PATH"""
     try:
@@ -77,8 +782,8 @@ def check_ffmpeg():
                     break
                     
         if ffmpeg_path:
-            result = subprocess.run([ffmpeg_path, '-version'], 
-                                  capture_output=True, text=True, check=True)
+            result = run_ffmpeg('version', [ffmpeg_path, '-version'],
+                                capture_output=True, text=True, check=True)
             return {
                 'installed': True,
                 'path': ffmpeg_path,
@@ -97,391 +802,4105 @@ def check_ffmpeg():
 
 @app.route('/api/models', methods=['GET'])
 def get_models():
-    """Get available models, using the cached list for faster responses"""
-    global cached_models
-    
-    # If we don't have cached models or force_refresh=true is in query params, fetch them
+    """Get the configured models with their registry details.
+
+    ?force_refresh=true asks audio-separator for its model list again, and
+    ?all=true describes every supported model instead of only the configured ones.
+    """
     force_refresh = request.args.get('force_refresh', 'false').lower() == 'true'
+    if force_refresh:
+        print("Refreshing model list...")
+        model_registry.list_supported()
     
-    if force_refresh or not cached_models:
-        # Refresh the cache
+    registry = model_registry.snapshot(include_all=request.args.get('all', 'false').lower() == 'true')
+    return jsonify({
+        'models': cached_models,
+        'details': registry['models'],
+        'listed_at': registry['listed_at'],
+        'list_error': registry['list_error'],
+        'cached': not force_refresh
+    })
+
+def save_upload_with_hash(file, filepath):
+    """Save an uploaded file while hashing it, returning (sha256 hex digest, size)"""
+    return save_stream_with_hash(file.stream, filepath)
+
+def save_stream_with_hash(stream, filepath, max_bytes=None):
+    """Copy a stream to filepath while hashing it, returning (sha256 hex digest, size).
+
+    Raises UploadError (413) once more than max_bytes have been read.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(filepath, 'wb') as out:
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_bytes is not None and size > max_bytes:
+                raise UploadError(f'Upload exceeds the maximum size of {MAX_UPLOAD_BYTES} bytes', 413)
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest(), size
+
+
+def link_or_copy(source, destination):
+    """Hard-link a file, copying it instead when linking is not possible"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class ResultCache:
+    """Content-addressed index of finished separations.
+
+    Entries are keyed by (upload hash, model, options) and hold hard links to
+    the stems, stored by the part of the filename that follows the input name
+    (e.g. "_(Vocals).flac"), so they can be re-linked into a new job directory
+    under the new job's input name.
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(folder, 'index.json')
+        self.lock_path = os.path.join(folder, '.index.lock')
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.index_version = None
+        with self._locked():
+            self._load()
+
+    @staticmethod
+    def make_key(content_hash, model, options):
+        payload = json.dumps({'hash': content_hash, 'model': model, 'options': options}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the index lock, shared by every thread and server process, with the index up to date"""
+        with self.lock, open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _index_version(self):
+        stat = os.stat(self.index_path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self):
         try:
-            print("Refreshing model cache...")
-            models = preload_models()
-            return jsonify({'models': models, 'cached': False})
-        except Exception as e:
-            print(f"Error refreshing model cache: {str(e)}")
-            if not cached_models:
-                # If we have no cached models and failed to fetch, use default models
-                default_models = [
-                    'UVR-MDX-NET-Inst_HQ_3.onnx',
-                    'UVR_MDXNET_KARA_2.onnx'
-                ]
-                return jsonify({'models': default_models, 'note': 'Using default models due to error', 'cached': False})
-    
-    # Return cached models
-    return jsonify({'models': cached_models, 'cached': True})
+            self.index_version = self._index_version()
+            with open(self.index_path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+        # Drop entries whose stems are no longer on disk
+        self.entries = {}
+        for key, entry in entries.items():
+            entry_dir = os.path.join(self.folder, key)
+            if all(os.path.isfile(os.path.join(entry_dir, suffix)) for suffix in entry['files']):
+                self.entries[key] = entry
 
-def process_audio_in_thread(job_id, filepath, model, job_dir, result_queue):
-    """Process audio in a separate thread and track progress"""
+    def _save(self):
+        """Write the index (call with the index lock held)"""
+        temp_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.index_path)
+        self.index_version = self._index_version()
+
+    def _refresh(self):
+        """Reload the index if another server process changed it (call with the index lock held)"""
+        try:
+            if self._index_version() != self.index_version:
+                self._load()
+        except OSError:
+            pass
+
+    def claim(self, key, job_id):
+        """Look up a key and register job_id as its producer on a miss.
+
+        Returns ('hit', None), ('inflight', other_job_id) or ('miss', None).
+        """
+        with self._locked():
+            if key in self.entries:
+                return 'hit', None
+        return self.claim_producer(key, job_id)
+
+    def claim_producer(self, key, job_id):
+        """Register job_id as the producer of a key unless another job is already producing it.
+
+        The producer is recorded in the job store, so identical uploads reaching
+        different server processes attach to the same job.
+        Returns ('inflight', other_job_id) or ('miss', None).
+        """
+        while True:
+            producer = job_store.claim_producer(key, job_id)
+            if producer == job_id:
+                return 'miss', None
+            # The producer may have ended without releasing the key, e.g. in a crashed process
+            progress = get_job(producer)
+            if progress is not None and not progress.get('complete'):
+                return 'inflight', producer
+            if job_store.replace_producer(key, producer, job_id):
+                return 'miss', None
+
+    def release(self, key, job_id):
+        """Forget the in-flight producer of a key"""
+        job_store.release_producer(key, job_id)
+
+    def materialize(self, key, job_dir, input_base):
+        """Link a cached result into job_dir and return the output filenames, or None if it was evicted"""
+        with self._locked():
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            entry['last_used'] = time.time()
+            output_files = []
+            for suffix in entry['files']:
+                output_name = f"{input_base}{suffix}"
+                link_or_copy(os.path.join(self.folder, key, suffix), os.path.join(job_dir, output_name))
+                output_files.append(output_name)
+            self._save()
+        return output_files
+
+    def store(self, key, job_dir, output_files, input_base):
+        """Record the stems of a finished job under key"""
+        entry_dir = os.path.join(self.folder, key)
+        temp_dir = f"{entry_dir}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(temp_dir)
+        files = []
+        total_bytes = 0
+        for output_name in output_files:
+            suffix = output_name[len(input_base):] if output_name.startswith(input_base) else f"_{output_name}"
+            link_or_copy(os.path.join(job_dir, output_name), os.path.join(temp_dir, suffix))
+            files.append(suffix)
+            total_bytes += os.path.getsize(os.path.join(temp_dir, suffix))
+
+        with self._locked():
+            if key in self.entries:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                return
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.rename(temp_dir, entry_dir)
+            self.entries[key] = {'files': files, 'bytes': total_bytes, 'last_used': time.time()}
+            self._evict()
+            self._save()
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        # Entry directories missing from the index would never be evicted
+        for name in os.listdir(self.folder):
+            if name not in self.entries and not name.endswith('.tmp') and os.path.isdir(os.path.join(self.folder, name)):
+                shutil.rmtree(os.path.join(self.folder, name), ignore_errors=True)
+        total_bytes = sum(entry['bytes'] for entry in self.entries.values())
+        for key in sorted(self.entries, key=lambda k: self.entries[k]['last_used']):
+            if total_bytes <= self.max_bytes:
+                break
+            total_bytes -= self.entries[key]['bytes']
+            del self.entries[key]
+            shutil.rmtree(os.path.join(self.folder, key), ignore_errors=True)
+            print(f"Evicted cached result {key}")
+
+
+result_cache = ResultCache(RESULT_CACHE_FOLDER, RESULT_CACHE_MAX_BYTES)
+
+class SeparatorWorkerUnavailable(Exception):
+    """Raised when no persistent separation worker can take a job"""
+
+
+class _WorkerOutput(io.TextIOBase):
+    """File-like object that forwards a worker's stdout/stderr lines to the server"""
+
+    def __init__(self, event_queue, stream_name):
+        self.event_queue = event_queue
+        self.stream_name = stream_name
+        self.job_id = None
+        self._buffer = ''
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self._buffer += text
+        # tqdm redraws its bar with carriage returns, so treat them as line ends too
+        while True:
+            positions = [p for p in (self._buffer.find('\n'), self._buffer.find('\r')) if p != -1]
+            if not positions:
+                break
+            end = min(positions)
+            line = self._buffer[:end]
+            self._buffer = self._buffer[end + 1:]
+            if line.strip() and self.job_id:
+                self.event_queue.put(('output', self.job_id, self.stream_name, line + '\n'))
+        return len(text)
+
+    def flush(self):
+        if self._buffer.strip() and self.job_id:
+            self.event_queue.put(('output', self.job_id, self.stream_name, self._buffer + '\n'))
+        self._buffer = ''
+
+
+class _WorkerEvents:
+    """Sends a worker's events to the server over the worker's own pipe, from any thread"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def put(self, event):
+        with self.lock:
+            self.conn.send(event)
+
+
+def process_rss_bytes():
+    """Resident memory of this process, or None where /proc is not available"""
     try:
-        # First check if FFmpeg is available
-        ffmpeg_status = check_ffmpeg()
-        if not ffmpeg_status['installed']:
-            raise Exception(f"FFmpeg is not installed or not in PATH: {ffmpeg_status['error']}")
-        
-        # Update progress to 10% - File uploaded and processing started
-        progress_data[job_id] = {
-            'progress': 10,
-            'status': 'Preparing audio file for processing...',
-            'complete': False,
-            'error': None
-        }
-        
-        # Clean the model name - extract just the filename part
-        if model:
-            model = model.split()[0].strip()  # Take just the first word
-        
-        print(f"Using model: {model}")
-        
-        # Run audio-separator with proper arguments
-        # The correct format is: audio-separator input.mp3 --output_dir=path
-        cmd = ['audio-separator', filepath]
-        
-        # Add output_dir parameter
-        cmd.append(f'--output_dir={job_dir}')
-        
-        # Add model parameter if specified
-        if model and model != 'default':
-            cmd.append(f'--model_filename={model}')
-        
-        print(f"Running command: {' '.join(cmd)}")
-        
-        # Create environment with FFMPEG_PATH set
-        env = os.environ.copy()
-        env['FFMPEG_PATH'] = ffmpeg_status['path']
-        print(f"Setting FFMPEG_PATH to {ffmpeg_status['path']}")
-        
-        # Start the process with the modified environment
-        process = subprocess.Popen(
-            cmd, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True,
-            env=env
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def write_warmup_audio(path):
+    """Write a short stereo WAV of quiet noise for warming up the models"""
+    samples = np.random.default_rng(0).normal(0, 0.01, size=(MODEL_WARMUP_SECONDS * SEGMENT_SAMPLE_RATE, 2))
+    with wave.open(path, 'wb') as output:
+        output.setnchannels(2)
+        output.setsampwidth(2)
+        output.setframerate(SEGMENT_SAMPLE_RATE)
+        output.writeframes((np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes())
+
+def separator_worker_main(worker_index, models, job_conn, event_conn, parent_pid):
+    """Entry point of a persistent separation worker process.
+
+    Loads every model once, then separates the jobs it receives on job_conn and
+    reports progress and results on event_conn. Both pipes belong to this worker
+    alone, so stopping it mid-job cannot leave other workers' channels broken.
+    """
+    import logging
+
+    event_queue = _WorkerEvents(event_conn)
+
+    stdout = _WorkerOutput(event_queue, 'stdout')
+    stderr = _WorkerOutput(event_queue, 'stderr')
+    sys.stdout = stdout
+    sys.stderr = stderr
+
+    try:
+        from audio_separator.separator import Separator
+    except Exception as e:
+        event_queue.put(('unavailable', worker_index, f"audio_separator is not importable: {str(e)}"))
+        return
+
+    # One Separator per model so switching models never reloads weights
+    separators = {}
+
+    def get_separator(model):
+        if model not in separators:
+            rss_before = process_rss_bytes()
+            load_started = time.time()
+            separator = Separator(
+                log_level=logging.INFO,
+                model_file_dir=MODEL_FILE_DIR,
+                output_dir=OUTPUT_FOLDER,
+                output_format=SEPARATOR_OUTPUT_FORMAT
+            )
+            separator.load_model(model_filename=model)
+            separators[model] = separator
+            rss_after = process_rss_bytes()
+            event_queue.put((
+                'loaded', worker_index, model, time.time() - load_started,
+                rss_after - rss_before if rss_before is not None and rss_after is not None else None
+            ))
+        return separators[model]
+
+    try:
+        for model in models:
+            get_separator(model)
+    except Exception as e:
+        event_queue.put(('unavailable', worker_index, f"Failed to load models: {str(e)}"))
+        return
+
+    # A first separation allocates buffers the later ones reuse, so pay for it before any job
+    if MODEL_WARMUP:
+        warmup_dir = tempfile.mkdtemp(prefix='warmup_', dir=UPLOAD_FOLDER)
+        try:
+            warmup_path = os.path.join(warmup_dir, 'warmup.wav')
+            write_warmup_audio(warmup_path)
+            for model in models:
+                separator = get_separator(model)
+                separator.output_dir = warmup_dir
+                separator.model_instance.output_dir = warmup_dir
+                warmup_started = time.time()
+                separator.separate(warmup_path)
+                event_queue.put(('warmed', worker_index, model, time.time() - warmup_started))
+        except Exception as e:
+            event_queue.put(('warmed', worker_index, None, f"Warm-up failed: {str(e)}"))
+        finally:
+            shutil.rmtree(warmup_dir, ignore_errors=True)
+
+    event_queue.put(('ready', worker_index))
+
+    while True:
+        try:
+            if not job_conn.poll(5):
+                # Exit if the server process went away without shutting us down
+                if os.getppid() != parent_pid:
+                    return
+                continue
+            job = job_conn.recv()
+        except (EOFError, OSError):
+            return
+
+        if job is None:
+            return
+
+        job_id = job['job_id']
+        stdout.job_id = job_id
+        stderr.job_id = job_id
+        try:
+            if job.get('ffmpeg_path'):
+                os.environ['FFMPEG_PATH'] = job['ffmpeg_path']
+
+            separator = get_separator(job['model'])
+            separator.output_dir = job['job_dir']
+            separator.model_instance.output_dir = job['job_dir']
+            separator.output_single_stem = job.get('single_stem')
+            separator.model_instance.output_single_stem = job.get('single_stem')
+
+            print(f"Processing {job['filepath']}")
+            output_files = separator.separate(job['filepath'])
+            stdout.flush()
+            stderr.flush()
+            event_queue.put(('done', job_id, [os.path.basename(f) for f in output_files]))
+        except Exception as e:
+            stdout.flush()
+            stderr.flush()
+            event_queue.put(('failed', job_id, f"{str(e)}\n{traceback.format_exc()}"))
+        finally:
+            stdout.job_id = None
+            stderr.job_id = None
+
+
+class SeparatorWorkerPool:
+    """Pool of long-lived processes that keep separation models loaded between jobs.
+
+    Every worker has its own job and event pipes, and the pool hands each idle
+    worker the next waiting job, so a worker can be terminated to cancel its
+    job without corrupting a channel the other workers share.
+    """
+
+    def __init__(self, size):
+        self.size = max(1, size)
+        self.lock = threading.Lock()
+        self.context = multiprocessing.get_context('spawn')
+        self.processes = {}
+        self.job_conns = {}
+        self.event_conns = {}
+        self.pending_jobs = []
+        self.ready_workers = set()
+        self.running_jobs = {}
+        self.job_events = {}
+        self.started = False
+        self.disabled_reason = None
+        self.models = []
+        self.restarts = 0
+        self.cancelled_workers = set()
+
+    def start(self, models):
+        """Spawn the worker processes (idempotent)"""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            self.models = list(models)
+            for worker_index in range(self.size):
+                self._spawn(worker_index)
+
+        listener = threading.Thread(target=self._listen, daemon=True)
+        listener.start()
+        print(f"Started {self.size} separation worker(s) for models: {', '.join(self.models)}")
+
+    def _spawn(self, worker_index):
+        job_receiver, job_sender = self.context.Pipe(duplex=False)
+        event_receiver, event_sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(
+            target=separator_worker_main,
+            args=(worker_index, self.models, job_receiver, event_sender, os.getpid()),
+            daemon=True
         )
-        
-        # Update progress to 20% - Separation process started
-        progress_data[job_id]['progress'] = 20
-        progress_data[job_id]['status'] = 'Initializing audio separation...'
-        
-        # Read output line by line to estimate progress
-        start_time = time.time()
-        output_lines = []
-        error_lines = []
-        
-        # Create non-blocking readers for stdout and stderr
-
-        # Make stdout and stderr non-blocking
-        for pipe in [process.stdout, process.stderr]:
-            fd = pipe.fileno()
-            fl = fcntl.fcntl(fd, fcntl.F_GETFL)
-            fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
-
-        # Set up polling object to monitor both pipes
-        poll = select.poll()
-        poll.register(process.stdout, select.POLLIN)
-        poll.register(process.stderr, select.POLLIN)
-
-        active_pipes = 2  # stdout and stderr
-        last_progress_update = time.time()
-
-        while active_pipes > 0 and process.poll() is None:
-            # Check available data every 0.5 seconds
-            for fd, event in poll.poll(500):
-                # Data to read
-                if event & select.POLLIN:
-                    if fd == process.stdout.fileno():
-                        try:
-                            line = process.stdout.readline()
-                            if line:
-                                output_lines.append(line)
-                                print(f"Stdout: {line.strip()}")
-                                
-                                # Look for progress indicators in the output
-                                if "Loading model" in line or "load model" in line.lower():
-                                    progress_data[job_id]['status'] = 'Loading audio separation model...'
-                                elif "Processing" in line or "separating" in line.lower():
-                                    progress_data[job_id]['status'] = 'Processing audio tracks...'
-                                elif "Saving" in line or "writing" in line.lower() or "output" in line.lower():
-                                    progress_data[job_id]['status'] = 'Saving separated tracks...'
-                                elif "Converting" in line or "convert" in line.lower():
-                                    progress_data[job_id]['status'] = 'Converting audio format...'
-                                elif "Enhancing" in line or "enhance" in line.lower() or "filter" in line.lower():
-                                    progress_data[job_id]['status'] = 'Enhancing audio quality...'
-                            else:
-                                poll.unregister(process.stdout)
-                                active_pipes -= 1
-                        except Exception as e:
-                            print(f"Error reading stdout: {e}")
-                    
-                    elif fd == process.stderr.fileno():
-                        try:
-                            line = process.stderr.readline()
-                            if line:
-                                error_lines.append(line)
-                                print(f"Stderr: {line.strip()}")
-                            else:
-                                poll.unregister(process.stderr)
-                                active_pipes -= 1
-                        except Exception as e:
-                            print(f"Error reading stderr: {e}")
-                
-                # Handle errors
-                elif event & (select.POLLERR | select.POLLHUP):
-                    if fd == process.stdout.fileno():
-                        poll.unregister(process.stdout)
-                        active_pipes -= 1
-                    elif fd == process.stderr.fileno():
-                        poll.unregister(process.stderr)
-                        active_pipes -= 1
-            
-            # Update progress at most once per second based on elapsed time
-            current_time = time.time()
-            if current_time - last_progress_update >= 1.0:
-                elapsed_time = current_time - start_time
-                # Estimate progress: 20% at start, up to 90% based on elapsed time
-                # Use a better estimation curve to prevent getting stuck
-                if elapsed_time < 10:
-                    # First 10 seconds: move from 20% to 30%
-                    estimated_progress = 20 + (elapsed_time / 10) * 10
-                    status_message = 'Loading audio models...'
-                elif elapsed_time < 30:
-                    # Next 20 seconds: move from 30% to 60%
-                    estimated_progress = 30 + ((elapsed_time - 10) / 20) * 30
-                    status_message = 'Processing audio tracks...'
-                else:
-                    # Beyond 30 seconds: move from 60% to 90%
-                    estimated_progress = 60 + min((elapsed_time - 30) / 30, 1) * 30
-                    if estimated_progress < 75:
-                        status_message = 'Applying advanced separation algorithms...'
-                    else:
-                        status_message = 'Finalizing separated tracks...'
-                
-                # Ensure progress is always moving forward
-                current_progress = progress_data[job_id]['progress']
-                if estimated_progress > current_progress:
-                    progress_data[job_id]['progress'] = int(estimated_progress)
-                    
-                # Update status message if no specific message from output
-                if progress_data[job_id]['status'] == 'Initializing audio separation...' or progress_data[job_id]['status'] == 'Processing audio...':
-                    progress_data[job_id]['status'] = status_message
-                    
-                last_progress_update = current_time
-        
-        # Read any remaining output
-        try:
-            remaining_stdout, remaining_stderr = process.communicate(timeout=10)
-            if remaining_stdout:
-                output_lines.append(remaining_stdout)
-            if remaining_stderr:
-                error_lines.append(remaining_stderr)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            remaining_stdout, remaining_stderr = process.communicate()
-            if remaining_stdout:
-                output_lines.append(remaining_stdout)
-            if remaining_stderr:
-                error_lines.append(remaining_stderr)
-        
-        # Wait for the process to complete
-        exit_code = process.wait()
-        
-        # Check if process was successful
-        if exit_code == 0:
-            # Get output files
-            output_files = []
-            for f in os.listdir(job_dir):
-                if os.path.isfile(os.path.join(job_dir, f)):
-                    # Remove "htdemucs_ft" from the filename if present
-                    clean_filename = f.replace("htdemucs_ft_", "").replace("_htdemucs_ft", "")
-                    clean_filename = clean_filename.replace("htdemucs_ft.", ".")
-                    clean_filename = clean_filename.replace("htdemucs_ft", "")
-                    
-                    # If the filename changed, rename the file
-                    if clean_filename != f:
-                        os.rename(
-                            os.path.join(job_dir, f),
-                            os.path.join(job_dir, clean_filename)
-                        )
-                        output_files.append(clean_filename)
-                    else:
-                        output_files.append(f)
-            
-            # Update progress to 100% - Complete
-            progress_data[job_id]['progress'] = 100
-            progress_data[job_id]['status'] = 'Separation completed successfully!'
-            progress_data[job_id]['complete'] = True
-            
-            print(f"Separation complete. Output files: {output_files}")
-            result_queue.put({
-                'job_id': job_id,
-                'success': True,
-                'message': 'Separation completed successfully',
-                'output_files': output_files,
-                'stdout': ''.join(output_lines)
-            })
-        else:
-            error_message = ''.join(error_lines)
-            print(f"Error during separation: {error_message}")
-            
-            # Update progress with error
-            progress_data[job_id]['progress'] = 0
-            progress_data[job_id]['status'] = 'Error: Separation process failed. Please check logs for details.'
-            progress_data[job_id]['error'] = error_message
-            progress_data[job_id]['complete'] = True
-            
-            result_queue.put({
+        process.start()
+        # The worker holds the other ends; closing ours lets a dead worker's pipe report EOF
+        job_receiver.close()
+        event_sender.close()
+        self.processes[worker_index] = process
+        self.job_conns[worker_index] = job_sender
+        self.event_conns[worker_index] = event_receiver
+
+    def _close_pipes(self, worker_index):
+        for conns in (self.job_conns, self.event_conns):
+            conn = conns.pop(worker_index, None)
+            if conn is not None:
+                conn.close()
+
+    def is_available(self):
+        return self.started and self.disabled_reason is None and len(self.ready_workers) > 0
+
+    def submit(self, job_id, filepath, model, job_dir, ffmpeg_path=None, single_stem=None):
+        """Queue a job on the pool and return a queue that receives its events"""
+        with self.lock:
+            if not self.is_available():
+                raise SeparatorWorkerUnavailable(self.disabled_reason or 'No separation worker is ready')
+            if model not in self.models:
+                raise SeparatorWorkerUnavailable(f"Model {model} is not loaded in the worker pool")
+            events = queue.Queue()
+            self.job_events[job_id] = events
+            self.pending_jobs.append({
                 'job_id': job_id,
-                'success': False,
-                'error': f"Error during separation: return code {exit_code}",
-                'stderr': error_message
+                'filepath': filepath,
+                'model': model,
+                'job_dir': job_dir,
+                'ffmpeg_path': ffmpeg_path,
+                'single_stem': single_stem
             })
-    except Exception as e:
-        print(f"Unexpected error in process_audio_in_thread: {str(e)}")
-        
-        # Update progress with error
-        progress_data[job_id]['progress'] = 0
-        progress_data[job_id]['status'] = 'Error: Unexpected issue occurred during processing.'
-        progress_data[job_id]['error'] = str(e)
-        progress_data[job_id]['complete'] = True
-        
-        result_queue.put({
-            'job_id': job_id,
-            'success': False,
-            'error': f"Unexpected error: {str(e)}"
+            self._dispatch()
+        return events
+
+    def _dispatch(self):
+        """Hand waiting jobs to idle workers (call with the lock held)"""
+        for worker_index in sorted(self.ready_workers):
+            if not self.pending_jobs:
+                return
+            if worker_index in self.running_jobs or worker_index in self.cancelled_workers:
+                continue
+            job = self.pending_jobs.pop(0)
+            try:
+                self.job_conns[worker_index].send(job)
+            except (OSError, KeyError):
+                # The worker is gone; the reaper replaces it
+                self.pending_jobs.insert(0, job)
+                self.ready_workers.discard(worker_index)
+                continue
+            self.running_jobs[worker_index] = job['job_id']
+
+    def cancel(self, job_id):
+        """Stop a job submitted to the pool. The worker running it is terminated and replaced.
+
+        Returns False if the pool does not have the job.
+        """
+        with self.lock:
+            if job_id not in self.job_events:
+                return False
+            waiting = [job for job in self.pending_jobs if job['job_id'] == job_id]
+            if waiting:
+                self.pending_jobs.remove(waiting[0])
+            worker_index = next((index for index, running in self.running_jobs.items() if running == job_id), None)
+            if worker_index is not None:
+                self.cancelled_workers.add(worker_index)
+                self.ready_workers.discard(worker_index)
+                self.processes[worker_index].terminate()
+        self._deliver(job_id, ('failed', job_id, 'Job was cancelled'))
+        return True
+
+    def _deliver(self, job_id, event):
+        with self.lock:
+            events = self.job_events.get(job_id)
+            if event[0] in ('done', 'failed'):
+                self.job_events.pop(job_id, None)
+        if events is not None:
+            events.put(event)
+
+    def _listen(self):
+        """Route worker events to the jobs waiting on them and replace dead workers"""
+        while True:
+            with self.lock:
+                conns = {conn: worker_index for worker_index, conn in self.event_conns.items()}
+            for conn in multiprocessing.connection.wait(list(conns), timeout=1):
+                worker_index = conns[conn]
+                try:
+                    event = conn.recv()
+                except (EOFError, OSError):
+                    # The worker died, possibly mid-message; the reaper replaces it and its pipes
+                    with self.lock:
+                        self.ready_workers.discard(worker_index)
+                        if self.event_conns.get(worker_index) is conn:
+                            del self.event_conns[worker_index]
+                    conn.close()
+                    continue
+                self._handle_event(worker_index, event)
+            self._reap_dead_workers()
+
+    def _handle_event(self, worker_index, event):
+        kind = event[0]
+        if kind == 'ready':
+            with self.lock:
+                self.ready_workers.add(event[1])
+                self._dispatch()
+            print(f"Separation worker {event[1]} is ready")
+        elif kind == 'loaded':
+            _, worker_index, model, load_seconds, memory_bytes = event
+            print(f"Separation worker {worker_index} loaded {model} in {load_seconds:.1f}s")
+            model_registry.record(model, load_seconds=round(load_seconds, 2), memory_bytes=memory_bytes)
+        elif kind == 'warmed':
+            _, worker_index, model, result = event
+            if model is None:
+                print(f"Separation worker {worker_index}: {result}")
+            else:
+                print(f"Separation worker {worker_index} warmed up {model} in {result:.1f}s")
+                model_registry.record(model, warmup_seconds=round(result, 2))
+        elif kind == 'unavailable':
+            print(f"Separation worker {event[1]} unavailable: {event[2]}")
+            with self.lock:
+                self.ready_workers.discard(event[1])
+                self.disabled_reason = event[2]
+        elif kind in ('done', 'failed'):
+            with self.lock:
+                if self.running_jobs.get(worker_index) == event[1]:
+                    del self.running_jobs[worker_index]
+                self._dispatch()
+            self._deliver(event[1], event)
+        elif kind == 'output':
+            self._deliver(event[1], event)
+
+    def _reap_dead_workers(self):
+        for worker_index, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            with self.lock:
+                self.ready_workers.discard(worker_index)
+                self._close_pipes(worker_index)
+                job_id = self.running_jobs.pop(worker_index, None)
+                # Workers stopped to cancel a job do not count as crashes
+                cancelled = worker_index in self.cancelled_workers
+                self.cancelled_workers.discard(worker_index)
+                if not cancelled and self.disabled_reason is None and self.restarts >= SEPARATOR_WORKER_MAX_RESTARTS:
+                    self.disabled_reason = f"Separation workers restarted {self.restarts} times, using the CLI instead"
+                respawn = self.disabled_reason is None
+                if respawn and not cancelled:
+                    self.restarts += 1
+                if not respawn:
+                    # No worker will take the jobs still waiting
+                    waiting, self.pending_jobs = self.pending_jobs, []
+                else:
+                    waiting = []
+            if job_id:
+                self._deliver(job_id, ('failed', job_id, f"Separation worker {worker_index} exited with code {process.exitcode}"))
+            for job in waiting:
+                self._deliver(job['job_id'], ('failed', job['job_id'], self.disabled_reason))
+            if cancelled and respawn:
+                print(f"Separation worker {worker_index} stopped to cancel a job, restarting it")
+                with self.lock:
+                    self._spawn(worker_index)
+            elif respawn:
+                print(f"Separation worker {worker_index} exited with code {process.exitcode}, restarting it")
+                with self.lock:
+                    self._spawn(worker_index)
+            else:
+                del self.processes[worker_index]
+
+
+separator_pool = SeparatorWorkerPool(SEPARATOR_WORKERS)
+
+
+def start_separator_pool():
+    """List and prefetch the models, then start the persistent workers if they are enabled.
+
+    Runs in the background; until the workers are ready jobs use the CLI.
+    """
+    def start():
+        model_registry.prepare()
+        if USE_SEPARATOR_WORKERS:
+            separator_pool.start(cached_models)
+    
+    threading.Thread(target=start, name='model-prefetch', daemon=True).start()
+
+
+class SchedulerQueueFull(Exception):
+    """Raised when the job queue has no room for another job"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SchedulerUnavailable(Exception):
+    """Raised when the scheduler is not accepting jobs"""
+
+
+class JobScheduler:
+    """Runs separation jobs with a fixed concurrency limit and a bounded priority queue"""
+
+    def __init__(self, max_concurrent, max_queued):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max(0, max_queued)
+        self.condition = threading.Condition()
+        self.queue = []
+        self.sequence = 0
+        self.running = {}
+        self.average_duration = DEFAULT_JOB_DURATION_ESTIMATE
+        self.accepting = True
+        self.threads = []
+
+    def _ensure_started(self):
+        if self.threads:
+            return
+        for index in range(self.max_concurrent):
+            thread = threading.Thread(target=self._run, name=f'job-scheduler-{index}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def has_capacity(self):
+        with self.condition:
+            return self.accepting and len(self.queue) < self.max_queued + self._free_slots()
+
+    def _free_slots(self):
+        return self.max_concurrent - len(self.running)
+
+    def submit(self, job_id, target, args, priority=PRIORITY_NORMAL):
+        """Queue a job. Lower priority values run first, ties run in FIFO order."""
+        with self.condition:
+            if not self.accepting:
+                raise SchedulerUnavailable('Server is not accepting new jobs')
+            if len(self.queue) >= self.max_queued + self._free_slots():
+                raise SchedulerQueueFull(
+                    f'Job queue is full ({self.max_queued} jobs waiting)',
+                    retry_after=int(self._slot_free_times()[0]) + 1
+                )
+            self._ensure_started()
+            self.sequence += 1
+            heapq.heappush(self.queue, (priority, self.sequence, job_id, target, args))
+            self._publish_queue_positions()
+            self.condition.notify()
+
+    def cancel(self, job_id):
+        """Take a job off the queue before it starts; returns its (target, args), or None if it is not queued"""
+        with self.condition:
+            for index, (_, _, queued_job_id, target, args) in enumerate(self.queue):
+                if queued_job_id == job_id:
+                    self.queue.pop(index)
+                    heapq.heapify(self.queue)
+                    self._publish_queue_positions()
+                    return target, args
+        return None
+
+    def rejection_error(self):
+        """Exception describing why a new job cannot be admitted right now"""
+        with self.condition:
+            if not self.accepting:
+                return SchedulerUnavailable('Server is not accepting new jobs')
+            return SchedulerQueueFull(
+                f'Job queue is full ({len(self.queue)} jobs waiting)',
+                retry_after=int(self._slot_free_times()[0]) + 1
+            )
+
+    def shutdown(self):
+        """Stop accepting new jobs; queued and running jobs still complete"""
+        with self.condition:
+            self.accepting = False
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                _, _, job_id, target, args = heapq.heappop(self.queue)
+                self.running[job_id] = time.time()
+                self._publish_queue_positions()
+            
+            if job_id in progress_data:
+                update_progress(job_id, queue_position=0, estimated_start=0, status='Starting separation...')
+
+            try:
+                target(*args)
+            except Exception as e:
+                print(f"Scheduled job {job_id} raised: {str(e)}")
+            finally:
+                with self.condition:
+                    started = self.running.pop(job_id, time.time())
+                    # Exponential moving average of job wall time for start estimates
+                    duration = time.time() - started
+                    self.average_duration = 0.8 * self.average_duration + 0.2 * duration
+                    self._publish_queue_positions()
+
+    def _slot_free_times(self):
+        """Seconds from now until each execution slot frees up, soonest first"""
+        now = time.time()
+        free_times = [max(self.average_duration - (now - started), 0) for started in self.running.values()]
+        free_times.extend([0] * self._free_slots())
+        return sorted(free_times)
+
+    def _publish_queue_positions(self):
+        """Write queue position and estimated start into each queued job's progress"""
+        free_times = self._slot_free_times()
+        for position, (_, _, job_id, _, _) in enumerate(sorted(self.queue), start=1):
+            # Each job ahead takes the soonest free slot for one average job duration
+            soonest = heapq.heappop(free_times)
+            heapq.heappush(free_times, soonest + self.average_duration)
+            if job_id in progress_data:
+                update_progress(
+                    job_id,
+                    queue_position=position,
+                    estimated_start=int(soonest),
+                    status=f'Waiting in queue (position {position})'
+                )
+
+    def stats(self):
+        with self.condition:
+            return {
+                'running': len(self.running),
+                'queued': len(self.queue),
+                'max_concurrent': self.max_concurrent,
+                'max_queued': self.max_queued
+            }
+
+
+job_scheduler = JobScheduler(MAX_CONCURRENT_JOBS, MAX_QUEUED_JOBS)
+
+def collect_scheduler_metrics():
+    stats = job_scheduler.stats()
+    metrics.set('separator_jobs_queued', stats['queued'])
+    metrics.set('separator_jobs_running', stats['running'])
+
+metrics.add_collector(collect_scheduler_metrics)
+
+class JobCancelled(Exception):
+    """Raised inside a job that has been cancelled"""
+
+
+def terminate_process_group(process):
+    """SIGTERM a process started in its own session and everything it spawned, SIGKILL them after a grace period"""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        return
+    
+    def kill():
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    
+    timer = threading.Timer(CANCEL_GRACE_SECONDS, kill)
+    timer.daemon = True
+    timer.start()
+
+
+class ActiveJobs:
+    """Jobs queued or running in this process and the processes they started, so they can be cancelled.
+
+    A batch owns the progress entries of its tracks: cancelling, polling or
+    checking a track's id acts on the batch.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.owners = {}
+
+    def register(self, job_id, progress_ids=()):
+        with self.lock:
+            self.jobs[job_id] = {
+                'reason': None,
+                'processes': set(),
+                'last_polled': time.time(),
+                'progress_ids': [progress_id for progress_id in progress_ids if progress_id != job_id]
+            }
+            for progress_id in self.jobs[job_id]['progress_ids']:
+                self.owners[progress_id] = job_id
+
+    def unregister(self, job_id):
+        with self.lock:
+            job = self.jobs.pop(job_id, None)
+            for progress_id in (job or {}).get('progress_ids', []):
+                self.owners.pop(progress_id, None)
+
+    def _get(self, job_id):
+        return self.jobs.get(self.owners.get(job_id, job_id))
+
+    def attach(self, job_id, process):
+        """Record a process started for a job; it is stopped if the job is cancelled"""
+        with self.lock:
+            job = self._get(job_id)
+            if job is not None:
+                job['processes'].add(process)
+                if job['reason'] is None:
+                    return
+        # Cancelled while the process was starting
+        if job is not None:
+            terminate_process_group(process)
+
+    def detach(self, job_id, process):
+        with self.lock:
+            job = self._get(job_id)
+            if job is not None:
+                job['processes'].discard(process)
+
+    def touch(self, job_id):
+        """Note that someone is still following a job's progress"""
+        with self.lock:
+            job = self._get(job_id)
+            if job is not None:
+                job['last_polled'] = time.time()
+
+    def cancelled(self, job_id):
+        """The reason a job was cancelled, or None"""
+        with self.lock:
+            job = self._get(job_id)
+            return job['reason'] if job is not None else None
+
+    def check(self, job_id):
+        """Raise JobCancelled if the job has been cancelled"""
+        reason = self.cancelled(job_id)
+        if reason is not None:
+            raise JobCancelled(reason)
+
+    def cancel(self, job_id, reason):
+        """Mark a job cancelled and stop its processes; returns False if it is not active here"""
+        with self.lock:
+            owner = self.owners.get(job_id, job_id)
+            job = self.jobs.get(owner)
+            if job is None:
+                return False
+            if job['reason'] is None:
+                job['reason'] = reason
+            processes = list(job['processes'])
+            pool_job_ids = [owner] + job['progress_ids']
+        for process in processes:
+            terminate_process_group(process)
+        for pool_job_id in pool_job_ids:
+            separator_pool.cancel(pool_job_id)
+        return True
+
+    def idle(self, seconds):
+        """Ids of the jobs nobody has polled for the given number of seconds"""
+        cutoff = time.time() - seconds
+        with self.lock:
+            return [job_id for job_id, job in self.jobs.items() if job['reason'] is None and job['last_polled'] < cutoff]
+
+    def stop_processes(self):
+        """Stop every process the jobs started, which run in sessions of their own"""
+        with self.lock:
+            processes = [process for job in self.jobs.values() for process in job['processes']]
+        for process in processes:
+            if process.returncode is None:
+                try:
+                    os.killpg(process.pid, signal.SIGTERM)
+                except (ProcessLookupError, PermissionError):
+                    pass
+
+
+active_jobs = ActiveJobs()
+atexit.register(active_jobs.stop_processes)
+
+
+class ProcessSupervisor:
+    """Runs every separation subprocess on one asyncio event loop in a background thread.
+
+    The loop reads each process's output line by line and enforces its timeout,
+    so the number of threads stays the same however many jobs are running.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loop = None
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                # Before Python 3.12 asyncio waits for each child in a thread of its own; a pidfd avoids that
+                if sys.version_info < (3, 12) and hasattr(os, 'pidfd_open'):
+                    watcher = asyncio.PidfdChildWatcher()
+                    watcher.attach_loop(loop)
+                    asyncio.set_child_watcher(watcher)
+                threading.Thread(target=loop.run_forever, name='process-supervisor', daemon=True).start()
+                self.loop = loop
+            return self.loop
+
+    def run(self, job_id, cmd, env=None, on_stdout=None, on_stderr=None, on_tick=None, timeout=None):
+        """Start a process for a job and return a concurrent.futures.Future of its exit code.
+
+        Each line of output is passed to on_stdout or on_stderr (stdout is discarded
+        without a callback), and on_tick is called every second while it runs. All
+        callbacks run on the supervisor thread. Cancelling the future stops the process.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._run(job_id, cmd, env, on_stdout, on_stderr, on_tick, timeout),
+            self._ensure_started()
+        )
+
+    async def _run(self, job_id, cmd, env, on_stdout, on_stderr, on_tick, timeout):
+        # Its own session lets cancellation stop the process together with anything it spawns
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE if on_stdout else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            env=env,
+            start_new_session=True
+        )
+        active_jobs.attach(job_id, process)
+        tasks = [self._read_lines(process.stderr, on_stderr), process.wait()]
+        if on_stdout:
+            tasks.append(self._read_lines(process.stdout, on_stdout))
+        ticker = asyncio.ensure_future(self._tick(on_tick)) if on_tick else None
+        try:
+            await asyncio.wait_for(asyncio.gather(*tasks), timeout or None)
+        except asyncio.TimeoutError:
+            self._emit(on_stderr, f"Process timed out after {timeout}s\n")
+        finally:
+            if ticker is not None:
+                ticker.cancel()
+            if process.returncode is None:
+                terminate_process_group(process)
+                await process.wait()
+            active_jobs.detach(job_id, process)
+        return process.returncode
+
+    async def _read_lines(self, stream, callback):
+        """Pass each line of a stream to callback. A carriage return ends a line too, as tqdm redraws its bars with one."""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        pending = ''
+        while True:
+            data = await stream.read(STREAM_CHUNK_SIZE)
+            pending += decoder.decode(data, final=not data)
+            # A trailing \r may be the first half of \r\n
+            complete = pending[:-1] if data and pending.endswith('\r') else pending
+            start = 0
+            for match in LINE_END_PATTERN.finditer(complete):
+                self._emit(callback, complete[start:match.start()] + '\n')
+                start = match.end()
+            pending = pending[start:]
+            if not data:
+                break
+        if pending:
+            self._emit(callback, pending)
+
+    async def _tick(self, callback):
+        while True:
+            await asyncio.sleep(1.0)
+            self._emit(callback)
+
+    def _emit(self, callback, *args):
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"Process output handler failed: {str(e)}")
+
+
+process_supervisor = ProcessSupervisor()
+
+def update_status_from_output(job_id, line):
+    """Map a line of separator stdout to a user-facing status message"""
+    if "Loading model" in line or "load model" in line.lower():
+        update_progress(job_id, status='Loading audio separation model...')
+    elif "Processing" in line or "separating" in line.lower():
+        update_progress(job_id, status='Processing audio tracks...')
+    elif "Saving" in line or "writing" in line.lower() or "output" in line.lower():
+        update_progress(job_id, status='Saving separated tracks...')
+    elif "Converting" in line or "convert" in line.lower():
+        update_progress(job_id, status='Converting audio format...')
+    elif "Enhancing" in line or "enhance" in line.lower() or "filter" in line.lower():
+        update_progress(job_id, status='Enhancing audio quality...')
+
+def estimate_progress(job_id, start_time):
+    """Advance the progress estimate based on elapsed time"""
+    elapsed_time = time.time() - start_time
+    # Estimate progress: 20% at start, up to 90% based on elapsed time
+    # Use a better estimation curve to prevent getting stuck
+    if elapsed_time < 10:
+        # First 10 seconds: move from 20% to 30%
+        estimated_progress = 20 + (elapsed_time / 10) * 10
+        status_message = 'Loading audio models...'
+    elif elapsed_time < 30:
+        # Next 20 seconds: move from 30% to 60%
+        estimated_progress = 30 + ((elapsed_time - 10) / 20) * 30
+        status_message = 'Processing audio tracks...'
+    else:
+        # Beyond 30 seconds: move from 60% to 90%
+        estimated_progress = 60 + min((elapsed_time - 30) / 30, 1) * 30
+        if estimated_progress < 75:
+            status_message = 'Applying advanced separation algorithms...'
+        else:
+            status_message = 'Finalizing separated tracks...'
+    
+    # Ensure progress is always moving forward
+    current_progress = progress_data[job_id]['progress']
+    if estimated_progress > current_progress:
+        update_progress(job_id, progress=int(estimated_progress))
+        
+    # Update status message if no specific message from output
+    if progress_data[job_id]['status'] == 'Initializing audio separation...' or progress_data[job_id]['status'] == 'Processing audio...':
+        update_progress(job_id, status=status_message)
+
+def find_ffprobe(ffmpeg_path=None):
+    """Locate ffprobe, preferring the one next to the ffmpeg binary in use"""
+    if ffmpeg_path:
+        candidate = os.path.join(os.path.dirname(ffmpeg_path), 'ffprobe')
+        if os.path.exists(candidate) and os.access(candidate, os.X_OK):
+            return candidate
+    return shutil.which('ffprobe')
+
+def get_audio_duration(filepath, ffmpeg_path=None):
+    """Return the duration of an audio file in seconds, or None if it cannot be probed"""
+    ffprobe_path = find_ffprobe(ffmpeg_path)
+    if not ffprobe_path:
+        return None
+    try:
+        result = run_ffmpeg(
+            'probe',
+            [ffprobe_path, '-v', 'error', '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', filepath],
+            capture_output=True, text=True, check=True, timeout=30
+        )
+        return float(result.stdout.strip())
+    except (subprocess.SubprocessError, ValueError, OSError):
+        return None
+
+
+class ModelSpeedStats:
+    """Per-model processing speed (seconds of compute per second of audio) across jobs"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.stats = json.load(f)
+        except (OSError, ValueError):
+            self.stats = {}
+
+    def realtime_factor(self, model):
+        with self.lock:
+            entry = self.stats.get(model)
+            return entry['realtime_factor'] if entry else None
+
+    def record(self, model, compute_seconds, audio_seconds):
+        """Fold one finished job into the model's moving average and persist it"""
+        if not audio_seconds or audio_seconds <= 0:
+            return None
+        realtime_factor = compute_seconds / audio_seconds
+        with self.lock:
+            entry = self.stats.setdefault(model, {
+                'jobs': 0,
+                'realtime_factor': realtime_factor,
+                'compute_seconds': 0.0,
+                'audio_seconds': 0.0
+            })
+            entry['jobs'] += 1
+            entry['realtime_factor'] = (1 - MODEL_SPEED_SMOOTHING) * entry['realtime_factor'] + MODEL_SPEED_SMOOTHING * realtime_factor
+            entry['last_realtime_factor'] = realtime_factor
+            entry['compute_seconds'] += compute_seconds
+            entry['audio_seconds'] += audio_seconds
+            entry['updated'] = time.time()
+            try:
+                temp_path = self.path + '.tmp'
+                with open(temp_path, 'w') as f:
+                    json.dump(self.stats, f, indent=2)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                print(f"Could not save model speed stats: {str(e)}")
+        return realtime_factor
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps(self.stats))
+
+
+model_speed_stats = ModelSpeedStats(MODEL_STATS_PATH)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ModelRegistry:
+    """The models audio-separator supports, which of them are on local disk, and what is known about each.
+
+    The list and what was learned about each model (checksums, load time, memory
+    footprint, warm-up time) are kept in a JSON file so every server process sees them.
+    """
+
+    def __init__(self, path, model_dir, configured):
+        self.path = path
+        self.model_dir = model_dir
+        self.configured = configured
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.state = {'supported': None, 'listed_at': None, 'list_error': None, 'models': {}}
+        self._refresh()
+
+    def _refresh(self):
+        """Reload the registry file if another process changed it"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self.mtime:
+            return
+        try:
+            with open(self.path) as f:
+                self.state = json.load(f)
+            self.mtime = mtime
+        except (OSError, ValueError):
+            pass
+
+    def _save(self):
+        try:
+            temp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(temp_path, self.path)
+            self.mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            print(f"Could not save model registry: {str(e)}")
+
+    def _update(self, model, **fields):
+        with self.lock:
+            self._refresh()
+            self.state['models'].setdefault(model, {}).update(fields)
+            self._save()
+
+    def list_supported(self):
+        """Ask audio-separator for the models it supports; returns False if it could not say"""
+        try:
+            result = subprocess.run(
+                ['audio-separator', '--list_models', '--list_format=json'],
+                capture_output=True, text=True, timeout=MODEL_LIST_TIMEOUT
+            )
+            listing = json.loads(result.stdout[result.stdout.index('{'):])
+        except (OSError, subprocess.TimeoutExpired, ValueError) as e:
+            with self.lock:
+                self._refresh()
+                self.state['list_error'] = str(e) or 'audio-separator printed no model list'
+                self._save()
+            print(f"Could not list supported models: {self.state['list_error']}")
+            return False
+        
+        supported = {}
+        for filename, info in listing.items():
+            if isinstance(info, dict):
+                supported[filename] = {
+                    'name': info.get('Name') or filename,
+                    'architecture': info.get('Type'),
+                    'stems': [stem.title() for stem in info.get('Stems') or []] or None
+                }
+        with self.lock:
+            self._refresh()
+            self.state.update(supported=supported, listed_at=time.time(), list_error=None)
+            self._save()
+        print(f"audio-separator supports {len(supported)} models")
+        return True
+
+    def is_supported(self, model):
+        """False only for models audio-separator is known not to support"""
+        with self.lock:
+            self._refresh()
+            supported = self.state['supported']
+        return supported is None or model in supported
+
+    def model_files(self, model):
+        """Paths of a model's files in the model directory, or [] if any of them is missing.
+
+        A Demucs .yaml names its weight files by signature, e.g. 'f7e0c4bc' for f7e0c4bc-ba3fe64a.th.
+        """
+        path = os.path.join(self.model_dir, model)
+        if not os.path.isfile(path):
+            return []
+        files = [path]
+        if model.endswith('.yaml'):
+            with open(path) as f:
+                match = re.search(r'models:\s*\[([^\]]*)\]', f.read())
+            names = os.listdir(self.model_dir)
+            for signature in re.findall(r'[\w-]+', match.group(1)) if match else []:
+                weights = [name for name in names if name.startswith(f'{signature}-') and name.endswith('.th')]
+                if not weights:
+                    return []
+                files.append(os.path.join(self.model_dir, weights[0]))
+        return files
+
+    def prefetch(self, model):
+        """Download a model if it is not on disk and verify its files against the recorded checksums"""
+        files = self.model_files(model)
+        recorded = self.describe(model).get('checksums')
+        if files and recorded:
+            checksums = {os.path.basename(path): file_sha256(path) for path in files}
+            if checksums == recorded:
+                self._update(model, status='ready')
+                return True
+            print(f"Model {model} does not match its recorded checksums, downloading it again")
+            for path in files:
+                os.remove(path)
+            files = []
+        
+        if not files:
+            self._update(model, status='downloading')
+            print(f"Downloading model {model} into {self.model_dir}")
+            try:
+                result = subprocess.run(
+                    ['audio-separator', '--download_model_only', f'--model_filename={model}',
+                     f'--model_file_dir={self.model_dir}'],
+                    capture_output=True, text=True, timeout=MODEL_DOWNLOAD_TIMEOUT
+                )
+                error = result.stderr[-ERROR_TEXT_LIMIT:] if result.returncode != 0 else None
+            except (OSError, subprocess.TimeoutExpired) as e:
+                error = str(e)
+            files = self.model_files(model)
+            if error or not files:
+                self._update(model, status='failed', error=error or 'Download produced no model files')
+                print(f"Could not download model {model}: {error}")
+                return False
+        
+        # The first verified download sets the checksums later startups compare against
+        checksums = {os.path.basename(path): file_sha256(path) for path in files}
+        self._update(model, status='ready', error=None, checksums=checksums)
+        return True
+
+    def prepare(self):
+        """List the supported models and prefetch the configured ones"""
+        os.makedirs(self.model_dir, exist_ok=True)
+        self.list_supported()
+        if MODEL_PREFETCH:
+            for model in self.configured:
+                self.prefetch(model)
+
+    def record(self, model, **fields):
+        """Store what a worker measured about a model (load_seconds, memory_bytes, warmup_seconds)"""
+        self._update(model, **fields)
+
+    def describe(self, model):
+        """Everything known about one model"""
+        with self.lock:
+            self._refresh()
+            info = dict(self.state['models'].get(model, {}))
+            listed = (self.state['supported'] or {}).get(model, {})
+        files = self.model_files(model)
+        return dict(
+            info,
+            model=model,
+            name=listed.get('name', model),
+            architecture=listed.get('architecture'),
+            stems=listed.get('stems') or MODEL_STEMS.get(model),
+            configured=model in self.configured,
+            on_disk=bool(files),
+            size_bytes=sum(os.path.getsize(path) for path in files) if files else None,
+            progress_passes=MODEL_PROGRESS_PASSES.get(model, 1),
+            realtime_factor=model_speed_stats.realtime_factor(model)
+        )
+
+    def snapshot(self, include_all=False):
+        """Descriptions of the configured models, or of every supported model with include_all"""
+        with self.lock:
+            self._refresh()
+            models = list(self.configured)
+            if include_all:
+                models += sorted(set(self.state['supported'] or {}) - set(models))
+            summary = {key: self.state[key] for key in ('listed_at', 'list_error')}
+        return dict(summary, models=[self.describe(model) for model in models])
+
+
+model_registry = ModelRegistry(MODEL_REGISTRY_PATH, MODEL_FILE_DIR, MODELS)
+
+
+class SeparationProgress:
+    """Turns separator output into real progress, ETA and real-time factor for one job.
+
+    audio-separator draws a tqdm bar on stderr for every model pass over the
+    audio (htdemucs_ft runs four), so overall progress is the share of passes
+    done. Until the first bar appears the ETA comes from the model's measured
+    speed, and without any history the old elapsed-time curve is used.
+    """
+
+    def __init__(self, job_id, model, audio_duration):
+        self.job_id = job_id
+        self.model = model
+        self.audio_duration = audio_duration
+        self.expected_passes = MODEL_PROGRESS_PASSES.get(model, 1)
+        self.passes_done = 0
+        self.last_percent = 0
+        self.fraction = None
+        self.start_time = time.time()
+        self.first_progress_time = None
+        self.launch_time = None
+        historical_factor = model_speed_stats.realtime_factor(model)
+        self.expected_seconds = historical_factor * audio_duration if historical_factor and audio_duration else None
+
+    def launched(self):
+        """Note that the separator process or worker has been handed the job"""
+        self.launch_time = time.time()
+
+    def output_seen(self):
+        """Record the time from launch to the separator's first line of output"""
+        if self.launch_time is not None:
+            metrics.observe('separator_stage_seconds', time.time() - self.launch_time, stage='first_output')
+            self.launch_time = None
+
+    def handle_output(self, line):
+        """Parse a tqdm progress line; returns True if the line was progress output"""
+        match = TQDM_PERCENT_PATTERN.search(line)
+        if not match:
+            return False
+        
+        percent = min(int(match.group(1)), 100)
+        if self.first_progress_time is None:
+            self.first_progress_time = time.time()
+            update_progress(self.job_id, status='Processing audio tracks...')
+        
+        # A bar starting over means the previous model pass finished
+        if percent < self.last_percent:
+            self.passes_done += 1
+        self.last_percent = percent
+        
+        passes = min(self.passes_done + percent / 100, self.expected_passes)
+        self.fraction = passes / self.expected_passes
+        return True
+
+    def tick(self):
+        """Publish progress and ETA; called about once per second"""
+        now = time.time()
+        eta_seconds = None
+        realtime_factor = None
+        
+        if self.fraction is not None:
+            processing_time = now - self.first_progress_time
+            progress = 20 + self.fraction * 70
+            if self.fraction > 0:
+                eta_seconds = processing_time * (1 - self.fraction) / self.fraction
+                if self.audio_duration:
+                    realtime_factor = processing_time / (self.fraction * self.audio_duration)
+        elif self.expected_seconds:
+            # Calibrated by earlier jobs, still loading or before the first bar
+            elapsed = now - self.start_time
+            progress = 20 + min(elapsed / self.expected_seconds, 0.95) * 70
+            eta_seconds = max(self.expected_seconds - elapsed, 0)
+        else:
+            estimate_progress(self.job_id, self.start_time)
+            return
+        
+        fields = {'eta_seconds': int(eta_seconds) if eta_seconds is not None else None}
+        if realtime_factor is not None:
+            fields['realtime_factor'] = round(realtime_factor, 3)
+        if int(progress) > progress_data[self.job_id]['progress']:
+            fields['progress'] = int(progress)
+        update_progress(self.job_id, **fields)
+
+    def finish(self):
+        """Record the job's measured speed for future estimates; returns its real-time factor"""
+        compute_seconds = time.time() - (self.first_progress_time or self.start_time)
+        realtime_factor = model_speed_stats.record(self.model, compute_seconds, self.audio_duration)
+        if realtime_factor is not None:
+            print(f"Model {self.model} processed {self.audio_duration:.1f}s of audio in {compute_seconds:.1f}s (RTF {realtime_factor:.3f})")
+        return realtime_factor
+
+def run_separation_in_worker(job_id, filepath, model, job_dir, ffmpeg_path, tracker, single_stem=None):
+    """Run a separation on the persistent worker pool.
+
+    Returns (exit_code, output_lines, error_lines) like the CLI path.
+    Raises SeparatorWorkerUnavailable if the pool cannot take the job.
+    """
+    events = separator_pool.submit(job_id, filepath, model, job_dir, ffmpeg_path=ffmpeg_path, single_stem=single_stem)
+    tracker.launched()
+    print(f"Submitted job {job_id} to the separation worker pool")
+    
+    # Update progress to 20% - Separation process started
+    update_progress(job_id, progress=20, status='Initializing audio separation...')
+    
+    output_lines = []
+    error_lines = []
+    started = time.time()
+    last_progress_update = started
+    timed_out = False
+    
+    while True:
+        try:
+            event = events.get(timeout=0.5)
+        except queue.Empty:
+            event = None
+        
+        if event is not None:
+            kind = event[0]
+            if kind == 'output':
+                _, _, stream_name, line = event
+                tracker.output_seen()
+                if stream_name == 'stdout':
+                    output_lines.append(line)
+                    print(f"Stdout: {line.strip()}")
+                    update_status_from_output(job_id, line)
+                elif not tracker.handle_output(line):
+                    error_lines.append(line)
+                    print(f"Stderr: {line.strip()}")
+            elif kind == 'done':
+                return 0, output_lines, error_lines
+            elif kind == 'failed':
+                error_lines.append(event[2])
+                return 1, output_lines, error_lines
+        
+        # Update progress and ETA at most once per second
+        if time.time() - last_progress_update >= 1.0:
+            tracker.tick()
+            last_progress_update = time.time()
+        
+        # Same limit as for the supervised CLI processes; the pool replaces the stopped worker
+        if JOB_TIMEOUT_SECONDS and not timed_out and time.time() - started > JOB_TIMEOUT_SECONDS:
+            timed_out = True
+            error_lines.append(f"Separation timed out after {JOB_TIMEOUT_SECONDS}s\n")
+            separator_pool.cancel(job_id)
+
+def run_separation_cli(job_id, filepath, model, job_dir, ffmpeg_path, tracker, single_stem=None):
+    """Run a separation by spawning the audio-separator CLI.
+
+    filepath may also be a list of inputs, which the CLI separates in turn.
+    With single_stem set, only that stem is written.
+    Returns (exit_code, output_lines, error_lines).
+    """
+    # Run audio-separator with proper arguments
+    # The correct format is: audio-separator input.mp3 --output_dir=path
+    cmd = ['audio-separator'] + (filepath if isinstance(filepath, list) else [filepath])
+    
+    # Add output_dir parameter
+    cmd.append(f'--output_dir={job_dir}')
+    
+    # Add model parameter if specified
+    if model and model != 'default':
+        cmd.append(f'--model_filename={model}')
+    cmd.append(f'--model_file_dir={MODEL_FILE_DIR}')
+    
+    if single_stem:
+        cmd.append(f'--single_stem={single_stem}')
+    
+    print(f"Running command: {' '.join(cmd)}")
+    
+    # Create environment with FFMPEG_PATH set
+    env = os.environ.copy()
+    env['FFMPEG_PATH'] = ffmpeg_path
+    print(f"Setting FFMPEG_PATH to {ffmpeg_path}")
+    
+    tracker.launched()
+    
+    # Update progress to 20% - Separation process started
+    update_progress(job_id, progress=20, status='Initializing audio separation...')
+    
+    # The supervisor reads the output line by line as it arrives
+    output_lines = []
+    error_lines = []
+    
+    def handle_stdout(line):
+        tracker.output_seen()
+        output_lines.append(line)
+        print(f"Stdout: {line.strip()}")
+        
+        # Look for progress indicators in the output
+        update_status_from_output(job_id, line)
+    
+    def handle_stderr(line):
+        tracker.output_seen()
+        # tqdm bars are progress, not diagnostics
+        if not tracker.handle_output(line):
+            error_lines.append(line)
+            print(f"Stderr: {line.strip()}")
+    
+    # Progress and ETA are updated once per second while it runs
+    exit_code = process_supervisor.run(
+        job_id, cmd, env,
+        on_stdout=handle_stdout,
+        on_stderr=handle_stderr,
+        on_tick=tracker.tick,
+        timeout=JOB_TIMEOUT_SECONDS
+    ).result()
+    return exit_code, output_lines, error_lines
+
+def plan_segments(audio_duration):
+    """Split a duration into (start, length) segments that overlap by SEGMENT_OVERLAP_SECONDS"""
+    segments = []
+    start = 0.0
+    while start < audio_duration:
+        length = min(SEGMENT_SECONDS + SEGMENT_OVERLAP_SECONDS, audio_duration - start)
+        segments.append((start, length))
+        if start + length >= audio_duration:
+            break
+        start += SEGMENT_SECONDS
+    return segments
+
+def separate_segment(job_id, segment_path, segment_dir, model, ffmpeg_path, threads, segment_progress, error_lines,
+                     single_stem=None):
+    """Start separating one segment with the CLI, limiting its compute threads.
+
+    Returns the supervisor's future of its exit code; stderr lines that are not
+    progress bars are collected in error_lines.
+    """
+    cmd = ['audio-separator', segment_path, f'--output_dir={segment_dir}', f'--model_file_dir={MODEL_FILE_DIR}']
+    if model and model != 'default':
+        cmd.append(f'--model_filename={model}')
+    if single_stem:
+        cmd.append(f'--single_stem={single_stem}')
+    
+    env = os.environ.copy()
+    env['FFMPEG_PATH'] = ffmpeg_path
+    for variable in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']:
+        env[variable] = str(threads)
+    
+    def handle_stderr(line):
+        if not segment_progress.handle_output(line):
+            error_lines.append(line)
+    
+    return process_supervisor.run(job_id, cmd, env, on_stderr=handle_stderr, timeout=JOB_TIMEOUT_SECONDS)
+
+def read_pcm_frames(process, frames):
+    """Read up to frames stereo float32 frames from an FFmpeg pipe"""
+    data = process.stdout.read(frames * 2 * 4)
+    return np.frombuffer(data, dtype=np.float32).reshape(-1, 2)
+
+def stitch_segments(segment_files, output_path, ffmpeg_path):
+    """Concatenate separated segments, crossfading linearly over each overlap.
+
+    Segments are decoded and written one block at a time, so memory stays
+    bounded by the block size and one overlap, not the track length.
+    """
+    overlap_frames = int(SEGMENT_OVERLAP_SECONDS * SEGMENT_SAMPLE_RATE)
+    block_frames = SEGMENT_SAMPLE_RATE * 10
+    
+    encoder = popen_ffmpeg(
+        'stitch',
+        [ffmpeg_path, '-nostdin', '-y', '-f', 'f32le', '-ar', str(SEGMENT_SAMPLE_RATE), '-ac', '2',
+         '-i', 'pipe:0', '-c:a', 'flac', output_path],
+        stdin=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        carry = None
+        for index, segment_file in enumerate(segment_files):
+            decoder = popen_ffmpeg(
+                'stitch',
+                [ffmpeg_path, '-nostdin', '-i', segment_file, '-f', 'f32le', '-ar', str(SEGMENT_SAMPLE_RATE),
+                 '-ac', '2', 'pipe:1'],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL
+            )
+            try:
+                if carry is not None:
+                    # Fade the previous segment's tail out while this segment's head fades in
+                    head = read_pcm_frames(decoder, len(carry))
+                    fade = np.linspace(0.0, 1.0, len(head), dtype=np.float32)[:, None]
+                    mixed = carry[:len(head)] * (1.0 - fade) + head * fade
+                    encoder.stdin.write(np.clip(mixed, -1.0, 1.0).tobytes())
+                
+                # Hold back the last overlap of every segment but the final one
+                is_last = index == len(segment_files) - 1
+                pending = np.zeros((0, 2), dtype=np.float32)
+                while True:
+                    block = read_pcm_frames(decoder, block_frames)
+                    if len(block) == 0:
+                        break
+                    pending = np.concatenate([pending, block])
+                    keep = 0 if is_last else overlap_frames
+                    if len(pending) > keep:
+                        encoder.stdin.write(np.clip(pending[:len(pending) - keep], -1.0, 1.0).tobytes())
+                        pending = pending[len(pending) - keep:]
+                carry = pending if len(pending) else None
+            finally:
+                decoder.stdout.close()
+                decoder.wait()
+        encoder.stdin.close()
+        if encoder.wait() != 0:
+            raise Exception(f"FFmpeg failed to encode {output_path}")
+    finally:
+        if encoder.poll() is None:
+            encoder.kill()
+            encoder.wait()
+
+def parse_stems(value):
+    """Normalize the stems option: 'all', one stem such as 'drums', or 'vocals,instrumental'.
+
+    Returns None for all stems. Raises ValueError for anything else.
+    """
+    names = sorted({name.strip().lower() for name in (value or '').split(',') if name.strip()})
+    if not names or names == ['all'] or names == sorted(stem.lower() for stem in SEPARATOR_STEMS):
+        return None
+    stems = [name for name in names if name != 'instrumental']
+    if len(stems) == 1 and stems[0].capitalize() in SEPARATOR_STEMS:
+        if len(names) == 1:
+            return stems[0]
+        if stems[0].capitalize() in RESIDUAL_STEMS:
+            return f'{stems[0]},instrumental'
+    choices = [stem.lower() for stem in SEPARATOR_STEMS] + [f'{stem.lower()},instrumental' for stem in RESIDUAL_STEMS]
+    raise ValueError(f"stems must be 'all' or one of: {', '.join(choices)}")
+
+def stem_selection(options):
+    """Return (stem the separator should write alone, stem to derive from the mix), None when not needed"""
+    stems = (options or {}).get('stems')
+    if not stems:
+        return None, None
+    names = stems.split(',')
+    single_stem = names[0].capitalize()
+    return single_stem, RESIDUAL_STEMS[single_stem] if 'instrumental' in names else None
+
+def parse_preview(form):
+    """Read the preview options of a separation request.
+
+    Returns None without preview=true, else (offset, seconds, full_job) where full_job
+    is 'queue' or 'confirm'. Raises ValueError for invalid values.
+    """
+    if form.get('preview', 'false').lower() != 'true':
+        return None
+    try:
+        offset = float(form.get('preview_offset', PREVIEW_EXCERPT_OFFSET))
+        seconds = float(form.get('preview_seconds', PREVIEW_EXCERPT_SECONDS))
+    except ValueError:
+        raise ValueError('preview_offset and preview_seconds must be numbers')
+    if not math.isfinite(offset) or offset < 0:
+        raise ValueError('preview_offset must be 0 or more seconds')
+    if not 0 < seconds <= PREVIEW_EXCERPT_MAX_SECONDS:
+        raise ValueError(f'preview_seconds must be more than 0 and at most {PREVIEW_EXCERPT_MAX_SECONDS}')
+    full_job = form.get('full_job', 'queue').lower()
+    if full_job not in ('queue', 'confirm'):
+        raise ValueError("full_job must be 'queue' or 'confirm'")
+    return offset, seconds, full_job
+
+def cut_excerpt(filepath, excerpt_path, offset, seconds, ffmpeg_path):
+    """Decode a window of an upload to a WAV file; returns the (offset, seconds) actually cut.
+
+    The window is moved back to fit inside the recording when it would run past the end.
+    """
+    duration = get_audio_duration(filepath, ffmpeg_path)
+    if duration:
+        seconds = min(seconds, duration)
+        offset = max(0.0, min(offset, duration - seconds))
+    with metrics.timer('separator_stage_seconds', stage='excerpt'):
+        run_ffmpeg(
+            'excerpt',
+            [ffmpeg_path, '-nostdin', '-y', '-ss', f'{offset:.3f}', '-t', f'{seconds:.3f}', '-i', filepath,
+             '-vn', '-ar', str(SEGMENT_SAMPLE_RATE), '-ac', '2', '-c:a', 'pcm_f32le', excerpt_path],
+            check=True, capture_output=True, timeout=120
+        )
+    return round(offset, 3), round(seconds, 3)
+
+def write_residual_stem(filepath, job_dir, stem, residual, ffmpeg_path):
+    """Write the mix minus a separated stem (e.g. the instrumental from the vocals) next to it.
+
+    Like stitching, the mix and the stem are decoded and subtracted one block at a time.
+    """
+    stem_files = [f for f in os.listdir(job_dir) if f'({stem})' in f]
+    if not stem_files:
+        raise Exception(f"Separation produced no {stem} stem")
+    stem_path = os.path.join(job_dir, stem_files[0])
+    output_path = os.path.join(
+        job_dir, f"{os.path.splitext(stem_files[0].replace(f'({stem})', f'({residual})'))[0]}.flac"
+    )
+    block_frames = SEGMENT_SAMPLE_RATE * 10
+    
+    encoder = popen_ffmpeg(
+        'residual',
+        [ffmpeg_path, '-nostdin', '-y', '-f', 'f32le', '-ar', str(SEGMENT_SAMPLE_RATE), '-ac', '2',
+         '-i', 'pipe:0', '-c:a', 'flac', output_path],
+        stdin=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    mix_decoder, stem_decoder = decoders = [
+        popen_ffmpeg(
+            'residual',
+            [ffmpeg_path, '-nostdin', '-i', path, '-f', 'f32le', '-ar', str(SEGMENT_SAMPLE_RATE),
+             '-ac', '2', 'pipe:1'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        for path in (filepath, stem_path)
+    ]
+    try:
+        while True:
+            mix = read_pcm_frames(mix_decoder, block_frames)
+            if len(mix) == 0:
+                break
+            separated = read_pcm_frames(stem_decoder, len(mix))
+            if len(separated) < len(mix):
+                separated = np.concatenate([separated, np.zeros((len(mix) - len(separated), 2), dtype=np.float32)])
+            encoder.stdin.write(np.clip(mix - separated, -1.0, 1.0).tobytes())
+        encoder.stdin.close()
+        if encoder.wait() != 0:
+            raise Exception(f"FFmpeg failed to encode {output_path}")
+    finally:
+        for decoder in decoders:
+            decoder.stdout.close()
+            decoder.wait()
+        if encoder.poll() is None:
+            encoder.kill()
+            encoder.wait()
+
+def run_segmented_separation(job_id, filepath, model, job_dir, ffmpeg_path, audio_duration, single_stem=None):
+    """Separate a long recording as overlapping segments in parallel and stitch the stems.
+
+    Returns (exit_code, output_lines, error_lines) like the other separation paths.
+    """
+    segments = plan_segments(audio_duration)
+    parallelism = max(1, min(SEGMENT_PARALLELISM, len(segments)))
+    threads = max(1, (os.cpu_count() or 1) // parallelism)
+    work_dir = os.path.join(job_dir, '.segments')
+    os.makedirs(work_dir, exist_ok=True)
+    input_base = os.path.splitext(os.path.basename(filepath))[0]
+    print(f"Separating {audio_duration:.0f}s as {len(segments)} segments, {parallelism} at a time with {threads} threads each")
+    
+    output_lines = []
+    error_lines = []
+    futures = {}
+    segment_errors = [[] for _ in segments]
+    segment_states = [{'index': index, 'status': 'queued', 'progress': 0} for index in range(len(segments))]
+    segment_progress = [SeparationProgress(job_id, model, length) for _, length in segments]
+    
+    try:
+        # Decode the input into segment files that overlap at every boundary
+        update_progress(job_id, progress=15, status='Splitting audio into segments...', segments=segment_states)
+        segment_paths = []
+        for index, (start, length) in enumerate(segments):
+            segment_path = os.path.join(work_dir, f'seg_{index:03d}.wav')
+            run_ffmpeg(
+                'split',
+                [ffmpeg_path, '-nostdin', '-y', '-ss', f'{start:.3f}', '-t', f'{length:.3f}', '-i', filepath,
+                 '-ar', str(SEGMENT_SAMPLE_RATE), '-ac', '2', '-c:a', 'pcm_f32le', segment_path],
+                check=True, capture_output=True
+            )
+            segment_paths.append(segment_path)
+        
+        # Separate the segments in parallel, each in its own process, parallelism at a time
+        update_progress(job_id, progress=20, status=f'Separating {len(segments)} segments in parallel...')
+        waiting = list(range(len(segment_paths)))
+        pending = set()
+        while waiting or pending:
+            while waiting and len(pending) < parallelism:
+                active_jobs.check(job_id)
+                index = waiting.pop(0)
+                segment_dir = os.path.join(work_dir, f'seg_{index:03d}')
+                os.makedirs(segment_dir, exist_ok=True)
+                future = separate_segment(
+                    job_id, segment_paths[index], segment_dir, model, ffmpeg_path, threads,
+                    segment_progress[index], segment_errors[index], single_stem
+                )
+                futures[future] = index
+                pending.add(future)
+                segment_states[index]['status'] = 'separating'
+            
+            done, pending = concurrent.futures.wait(pending, timeout=1.0)
+            for future in done:
+                index = futures[future]
+                exit_code = future.result()
+                if exit_code != 0:
+                    raise Exception(
+                        f"Segment {index} failed with return code {exit_code}: {''.join(segment_errors[index][-20:])}"
+                    )
+                segment_states[index]['status'] = 'done'
+            
+            # Per-segment and overall progress
+            for index, state in enumerate(segment_states):
+                if state['status'] == 'done':
+                    state['progress'] = 100
+                elif state['status'] == 'separating':
+                    state['progress'] = int((segment_progress[index].fraction or 0) * 100)
+            overall = sum(state['progress'] for state in segment_states) / (100 * len(segment_states))
+            update_progress(
+                job_id,
+                progress=max(20, int(20 + overall * 65)),
+                segments=json.loads(json.dumps(segment_states))
+            )
+        
+        # Stitch each stem back together across the segments
+        update_progress(job_id, progress=85, status='Stitching separated segments...')
+        first_dir = os.path.join(work_dir, 'seg_000')
+        for stem_file in sorted(os.listdir(first_dir)):
+            suffix = stem_file[len('seg_000'):]
+            segment_files = [
+                os.path.join(work_dir, f'seg_{index:03d}', f'seg_{index:03d}{suffix}')
+                for index in range(len(segments))
+            ]
+            output_path = os.path.join(job_dir, f"{os.path.splitext(f'{input_base}{suffix}')[0]}.flac")
+            stitch_segments(segment_files, output_path, ffmpeg_path)
+            output_lines.append(f"Stitched {os.path.basename(output_path)}\n")
+        return 0, output_lines, error_lines
+    except Exception as e:
+        # Stop the segments that are still running
+        for future in futures:
+            future.cancel()
+        error_lines.append(str(e))
+        return 1, output_lines, error_lines
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def finish_separation(job_id, filepath, job_dir, cache_key, tracker=None):
+    """Tidy the stem names of a separated job, cache and pre-transcode them, and mark it complete.
+
+    Returns the output filenames.
+    """
+    # Get output files
+    rename_started = time.time()
+    output_files = []
+    for f in os.listdir(job_dir):
+        if os.path.isfile(os.path.join(job_dir, f)):
+            # Remove "htdemucs_ft" from the filename if present
+            clean_filename = f.replace("htdemucs_ft_", "").replace("_htdemucs_ft", "")
+            clean_filename = clean_filename.replace("htdemucs_ft.", ".")
+            clean_filename = clean_filename.replace("htdemucs_ft", "")
+            
+            # If the filename changed, rename the file
+            if clean_filename != f:
+                os.rename(
+                    os.path.join(job_dir, f),
+                    os.path.join(job_dir, clean_filename)
+                )
+                output_files.append(clean_filename)
+            else:
+                output_files.append(f)
+    metrics.observe('separator_stage_seconds', time.time() - rename_started, stage='rename')
+    
+    # Index the stems so identical uploads can reuse them
+    if cache_key:
+        try:
+            input_base = os.path.splitext(os.path.basename(filepath))[0]
+            result_cache.store(cache_key, job_dir, output_files, input_base)
+        except Exception as e:
+            print(f"Could not cache result of job {job_id}: {str(e)}")
+    
+    # Describe the stems once; /api/result serves this from now on (or writes it itself if this fails)
+    try:
+        with metrics.timer('separator_stage_seconds', stage='manifest'):
+            write_manifest(job_id, output_files)
+    except Exception as e:
+        print(f"Could not write the manifest of job {job_id}: {str(e)}")
+    
+    # Encode the stems into the configured download formats in the background
+    schedule_pretranscode(job_id, output_files)
+    
+    # Update progress to 100% - Complete, with the measured real-time factor
+    realtime_factor = tracker.finish() if tracker else None
+    update_progress(
+        job_id,
+        progress=100,
+        status='Separation completed successfully!',
+        complete=True,
+        finished_at=time.time(),
+        eta_seconds=0,
+        realtime_factor=round(realtime_factor, 3) if realtime_factor is not None else None
+    )
+    metrics.inc('separator_jobs_total', outcome='success')
+    return output_files
+
+# Progress fields linking a preview and its full-track job, kept when a job's progress is reset
+LINKED_JOB_FIELDS = ('preview_job_id', 'full_job_id', 'excerpt')
+
+def mark_cancelled(job_id, job_dir, reason):
+    """Delete a cancelled job's partial outputs and record it as cancelled"""
+    shutil.rmtree(job_dir, ignore_errors=True)
+    rendition_cache.remove_job(job_id)
+    metrics.inc('separator_jobs_total', outcome='cancelled')
+    update_progress(
+        job_id,
+        progress=0,
+        status='Cancelled',
+        error=f'Job was cancelled: {reason}',
+        cancelled=True,
+        complete=True,
+        finished_at=time.time()
+    )
+
+def process_audio_in_thread(job_id, filepath, model, job_dir, result_queue, cache_key=None, options=None):
+    """Process audio in a separate thread and track progress"""
+    options = options or {}
+    try:
+        active_jobs.check(job_id)
+        
+        # First check if FFmpeg is available
+        ffmpeg_status = check_ffmpeg()
+        if not ffmpeg_status['installed']:
+            raise Exception(f"FFmpeg is not installed or not in PATH: {ffmpeg_status['error']}")
+        
+        # Update progress to 10% - File uploaded and processing started (batch tracks keep their
+        # batch, previews and full tracks the job they are linked to)
+        previous = get_job(job_id) or {}
+        update_progress(
+            job_id,
+            replace=True,
+            progress=10,
+            status='Preparing audio file for processing...',
+            complete=False,
+            error=None,
+            batch_id=previous.get('batch_id'),
+            **{key: previous[key] for key in LINKED_JOB_FIELDS if key in previous}
+        )
+        
+        # A preview separates only its excerpt, which is cut here rather than in the request
+        if options.get('excerpt'):
+            update_progress(job_id, status='Cutting the preview excerpt...')
+            excerpt_path = f"{os.path.splitext(filepath)[0]}_preview.wav"
+            try:
+                offset, seconds = cut_excerpt(
+                    filepath, excerpt_path, options['excerpt']['offset'], options['excerpt']['seconds'],
+                    ffmpeg_status['path']
+                )
+            except Exception:
+                if os.path.exists(excerpt_path):
+                    os.remove(excerpt_path)
+                raise
+            os.remove(filepath)
+            filepath = excerpt_path
+            update_progress(job_id, excerpt={'offset': offset, 'seconds': seconds})
+            active_jobs.check(job_id)
+        
+        # Clean the model name - extract just the filename part
+        if model:
+            model = model.split()[0].strip()  # Take just the first word
+        
+        print(f"Using model: {model}")
+        
+        # Real progress and ETA come from the separator's output and the model's measured speed
+        audio_duration = get_audio_duration(filepath, ffmpeg_status['path'])
+        tracker = SeparationProgress(job_id, model, audio_duration)
+        if audio_duration:
+            update_progress(job_id, audio_duration=round(audio_duration, 2))
+        
+        # Only the requested stems are written; a residual stem is derived from the mix afterwards
+        single_stem, residual_stem = stem_selection(options)
+        
+        # Long recordings are separated as parallel segments
+        long_input = options.get('long_input') or (
+            LONG_INPUT_AUTO_SECONDS > 0 and audio_duration and audio_duration >= LONG_INPUT_AUTO_SECONDS
+        )
+        
+        # Prefer the persistent workers, which already have the model loaded
+        exit_code = None
+        separation_started = time.time()
+        if long_input and audio_duration and audio_duration > SEGMENT_SECONDS + SEGMENT_OVERLAP_SECONDS:
+            # Parallel runs have their own speed profile, so keep their stats apart
+            tracker.model = f"{model}:segmented"
+            exit_code, output_lines, error_lines = run_segmented_separation(
+                job_id, filepath, model, job_dir, ffmpeg_status['path'], audio_duration, single_stem
+            )
+        elif separator_pool.is_available():
+            try:
+                exit_code, output_lines, error_lines = run_separation_in_worker(
+                    job_id, filepath, model, job_dir, ffmpeg_status['path'], tracker, single_stem
+                )
+            except SeparatorWorkerUnavailable as e:
+                print(f"Separation worker unavailable, falling back to CLI: {str(e)}")
+        
+        if exit_code is None:
+            exit_code, output_lines, error_lines = run_separation_cli(
+                job_id, filepath, model, job_dir, ffmpeg_status['path'], tracker, single_stem
+            )
+        metrics.observe('separator_stage_seconds', time.time() - separation_started, stage='separation')
+        # A cancelled separation ends like a failed one
+        active_jobs.check(job_id)
+        
+        # Check if process was successful
+        if exit_code == 0:
+            if residual_stem:
+                update_progress(job_id, status=f'Deriving the {residual_stem.lower()} stem...')
+                with metrics.timer('separator_stage_seconds', stage='residual'):
+                    write_residual_stem(filepath, job_dir, single_stem, residual_stem, ffmpeg_status['path'])
+            output_files = finish_separation(job_id, filepath, job_dir, cache_key, tracker)
+            print(f"Separation complete. Output files: {output_files}")
+            result_queue.put({
+                'job_id': job_id,
+                'success': True,
+                'message': 'Separation completed successfully',
+                'output_files': output_files,
+                'stdout': ''.join(output_lines)
+            })
+        else:
+            error_message = ''.join(error_lines)
+            metrics.inc('separator_jobs_total', outcome='failed')
+            print(f"Error during separation: {error_message}")
+            
+            # Update progress with error
+            update_progress(
+                job_id,
+                progress=0,
+                status='Error: Separation process failed. Please check logs for details.',
+                error=error_message[-ERROR_TEXT_LIMIT:],
+                complete=True,
+                finished_at=time.time()
+            )
+            
+            result_queue.put({
+                'job_id': job_id,
+                'success': False,
+                'error': f"Error during separation: return code {exit_code}",
+                'stderr': error_message
+            })
+    except JobCancelled as e:
+        print(f"Job {job_id} cancelled: {str(e)}")
+        mark_cancelled(job_id, job_dir, str(e))
+        result_queue.put({
+            'job_id': job_id,
+            'success': False,
+            'error': f"Job was cancelled: {str(e)}"
+        })
+    except Exception as e:
+        print(f"Unexpected error in process_audio_in_thread: {str(e)}")
+        metrics.inc('separator_jobs_total', outcome='error')
+        
+        # Update progress with error
+        update_progress(
+            job_id,
+            progress=0,
+            status='Error: Unexpected issue occurred during processing.',
+            error=str(e)[-ERROR_TEXT_LIMIT:],
+            complete=True,
+            finished_at=time.time()
+        )
+        
+        result_queue.put({
+            'job_id': job_id,
+            'success': False,
+            'error': f"Unexpected error: {str(e)}"
         })
     finally:
+        # Let later identical uploads start their own job or hit the cache
+        if cache_key:
+            result_cache.release(cache_key, job_id)
+        
         # Clean up uploaded file
         if os.path.exists(filepath):
             os.remove(filepath)
 
-@app.route('/api/separate', methods=['POST'])
-def separate_audio():
-    """Separate audio using audio-separator"""
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
-    
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
+class BatchProgress(SeparationProgress):
+    """Progress of one separator run over all tracks of a batch, shared out to each track.
+
+    The separator handles the inputs one after another, so with n tracks the
+    first 1/n of the model passes belong to the first track, and so on.
+    """
+
+    def __init__(self, batch_id, model, track_job_ids, audio_duration):
+        super().__init__(batch_id, model, audio_duration)
+        self.track_job_ids = track_job_ids
+        self.expected_passes *= len(track_job_ids)
+
+    def tick(self):
+        super().tick()
+        if self.fraction is None:
+            return
+        done = self.fraction * len(self.track_job_ids)
+        for index, job_id in enumerate(self.track_job_ids):
+            share = min(max(done - index, 0.0), 1.0)
+            if share == 0:
+                status = 'Waiting for earlier tracks in the batch...'
+            elif share < 1:
+                status = 'Processing audio tracks...'
+            else:
+                status = 'Waiting for the rest of the batch...'
+            update_progress(job_id, progress=int(20 + share * 70), status=status)
+
+def run_batch_cli(batch_id, model, tracks, ffmpeg_path, options=None):
+    """Separate every track of a batch with one audio-separator process, loading the model once"""
+    single_stem, residual_stem = stem_selection(options)
+    work_dir = os.path.join(UPLOAD_FOLDER, f'batch_{batch_id}')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        track_job_ids = [job_id for job_id, _, _, _ in tracks]
+        durations = [get_audio_duration(filepath, ffmpeg_path) for _, filepath, _, _ in tracks]
+        tracker = BatchProgress(batch_id, model, track_job_ids, sum(d for d in durations if d) or None)
+        for job_id in track_job_ids:
+            update_progress(job_id, progress=10, status='Waiting for earlier tracks in the batch...')
+        
+        exit_code, _, error_lines = run_separation_cli(
+            batch_id, [filepath for _, filepath, _, _ in tracks], model, work_dir, ffmpeg_path, tracker, single_stem
+        )
+        active_jobs.check(batch_id)
+        tracker.finish()
+        
+        # Outputs are named after their input file, which starts with the track's job id
+        for name in os.listdir(work_dir):
+            for job_id, _, job_dir, _ in tracks:
+                if name.startswith(f'{job_id}_'):
+                    os.rename(os.path.join(work_dir, name), os.path.join(job_dir, name))
+                    break
+        
+        error_message = ''.join(error_lines)[-ERROR_TEXT_LIMIT:]
+        for job_id, filepath, job_dir, cache_key in tracks:
+            if os.listdir(job_dir):
+                # One track's failure must not cost the rest of the batch their results
+                try:
+                    if residual_stem:
+                        write_residual_stem(filepath, job_dir, single_stem, residual_stem, ffmpeg_path)
+                    finish_separation(job_id, filepath, job_dir, cache_key)
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    print(f"Unexpected error finishing batch track {job_id}: {str(e)}")
+                    metrics.inc('separator_jobs_total', outcome='error')
+                    update_progress(
+                        job_id,
+                        progress=0,
+                        status='Error: Unexpected issue occurred during processing.',
+                        error=str(e)[-ERROR_TEXT_LIMIT:],
+                        complete=True,
+                        finished_at=time.time()
+                    )
+            else:
+                metrics.inc('separator_jobs_total', outcome='failed')
+                update_progress(
+                    job_id,
+                    progress=0,
+                    status='Error: Separation process failed. Please check logs for details.',
+                    error=error_message or f'Separation produced no output (return code {exit_code})',
+                    complete=True,
+                    finished_at=time.time()
+                )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def process_batch_in_thread(batch_id, model, tracks, options=None):
+    """Separate the tracks of a batch, [job_id, filepath, job_dir, cache_key] each, in one model session"""
+    # In production mode the job runner takes over the progress the HTTP worker created
+    for job_id, _, _, _ in tracks:
+        if job_id not in progress_data:
+            adopt_progress(job_id)
+    
+    try:
+        if separator_pool.is_available():
+            # The persistent workers keep the model loaded, so the tracks simply take turns
+            for index, (job_id, filepath, job_dir, cache_key) in enumerate(tracks):
+                active_jobs.check(batch_id)
+                update_progress(batch_id, status=f'Separating track {index + 1} of {len(tracks)}...')
+                process_audio_in_thread(job_id, filepath, model, job_dir, queue.Queue(), cache_key, options)
+                update_progress(batch_id, progress=int(100 * (index + 1) / len(tracks)))
+        else:
+            ffmpeg_status = check_ffmpeg()
+            if not ffmpeg_status['installed']:
+                raise Exception(f"FFmpeg is not installed or not in PATH: {ffmpeg_status['error']}")
+            model = model.split()[0].strip() if model else model
+            active_jobs.check(batch_id)
+            update_progress(batch_id, status=f'Separating {len(tracks)} tracks...')
+            run_batch_cli(batch_id, model, tracks, ffmpeg_status['path'], options)
+    except JobCancelled as e:
+        print(f"Batch {batch_id} cancelled: {str(e)}")
+        for job_id, _, job_dir, _ in tracks:
+            progress = get_job(job_id)
+            if progress is not None and not progress.get('complete'):
+                mark_cancelled(job_id, job_dir, str(e))
+    except Exception as e:
+        print(f"Unexpected error in process_batch_in_thread: {str(e)}")
+        for job_id, _, _, _ in tracks:
+            progress = get_job(job_id)
+            if progress is not None and not progress.get('complete'):
+                metrics.inc('separator_jobs_total', outcome='error')
+                update_progress(
+                    job_id,
+                    progress=0,
+                    status='Error: Unexpected issue occurred during processing.',
+                    error=str(e)[-ERROR_TEXT_LIMIT:],
+                    complete=True,
+                    finished_at=time.time()
+                )
+    finally:
+        for job_id, filepath, _, cache_key in tracks:
+            if cache_key:
+                result_cache.release(cache_key, job_id)
+            if os.path.exists(filepath):
+                os.remove(filepath)
+        
+        failed = sum(1 for job_id, _, _, _ in tracks if (get_job(job_id) or {}).get('error'))
+        cancelled = active_jobs.cancelled(batch_id)
+        if cancelled is not None:
+            status = 'Batch cancelled'
+        elif failed:
+            status = f'{failed} of {len(tracks)} tracks failed'
+        else:
+            status = 'Batch completed successfully!'
+        update_progress(
+            batch_id,
+            progress=100,
+            status=status,
+            cancelled=cancelled is not None,
+            complete=True,
+            finished_at=time.time(),
+            eta_seconds=0
+        )
+
+def separate_job(job_id, filepath, model, job_dir, cache_key, options):
+    process_audio_in_thread(job_id, filepath, model, job_dir, queue.Queue(), cache_key, options)
+
+# Jobs are submitted by name so production mode can pass them to the job runner
+JOB_TARGETS = {
+    'separate': separate_job,
+    'batch': process_batch_in_thread
+}
+
+def job_progress_ids(job_id, target, args):
+    """The progress entries a job updates: its own, and for a batch each pending track's"""
+    if target == 'batch':
+        return [job_id] + [track_job_id for track_job_id, _, _, _ in args[2]]
+    return [job_id]
+
+def run_job(job_id, target, args):
+    """Run a submitted job; it can be cancelled until it returns"""
+    try:
+        JOB_TARGETS[target](*args)
+    finally:
+        active_jobs.unregister(job_id)
+
+def submit_job(job_id, target, args, priority=PRIORITY_NORMAL):
+    """Schedule a job in this process, or in production mode queue it for the job runner.
+
+    In production mode the job's progress entries are handed over to the job runner with it.
+    """
+    if job_queue is None:
+        active_jobs.register(job_id, job_progress_ids(job_id, target, args))
+        try:
+            job_scheduler.submit(job_id, run_job, (job_id, target, args), priority)
+        except Exception:
+            active_jobs.unregister(job_id)
+            raise
+        return
+    job_queue.enqueue(job_id, target, args, priority)
+    for progress_id in job_progress_ids(job_id, target, args):
+        hand_off_progress(progress_id)
+
+def cancel_local_job(job_id, reason):
+    """Cancel a job queued or running in this process; returns False if it is not here"""
+    if not active_jobs.cancel(job_id, reason):
+        return False
+    queued = job_scheduler.cancel(job_id)
+    if queued is not None:
+        # It never started, so run it only to have it clean up after itself
+        target, args = queued
+        threading.Thread(target=target, args=args, name=f'cancel-{job_id}', daemon=True).start()
+    return True
+
+def cancel_job(job_id, reason):
+    """Cancel a queued or running job wherever it runs; returns False if it is not queued or running.
+
+    In production mode a job the job runner has claimed is cancelled by the
+    runner, which picks up the request from the job queue.
+    """
+    if job_queue is None:
+        return cancel_local_job(job_id, reason)
+    cancelled = job_queue.cancel(job_id, reason)
+    if cancelled is None:
+        return False
+    state, target, args = cancelled
+    if state == 'queued':
+        # The job runner never saw it, so clean it up here
+        progress_ids = job_progress_ids(job_id, target, args)
+        for progress_id in progress_ids:
+            adopt_progress(progress_id)
+        active_jobs.register(job_id, progress_ids)
+        active_jobs.cancel(job_id, reason)
+        threading.Thread(target=run_job, args=(job_id, target, args), name=f'cancel-{job_id}', daemon=True).start()
+    return True
+
+def held_job_path(job_id):
+    return os.path.join(UPLOAD_FOLDER, f'held_{job_id}.json')
+
+def hold_job(job_id, args, **fields):
+    """Keep a separation job's arguments until the client starts it with POST /api/jobs/<job_id>/start.
+
+    The arguments live next to the upload, so any server process can start the job.
+    """
+    update_progress(
+        job_id,
+        replace=True,
+        progress=5,
+        status='Waiting for confirmation to separate the full track',
+        complete=False,
+        error=None,
+        awaiting_confirmation=True,
+        **fields
+    )
+    with open(held_job_path(job_id), 'w') as f:
+        json.dump(args, f)
+    if job_queue is not None:
+        hand_off_progress(job_id)
+
+def take_held_job(job_id):
+    """Remove and return a held job's arguments, or None if it is not held (any more)"""
+    path = held_job_path(job_id)
+    try:
+        with open(path) as f:
+            args = json.load(f)
+        # Only one request gets to delete the file, so a job starts at most once
+        os.remove(path)
+    except (OSError, ValueError):
+        return None
+    # The job may have been held by another process, or before a restart
+    if job_id not in progress_data:
+        adopt_progress(job_id)
+    return args
+
+def discard_held_job(job_id, reason):
+    """Cancel a held job, deleting its upload; returns False if it is not held"""
+    args = take_held_job(job_id)
+    if args is None:
+        return False
+    _, filepath, _, job_dir, _, _ = args
+    if os.path.exists(filepath):
+        os.remove(filepath)
+    update_progress(job_id, awaiting_confirmation=False)
+    mark_cancelled(job_id, job_dir, reason)
+    return True
+
+# When each job's last poll was written to the job queue, to write it at most every JOB_POLL_RECORD_INTERVAL
+job_poll_records = {}
+
+def note_job_polled(job_id):
+    """Record that a client is still following a job, which keeps it from being cancelled as idle"""
+    if JOB_IDLE_CANCEL_SECONDS <= 0:
+        return
+    active_jobs.touch(job_id)
+    if job_queue is None:
+        return
+    now = time.time()
+    if now - job_poll_records.get(job_id, 0) < JOB_POLL_RECORD_INTERVAL:
+        return
+    if len(job_poll_records) > 10000:
+        job_poll_records.clear()
+    job_poll_records[job_id] = now
+    job_queue.touch(job_id)
+
+def start_idle_canceller():
+    """Cancel jobs whose progress nobody polled for JOB_IDLE_CANCEL_SECONDS, from the process that runs them"""
+    if JOB_IDLE_CANCEL_SECONDS <= 0:
+        return
+    
+    def run():
+        while True:
+            time.sleep(JOB_IDLE_CHECK_INTERVAL)
+            try:
+                if job_queue is None:
+                    idle = active_jobs.idle(JOB_IDLE_CANCEL_SECONDS)
+                else:
+                    idle = job_queue.idle_jobs(JOB_IDLE_CANCEL_SECONDS)
+                for job_id in idle:
+                    print(f"Cancelling job {job_id}: nobody polled its progress for {JOB_IDLE_CANCEL_SECONDS}s")
+                    cancel_job(job_id, f'nobody polled its progress for {JOB_IDLE_CANCEL_SECONDS}s')
+            except Exception as e:
+                print(f"Idle job check failed: {str(e)}")
+    
+    threading.Thread(target=run, name='idle-canceller', daemon=True).start()
+
+def scheduler_rejection(error):
+    """Turn a scheduler admission error into a 429/503 response"""
+    if isinstance(error, SchedulerQueueFull):
+        response = jsonify({'error': str(error), 'retry_after': error.retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(error.retry_after)
+    else:
+        response = jsonify({'error': str(error)})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+    return response
+
+@app.route('/api/models/stats', methods=['GET'])
+def get_model_stats():
+    """Get measured processing speed per model across finished jobs"""
+    return jsonify({'models': model_speed_stats.snapshot()})
+
+def sniff_audio_format(header):
+    """Identify an audio container from its first bytes, or None if unrecognized"""
+    if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+        return 'wav'
+    if header[:4] == b'fLaC':
+        return 'flac'
+    if header[:4] == b'OggS':
+        return 'ogg'
+    if header[4:8] == b'ftyp':
+        return 'm4a'
+    if header[:3] == b'ID3' or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return 'mp3'
+    return None
+
+
+class UploadError(Exception):
+    """A chunked upload request that cannot be applied, with its HTTP status"""
+
+    def __init__(self, message, status_code, offset=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+class ChunkedUploads:
+    """Resumable uploads written chunk by chunk into UPLOAD_FOLDER.
+
+    Chunks must arrive in order (each PUT names the offset it starts at), so
+    the content hash and format sniffing run incrementally as data arrives.
+    Upload metadata is kept in a sidecar file; after a restart the hash is
+    rebuilt from the bytes already on disk and the client resumes from there.
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.uploads = {}
+
+    def _paths(self, upload_id):
+        base = os.path.join(self.folder, f"upload_{upload_id}")
+        return f"{base}.part", f"{base}.json"
+
+    def _save_metadata(self, upload):
+        _, metadata_path = self._paths(upload['upload_id'])
+        metadata = {key: upload[key] for key in ('upload_id', 'filename', 'size', 'created', 'finalized', 'content_hash')}
+        with open(metadata_path, 'w') as f:
+            json.dump(metadata, f)
+
+    def create(self, filename, size):
+        if size is not None and size > self.max_bytes:
+            raise UploadError(f'Upload exceeds the maximum size of {self.max_bytes} bytes', 413)
+        upload_id = uuid.uuid4().hex
+        data_path, _ = self._paths(upload_id)
+        open(data_path, 'wb').close()
+        upload = {
+            'upload_id': upload_id,
+            'filename': filename,
+            'size': size,
+            'created': time.time(),
+            'updated': time.time(),
+            'received': 0,
+            'format': None,
+            'content_hash': None,
+            'finalized': False,
+            'hasher': hashlib.sha256(),
+            'lock': threading.Lock()
+        }
+        self._save_metadata(upload)
+        with self.lock:
+            self.uploads[upload_id] = upload
+        return upload
+
+    def get(self, upload_id):
+        """Return an upload, reloading it from disk if this process has not seen it
+        or another process has written to it since"""
+        with self.lock:
+            data_path, metadata_path = self._paths(upload_id)
+            upload = self.uploads.get(upload_id)
+            if upload is not None:
+                try:
+                    if upload['lock'].locked() or os.path.getsize(data_path) == upload['received']:
+                        return upload
+                except OSError:
+                    self.uploads.pop(upload_id, None)
+                    return None
+            try:
+                with open(metadata_path) as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                return None
+            
+            hasher = hashlib.sha256()
+            received = 0
+            with open(data_path, 'rb') as f:
+                header = f.read(UPLOAD_SNIFF_BYTES)
+                f.seek(0)
+                while True:
+                    chunk = f.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    received += len(chunk)
+            upload = dict(
+                metadata,
+                updated=time.time(),
+                received=received,
+                format=sniff_audio_format(header) if received >= UPLOAD_SNIFF_BYTES or metadata['finalized'] else None,
+                hasher=hasher,
+                lock=threading.Lock()
+            )
+            self.uploads[upload_id] = upload
+            return upload
+
+    def _sniff(self, upload, f):
+        """Identify the upload's format from the start of its data file; an unrecognized upload starts over"""
+        position = f.tell()
+        f.seek(0)
+        upload_format = sniff_audio_format(f.read(UPLOAD_SNIFF_BYTES))
+        if upload_format is None:
+            f.truncate(0)
+            upload['received'] = 0
+            upload['hasher'] = hashlib.sha256()
+            raise UploadError('Unrecognized audio format', 415, 0)
+        f.seek(position)
+        upload['format'] = upload_format
+
+    def write_chunk(self, upload, offset, stream):
+        """Append the request body at offset, enforcing the size limit while it streams in"""
+        if not upload['lock'].acquire(blocking=False):
+            raise UploadError('Another chunk for this upload is being written', 409, upload['received'])
+        try:
+            if upload['finalized']:
+                raise UploadError('Upload is already finalized', 409, upload['received'])
+            if offset != upload['received']:
+                raise UploadError('Chunk offset does not match the bytes received so far', 409, upload['received'])
+            
+            data_path, _ = self._paths(upload['upload_id'])
+            limit = min(self.max_bytes, upload['size']) if upload['size'] is not None else self.max_bytes
+            hasher = upload['hasher'].copy()
+            written = 0
+            with open(data_path, 'r+b') as f:
+                f.seek(offset)
+                while True:
+                    chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if offset + written + len(chunk) > limit:
+                        # Drop the partial chunk so the upload can resume cleanly
+                        f.truncate(offset)
+                        raise UploadError(f'Upload exceeds the maximum size of {limit} bytes', 413, offset)
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    written += len(chunk)
+                    # Network reads can be shorter than the header, so sniff once enough has arrived
+                    if upload['format'] is None and offset + written >= UPLOAD_SNIFF_BYTES:
+                        self._sniff(upload, f)
+                f.truncate(offset + written)
+                if upload['format'] is None and offset + written > 0 and offset + written == upload['size']:
+                    self._sniff(upload, f)
+            
+            upload['hasher'] = hasher
+            upload['received'] = offset + written
+            upload['updated'] = time.time()
+            return upload['received']
+        finally:
+            upload['lock'].release()
+
+    def finalize(self, upload):
+        with upload['lock']:
+            if upload['size'] is not None and upload['received'] != upload['size']:
+                raise UploadError(
+                    f"Upload incomplete: received {upload['received']} of {upload['size']} bytes",
+                    409, upload['received']
+                )
+            if upload['received'] == 0:
+                raise UploadError('Upload is empty', 400, 0)
+            if upload['format'] is None:
+                # An upload shorter than the sniffed header
+                data_path, _ = self._paths(upload['upload_id'])
+                with open(data_path, 'r+b') as f:
+                    self._sniff(upload, f)
+            upload['finalized'] = True
+            upload['content_hash'] = upload['hasher'].hexdigest()
+            self._save_metadata(upload)
+            return upload
+
+    def consume(self, upload_id, filepath):
+        """Move a finalized upload to filepath for a job and forget it"""
+        upload = self.get(upload_id)
+        with self.lock:
+            self.uploads.pop(upload_id, None)
+        if upload is None or not upload['finalized']:
+            raise UploadError('Upload not found or not finalized', 404)
+        data_path, metadata_path = self._paths(upload_id)
+        try:
+            os.rename(data_path, filepath)
+        except FileNotFoundError:
+            # Another request already started a job with this upload
+            raise UploadError('Upload not found or not finalized', 404)
+        os.remove(metadata_path)
+        return upload['content_hash']
+
+    def delete(self, upload_id):
+        with self.lock:
+            self.uploads.pop(upload_id, None)
+        for path in self._paths(upload_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+chunked_uploads = ChunkedUploads(UPLOAD_FOLDER, MAX_UPLOAD_BYTES)
+
+def describe_upload(upload):
+    """Public view of a chunked upload"""
+    return {
+        'upload_id': upload['upload_id'],
+        'filename': upload['filename'],
+        'size': upload['size'],
+        'offset': upload['received'],
+        'format': upload['format'],
+        'finalized': upload['finalized'],
+        'content_hash': upload['content_hash'],
+        'max_size': chunked_uploads.max_bytes
+    }
+
+def upload_error_response(error):
+    response = jsonify({'error': str(error), 'offset': error.offset})
+    response.status_code = error.status_code
+    if error.offset is not None:
+        response.headers['Upload-Offset'] = str(error.offset)
+    return response
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """Start a resumable chunked upload"""
+    params = request.get_json(silent=True) or request.form
+    filename = secure_filename(params.get('filename', ''))
+    if not filename:
+        return jsonify({'error': 'No filename given'}), 400
+    if not allowed_file(filename):
+        return jsonify({'error': f'File type not allowed. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'}), 400
+    
+    size = params.get('size')
+    try:
+        size = int(size) if size is not None else None
+        upload = chunked_uploads.create(filename, size)
+    except ValueError:
+        return jsonify({'error': 'Invalid size'}), 400
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify(describe_upload(upload)), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Report how many bytes of an upload have arrived, so a client can resume"""
+    upload = chunked_uploads.get(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    response = jsonify(describe_upload(upload))
+    response.headers['Upload-Offset'] = str(upload['received'])
+    return response
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """Write one chunk of an upload; ?offset= (or Upload-Offset) is where it starts"""
+    upload = chunked_uploads.get(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    offset = request.args.get('offset', request.headers.get('Upload-Offset'))
+    try:
+        offset = int(offset)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'A numeric offset is required'}), 400
+    
+    try:
+        with metrics.timer('separator_stage_seconds', stage='upload_chunk'):
+            received = chunked_uploads.write_chunk(upload, offset, request.stream)
+    except UploadError as e:
+        return upload_error_response(e)
+    
+    response = jsonify(describe_upload(upload))
+    response.headers['Upload-Offset'] = str(received)
+    return response
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """Complete an upload so it can be passed to /api/separate as upload_id"""
+    upload = chunked_uploads.get(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    try:
+        chunked_uploads.finalize(upload)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify(describe_upload(upload))
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def delete_upload(upload_id):
+    """Abort an upload and delete what was received"""
+    if chunked_uploads.get(upload_id) is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    chunked_uploads.delete(upload_id)
+    return jsonify({'upload_id': upload_id, 'deleted': True})
+
+def complete_from_cache(job_id, cache_key, filepath, job_dir, **fields):
+    """Finish a job with the cached stems of an identical earlier separation.
+
+    Returns the output filenames, or None if the entry was evicted meanwhile.
+    """
+    input_base = os.path.splitext(os.path.basename(filepath))[0]
+    output_files = result_cache.materialize(cache_key, job_dir, input_base)
+    if output_files is None:
+        return None
+    os.remove(filepath)
+    update_progress(
+        job_id,
+        replace=True,
+        progress=100,
+        status='Separation completed successfully!',
+        complete=True,
+        finished_at=time.time(),
+        error=None,
+        cached=True,
+        **fields
+    )
+    schedule_pretranscode(job_id, output_files)
+    metrics.inc('separator_jobs_total', outcome='cached')
+    print(f"Served job {job_id} from result cache: {output_files}")
+    return output_files
+
+def submit_preview(preview_job_id, job_id, filepath, filename, model, options, offset, seconds):
+    """Queue the separation of an excerpt of a job's upload ahead of normal jobs.
+
+    The preview job cuts the excerpt itself, from its own link to the upload.
+    """
+    source_path = os.path.join(UPLOAD_FOLDER, f"{preview_job_id}_{filename}")
+    preview_dir = os.path.join(OUTPUT_FOLDER, preview_job_id)
+    try:
+        link_or_copy(filepath, source_path)
+        os.makedirs(preview_dir, exist_ok=True)
+        update_progress(
+            preview_job_id,
+            replace=True,
+            progress=5,
+            status='Preview queued',
+            complete=False,
+            error=None,
+            full_job_id=job_id,
+            excerpt={'offset': offset, 'seconds': seconds}
+        )
+        # Previews are not cached: they are short, and their window depends on the request
+        submit_job(
+            preview_job_id, 'separate',
+            [preview_job_id, source_path, model, preview_dir, None,
+             dict(options, long_input=False, excerpt={'offset': offset, 'seconds': seconds})],
+            priority=PRIORITY_HIGH
+        )
+    except Exception:
+        remove_progress(preview_job_id)
+        if os.path.exists(source_path):
+            os.remove(source_path)
+        shutil.rmtree(preview_dir, ignore_errors=True)
+        raise
+    print(f"Queued preview {preview_job_id} of job {job_id}: {seconds}s from {offset}s")
+
+@app.route('/api/separate', methods=['POST'])
+def separate_audio():
+    """Separate audio using audio-separator.
+
+    Takes either a multipart 'file' or the 'upload_id' of a finalized chunked upload.
+    An optional 'stems' ('vocals', 'vocals,instrumental', ...) limits which stems are written.
+    With preview=true an excerpt ('preview_offset', 'preview_seconds') is separated first as
+    its own job; 'full_job' ('queue' or 'confirm') says whether the full track follows it
+    right away or waits for POST /api/jobs/<job_id>/start.
+    """
+    upload_id = request.form.get('upload_id')
+    if upload_id:
+        upload = chunked_uploads.get(upload_id)
+        if upload is None:
+            return jsonify({'error': 'Upload not found'}), 404
+        if not upload['finalized']:
+            return jsonify({'error': 'Upload has not been finalized'}), 409
+    else:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file part'}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No selected file'}), 400
+        
+        if not allowed_file(file.filename):
+            return jsonify({'error': f'File type not allowed. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'}), 400
+    
+    try:
+        stems = parse_stems(request.form.get('stems'))
+        preview = parse_preview(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Get parameters - default to htdemucs_ft.yaml
+    model = request.form.get('model', 'htdemucs_ft.yaml')
+    if not model_registry.is_supported(model.split()[0].strip() if model else model):
+        return jsonify({'error': f'Model {model} is not supported by audio-separator'}), 400
+    
+    try:
+        # Generate a unique ID for this separation job
+        job_id = str(uuid.uuid4())
+        job_dir = os.path.join(OUTPUT_FOLDER, job_id)
+        
+        if upload_id:
+            # The chunked upload was hashed as it arrived; just move it into place
+            filename = upload['filename']
+            filepath = os.path.join(UPLOAD_FOLDER, f"{job_id}_{filename}")
+            try:
+                content_hash = chunked_uploads.consume(upload_id, filepath)
+            except UploadError as e:
+                return upload_error_response(e)
+        else:
+            # Save the uploaded file, hashing it on the way to disk
+            filename = secure_filename(file.filename)
+            filepath = os.path.join(UPLOAD_FOLDER, f"{job_id}_{filename}")
+            with metrics.timer('separator_stage_seconds', stage='upload_save'):
+                content_hash, _ = save_upload_with_hash(file, filepath)
+        options = {'long_input': request.form.get('long_input', 'false').lower() == 'true'}
+        if stems:
+            options['stems'] = stems
+        
+        # Identical uploads with the same model and options share one result
+        cache_model = model.split()[0].strip() if model else model
+        cache_key = ResultCache.make_key(
+            content_hash, cache_model, dict(options, output_format=SEPARATOR_OUTPUT_FORMAT)
+        )
+        cache_state, inflight_job_id = result_cache.claim(cache_key, job_id)
+        metrics.inc('separator_cache_requests_total', cache='result', result=cache_state)
+        
+        if cache_state == 'hit':
+            # A cached full result makes a preview pointless
+            os.makedirs(job_dir, exist_ok=True)
+            if complete_from_cache(job_id, cache_key, filepath, job_dir):
+                return jsonify({
+                    'job_id': job_id,
+                    'message': 'Separation served from cache',
+                    'status': 'completed',
+                    'cached': True
+                })
+            # The entry was evicted since the lookup, so separate the audio after all
+            cache_state, inflight_job_id = result_cache.claim_producer(cache_key, job_id)
+        
+        if cache_state == 'inflight':
+            # Attach to the job that is already separating this audio
+            os.remove(filepath)
+            shutil.rmtree(job_dir, ignore_errors=True)
+            print(f"Upload matches in-flight job {inflight_job_id}, attaching to it")
+            metrics.inc('separator_jobs_total', outcome='deduplicated')
+            return jsonify({
+                'job_id': inflight_job_id,
+                'message': 'Identical separation already in progress',
+                'status': 'processing',
+                'deduplicated': True
+            })
+        
+        os.makedirs(job_dir, exist_ok=True)
+        
+        job_args = [job_id, filepath, model, job_dir, cache_key, options]
+        linked = {}
+        if preview:
+            offset, seconds, full_job = preview
+            preview_job_id = str(uuid.uuid4())
+            try:
+                submit_preview(preview_job_id, job_id, filepath, filename, model, options, offset, seconds)
+            except (SchedulerQueueFull, SchedulerUnavailable) as e:
+                result_cache.release(cache_key, job_id)
+                os.remove(filepath)
+                shutil.rmtree(job_dir)
+                metrics.inc('separator_jobs_total', outcome='rejected')
+                return scheduler_rejection(e)
+            except OSError as e:
+                result_cache.release(cache_key, job_id)
+                os.remove(filepath)
+                shutil.rmtree(job_dir)
+                return jsonify({'error': f'Could not prepare the preview excerpt: {str(e)}'}), 500
+            linked['preview_job_id'] = preview_job_id
+            
+            if full_job == 'confirm':
+                # Identical uploads must not wait on a job that may never start
+                result_cache.release(cache_key, job_id)
+                hold_job(job_id, job_args, **linked)
+                return jsonify({
+                    'job_id': job_id,
+                    'preview_job_id': preview_job_id,
+                    'message': 'Preview queued; the full track waits for POST /api/jobs/<job_id>/start',
+                    'status': 'awaiting_confirmation'
+                })
+        
+        # Initialize progress tracking
+        update_progress(
+            job_id,
+            replace=True,
+            progress=5,
+            status='File uploaded',
+            complete=False,
+            error=None,
+            **linked
+        )
+        
+        # Hand the job to the scheduler so only MAX_CONCURRENT_JOBS run at once.
+        # Cache hits above never take a slot, so admission is checked only now.
+        try:
+            submit_job(job_id, 'separate', job_args)
+        except (SchedulerQueueFull, SchedulerUnavailable) as e:
+            result_cache.release(cache_key, job_id)
+            if linked:
+                # The preview is already queued, so keep the full track for the client to start later
+                hold_job(job_id, job_args, **linked)
+                return jsonify({
+                    'job_id': job_id,
+                    'preview_job_id': linked['preview_job_id'],
+                    'message': f'Preview queued; the full track was not ({str(e)}) and waits for POST /api/jobs/<job_id>/start',
+                    'status': 'awaiting_confirmation'
+                })
+            remove_progress(job_id)
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            if os.path.exists(job_dir):
+                shutil.rmtree(job_dir)
+            metrics.inc('separator_jobs_total', outcome='rejected')
+            return scheduler_rejection(e)
+        
+        # Return the job ID immediately so the client can check progress
+        queued = get_job(job_id) or {}
+        return jsonify(dict({
+            'job_id': job_id,
+            'message': 'Separation process queued',
+            'status': 'queued',
+            'queue_position': queued.get('queue_position'),
+            'estimated_start': queued.get('estimated_start')
+        }, **linked))
+    
+    except Exception as e:
+        print(f"Unexpected error in separate_audio: {str(e)}")
+        
+        # Clean up on error
+        if 'cache_key' in locals():
+            result_cache.release(cache_key, job_id)
+        if 'filepath' in locals() and os.path.exists(filepath):
+            os.remove(filepath)
+        if 'job_dir' in locals() and os.path.exists(job_dir):
+            shutil.rmtree(job_dir)
+            
+        return jsonify({'error': f"Unexpected error: {str(e)}"}), 500
+
+@app.route('/api/progress/<job_id>', methods=['GET'])
+def get_progress(job_id):
+    """Get progress of a separation job.
+
+    With ?since=<version> the request long-polls until the job's progress is
+    newer than that version (or ?timeout= seconds pass).
+    """
+    note_job_polled(job_id)
+    since = request.args.get('since', type=int)
+    if since is not None:
+        timeout = min(request.args.get('timeout', 25, type=float), PROGRESS_LONG_POLL_MAX_TIMEOUT)
+        version, payload = wait_for_progress(job_id, since, timeout)
+    else:
+        version, payload = get_progress_snapshot(job_id)
+    
+    if payload is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return Response(payload, mimetype='application/json')
+
+@app.route('/api/progress/<job_id>/stream', methods=['GET'])
+def stream_progress(job_id):
+    """Stream progress of a separation job as Server-Sent Events"""
+    version, payload = get_progress_snapshot(job_id)
+    if payload is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    # Resume after the last event a reconnecting EventSource received
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    since = last_event_id if last_event_id is not None else -1
+    
+    def generate():
+        last_version = since
+        while True:
+            # An open stream counts as following the job
+            note_job_polled(job_id)
+            version, payload = wait_for_progress(job_id, last_version, PROGRESS_STREAM_HEARTBEAT)
+            if payload is None:
+                yield 'event: gone\ndata: {}\n\n'
+                return
+            if version == last_version:
+                yield ': keep-alive\n\n'
+                continue
+            last_version = version
+            yield f'id: {version}\ndata: {payload}\n\n'
+            if json.loads(payload).get('complete'):
+                return
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    # no-transform stops proxies (including the dev server's) from buffering the stream
+    response.headers['Cache-Control'] = 'no-cache, no-transform'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/result/<job_id>', methods=['GET'])
+def get_result(job_id):
+    """Get result of a completed separation job"""
+    note_job_polled(job_id)
+    progress = get_job(job_id)
+    if progress is not None and progress['complete']:
+        # Cancelled jobs have no outputs left
+        if progress.get('cancelled'):
+            return jsonify({
+                'job_id': job_id,
+                'success': False,
+                'cancelled': True,
+                'error': progress['error']
+            }), 410
+        
+        # If job completed with an error
+        if progress['error']:
+            return jsonify({
+                'job_id': job_id,
+                'success': False,
+                'error': progress['error']
+            }), 500
+        
+        # If job completed successfully, its manifest describes the stems, together with how far
+        # each rendition has got. It is revalidated on every use (cheaply, by ETag), so clients
+        # notice renditions becoming ready and the job's outputs being deleted.
+        manifest = load_manifest(job_id)
+        if manifest is None:
+            return jsonify({'job_id': job_id, 'success': False, 'error': 'Job outputs were deleted'}), 410
+        result = json.loads(manifest[0])
+        result['renditions'] = get_rendition_statuses(job_id, result['output_files'], progress.get('renditions', {}))
+        data = json.dumps(result, sort_keys=True).encode('utf-8')
+        response = Response(data, mimetype='application/json')
+        response.set_etag(hashlib.sha256(data).hexdigest())
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    
+    elif progress is not None:
+        return jsonify({
+            'job_id': job_id,
+            'success': False,
+            'message': 'Job still in progress',
+            'status': progress['status'],
+            'progress': progress['progress']
+        }), 202
+    
+    else:
+        return jsonify({'error': 'Job not found'}), 404
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    """Cancel a queued or running job or batch: its processes are stopped and its partial outputs and upload deleted"""
+    progress = get_job(job_id)
+    if progress is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if progress.get('batch_id'):
+        return jsonify({'error': 'Tracks are cancelled with their batch', 'batch_id': progress['batch_id']}), 409
+    if progress.get('complete'):
+        return jsonify({'error': 'Job already finished'}), 409
+    if progress.get('awaiting_confirmation') and discard_held_job(job_id, 'cancelled by the client'):
+        print(f"Cancelled held job {job_id}")
+        return jsonify({'job_id': job_id, 'status': 'cancelled'})
+    if not cancel_job(job_id, 'cancelled by the client'):
+        return jsonify({'error': 'Job is already finishing'}), 409
+    print(f"Cancelling job {job_id}")
+    return jsonify({'job_id': job_id, 'status': 'cancelling'}), 202
+
+@app.route('/api/jobs/<job_id>/start', methods=['POST'])
+def start_held_job(job_id):
+    """Start the full-track separation of a preview request made with full_job=confirm"""
+    progress = get_job(job_id)
+    if progress is None:
+        return jsonify({'error': 'Job not found'}), 404
+    args = take_held_job(job_id) if progress.get('awaiting_confirmation') else None
+    if args is None:
+        return jsonify({'error': 'Job is not waiting to be started'}), 409
+    _, filepath, model, job_dir, cache_key, options = args
+    linked = {'preview_job_id': progress.get('preview_job_id')}
+    
+    # The same audio may have been separated or started since the preview
+    cache_state, _ = result_cache.claim(cache_key, job_id)
+    metrics.inc('separator_cache_requests_total', cache='result', result=cache_state)
+    if cache_state == 'hit':
+        if complete_from_cache(job_id, cache_key, filepath, job_dir, **linked):
+            return jsonify(dict({
+                'job_id': job_id,
+                'message': 'Separation served from cache',
+                'status': 'completed',
+                'cached': True
+            }, **linked))
+        # The entry was evicted since the lookup, so separate the audio after all
+        cache_state, _ = result_cache.claim_producer(cache_key, job_id)
+    job_args = list(args)
+    if cache_state == 'inflight':
+        # This job already has its own upload and id, so it separates independently
+        job_args[4] = None
+    
+    update_progress(
+        job_id,
+        replace=True,
+        progress=5,
+        status='File uploaded',
+        complete=False,
+        error=None,
+        **linked
+    )
+    try:
+        submit_job(job_id, 'separate', job_args)
+    except (SchedulerQueueFull, SchedulerUnavailable) as e:
+        if cache_state == 'miss':
+            result_cache.release(cache_key, job_id)
+        hold_job(job_id, args, **linked)
+        return scheduler_rejection(e)
+    
+    print(f"Started held job {job_id}")
+    queued = get_job(job_id) or {}
+    return jsonify(dict({
+        'job_id': job_id,
+        'message': 'Separation process queued',
+        'status': 'queued',
+        'queue_position': queued.get('queue_position'),
+        'estimated_start': queued.get('estimated_start')
+    }, **linked))
+
+class RenditionCache:
+    """Disk cache of transcoded stems with LRU eviction and single-flight conversion.
+
+    Renditions live in <folder>/<job_id>/<key>.<format>, where the key covers the
+    source file (name, size, mtime), the format and the encoder settings, so a
+    changed stem or encoder setting never serves a stale file. Concurrent
+    requests for a rendition that is being converted wait for that conversion.
+    Besides download formats it holds each stem's preview and waveform peaks,
+    and mixes of several stems, whose key covers every source and the gains.
+
+    The files themselves are the index, so every server process sees the same
+    cache: a rendition's access time is its LRU clock, and file locks make one
+    process convert a rendition and one process at a time evict.
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.evict_lock_path = os.path.join(folder, '.evict.lock')
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _file_lock(path):
+        """Hold an exclusive lock on path, shared by every thread and process"""
+        with open(path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _touch(path):
+        """Mark a rendition as used now; returns False if it is not on disk"""
+        try:
+            stat = os.stat(path)
+            # Only the access time changes, so ETags derived from the mtime stay valid
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def rendition_path(self, job_id, filename, requested_format, variant=None):
+        """Return (source path, cache path) of a rendition.
+
+        filename may be a list of stems for a rendition made from several of them,
+        which then has a list of source paths; variant holds its further settings.
+        """
+        if isinstance(filename, list):
+            source_path = [os.path.join(OUTPUT_FOLDER, job_id, name) for name in filename]
+            sources = []
+            for name, path in zip(filename, source_path):
+                stat = os.stat(path)
+                sources.append([name, stat.st_size, stat.st_mtime_ns])
+            key_data = json.dumps([sources, requested_format, RENDITION_SETTINGS_TAGS[requested_format], variant])
+        else:
+            source_path = os.path.join(OUTPUT_FOLDER, job_id, filename)
+            stat = os.stat(source_path)
+            key_data = json.dumps([filename, stat.st_size, stat.st_mtime_ns, requested_format, RENDITION_SETTINGS_TAGS[requested_format]])
+        key = hashlib.sha256(key_data.encode('utf-8')).hexdigest()[:32]
+        return source_path, os.path.join(self.folder, job_id, f"{key}.{requested_format}")
+
+    def lookup(self, job_id, filename, requested_format, variant=None):
+        """Return the path of a ready rendition, or None"""
+        _, path = self.rendition_path(job_id, filename, requested_format, variant)
+        return path if self._touch(path) else None
+
+    def contains(self, job_id, filename, requested_format, variant=None):
+        """Whether a rendition is ready, without marking it as used"""
+        _, path = self.rendition_path(job_id, filename, requested_format, variant)
+        return os.path.exists(path)
+
+    def get(self, job_id, filename, requested_format, produce=None, variant=None):
+        """Return the path of a rendition, converting it first if needed.
+
+        produce(source_path, output_path) replaces the default FFmpeg conversion.
+        """
+        source_path, path = self.rendition_path(job_id, filename, requested_format, variant)
+        if self._touch(path):
+            metrics.inc('separator_cache_requests_total', cache='rendition', result='hit')
+            return path
+        metrics.inc('separator_cache_requests_total', cache='rendition', result='miss')
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Whoever gets the lock first converts; the others then find the file ready
+        # (or, if that conversion failed, try it themselves)
+        with self._file_lock(f"{path}.lock"):
+            if self._touch(path):
+                return path
+            temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            try:
+                if produce:
+                    produce(source_path, temp_path)
+                else:
+                    transcode_audio(source_path, temp_path, requested_format)
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        self._evict()
+        return path
+
+    def add(self, job_id, filename, requested_format, temp_path):
+        """Move a rendition that was produced alongside another one into the cache"""
+        _, path = self.rendition_path(job_id, filename, requested_format)
+        os.replace(temp_path, path)
+        self._evict()
+
+    def _evict(self):
+        """Delete least recently used renditions until the cache fits in max_bytes"""
+        with self._file_lock(self.evict_lock_path):
+            now = time.time()
+            renditions = []
+            total_bytes = 0
+            for job_id in os.listdir(self.folder):
+                job_folder = os.path.join(self.folder, job_id)
+                if not os.path.isdir(job_folder):
+                    continue
+                try:
+                    entries = list(os.scandir(job_folder))
+                except FileNotFoundError:
+                    continue
+                for entry in entries:
+                    if entry.name.endswith('.lock'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                        if entry.name.endswith('.tmp'):
+                            if now - stat.st_mtime > RENDITION_TEMP_MAX_AGE:
+                                os.remove(entry.path)
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    renditions.append((stat.st_atime, entry.path, stat.st_size))
+                    total_bytes += stat.st_size
+            for last_used, path, size in sorted(renditions):
+                if total_bytes <= self.max_bytes or now - last_used < RENDITION_EVICT_GRACE_SECONDS:
+                    break
+                total_bytes -= size
+                for stale_path in (path, f"{path}.lock"):
+                    try:
+                        os.remove(stale_path)
+                    except OSError:
+                        pass
+
+    def remove_job(self, job_id):
+        """Drop every rendition of a job"""
+        shutil.rmtree(os.path.join(self.folder, job_id), ignore_errors=True)
+
+
+rendition_cache = RenditionCache(RENDITION_CACHE_FOLDER, RENDITION_CACHE_MAX_BYTES)
+
+def transcode_audio(source_path, output_path, requested_format):
+    """Convert an audio file with FFmpeg using the format's encoder settings"""
+    ffmpeg_cmd = [
+        shutil.which('ffmpeg') or 'ffmpeg',
+        '-i', source_path,
+        '-y'  # Overwrite output if exists
+    ]
+    ffmpeg_cmd.extend(FORMAT_ENCODER_ARGS[requested_format])
+    # Temp files end in .tmp, so name the container explicitly
+    ffmpeg_cmd.extend(['-f', FORMAT_CONTAINERS[requested_format], output_path])
+    with metrics.timer('separator_transcode_seconds', format=requested_format, mode='file'):
+        run_ffmpeg('transcode', ffmpeg_cmd, check=True, capture_output=True)
+
+def soft_limit(samples):
+    """Compress samples above MIX_LIMIT_THRESHOLD smoothly towards full scale, in place.
+
+    Returns how many samples were touched.
+    """
+    magnitude = np.abs(samples)
+    over = magnitude > MIX_LIMIT_THRESHOLD
+    count = int(np.count_nonzero(over))
+    if count:
+        headroom = 1.0 - MIX_LIMIT_THRESHOLD
+        samples[over] = np.sign(samples[over]) * (
+            MIX_LIMIT_THRESHOLD + headroom * np.tanh((magnitude[over] - MIX_LIMIT_THRESHOLD) / headroom)
+        )
+    return count
+
+def mix_stems(source_paths, gains, output_path, requested_format):
+    """Sum stems with per-stem gains and encode the result.
+
+    The stems are decoded and mixed one block at a time, so memory stays
+    bounded by the block size, not the track length. Stems shorter than the
+    others are treated as silence once they end.
+    """
+    ffmpeg_path = shutil.which('ffmpeg') or 'ffmpeg'
+    block_frames = int(MIX_BLOCK_SECONDS * SEGMENT_SAMPLE_RATE)
+    mix_started = time.time()
+    
+    encoder = popen_ffmpeg(
+        'mix',
+        [ffmpeg_path, '-nostdin', '-y', '-f', 'f32le', '-ar', str(SEGMENT_SAMPLE_RATE), '-ac', '2', '-i', 'pipe:0']
+        + FORMAT_ENCODER_ARGS[requested_format] + ['-f', FORMAT_CONTAINERS[requested_format], output_path],
+        stdin=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    decoders = []
+    try:
+        for source_path in source_paths:
+            decoders.append(popen_ffmpeg(
+                'mix',
+                [ffmpeg_path, '-nostdin', '-i', source_path, '-f', 'f32le', '-ar', str(SEGMENT_SAMPLE_RATE),
+                 '-ac', '2', 'pipe:1'],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL
+            ))
+        
+        mix = np.empty((block_frames, 2), dtype=np.float32)
+        active = list(zip(decoders, np.asarray(gains, dtype=np.float32)))
+        limited = 0
+        while active:
+            mix.fill(0)
+            length = 0
+            for decoder, gain in list(active):
+                frames = read_pcm_frames(decoder, block_frames)
+                if len(frames) < block_frames:
+                    active.remove((decoder, gain))
+                if len(frames):
+                    mix[:len(frames)] += gain * frames
+                    length = max(length, len(frames))
+            if length:
+                block = mix[:length]
+                limited += soft_limit(block)
+                encoder.stdin.write(block.tobytes())
+        
+        encoder.stdin.close()
+        if encoder.wait() != 0:
+            raise Exception(f"FFmpeg could not encode the mix as {requested_format}")
+        if limited:
+            print(f"Mix of {len(source_paths)} stems: limited {limited} samples to avoid clipping")
+        metrics.observe('separator_stage_seconds', time.time() - mix_started, stage='mix')
+    finally:
+        for process in decoders + [encoder]:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+def compute_peaks(process):
+    """Min/max peaks of the stereo PCM an FFmpeg process writes, at every PEAK_RESOLUTIONS level.
+
+    Returns (frames, {frames_per_peak: int8 array of interleaved min/max scaled to -127..127}).
+    """
+    finest = PEAK_RESOLUTIONS[0]
+    block_frames = finest * 4096
+    mins, maxes = [], []
+    frames = 0
+    while True:
+        block = read_pcm_frames(process, block_frames)
+        if len(block) == 0:
+            break
+        frames += len(block)
+        # Pad the last block to whole peaks with its final frame; each row is one peak of both channels
+        block = np.pad(block, ((0, -len(block) % finest), (0, 0)), mode='edge').reshape(-1, finest * 2)
+        mins.append(block.min(axis=1))
+        maxes.append(block.max(axis=1))
     
-    if not allowed_file(file.filename):
-        return jsonify({'error': f'File type not allowed. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'}), 400
+    base_min = np.concatenate(mins) if mins else np.zeros(0, dtype=np.float32)
+    base_max = np.concatenate(maxes) if maxes else np.zeros(0, dtype=np.float32)
+    levels = {}
+    for resolution in PEAK_RESOLUTIONS:
+        factor = resolution // finest
+        pad = -len(base_min) % factor if len(base_min) else 0
+        level_min = np.pad(base_min, (0, pad), mode='edge').reshape(-1, factor).min(axis=1)
+        level_max = np.pad(base_max, (0, pad), mode='edge').reshape(-1, factor).max(axis=1)
+        interleaved = np.stack([level_min, level_max], axis=1).ravel()
+        levels[resolution] = np.round(np.clip(interleaved, -1.0, 1.0) * 127).astype(np.int8)
+    return frames, levels
+
+def write_peaks_file(path, frames, levels):
+    """Store peaks as one JSON header line followed by the int8 peaks of every level"""
+    header = {'sample_rate': SEGMENT_SAMPLE_RATE, 'frames': frames, 'levels': []}
+    offset = 0
+    for resolution, peaks in levels.items():
+        header['levels'].append({'frames_per_peak': resolution, 'length': len(peaks) // 2, 'offset': offset})
+        offset += len(peaks)
+    with open(path, 'wb') as f:
+        f.write(json.dumps(header).encode('utf-8') + b'\n')
+        for peaks in levels.values():
+            f.write(peaks.tobytes())
+
+def read_peaks_file(path, choose_level):
+    """Read the header of a peaks file and the peaks of the level choose_level(levels) picks"""
+    with open(path, 'rb') as f:
+        header = json.loads(f.readline())
+        body_start = f.tell()
+        level = choose_level(header['levels'])
+        f.seek(body_start + level['offset'])
+        peaks = np.frombuffer(f.read(level['length'] * 2), dtype=np.int8)
+    return header, level, peaks
+
+def analyze_stem(job_id, filename, requested='peaks'):
+    """Decode a stem once into its waveform peaks and its preview rendition.
+
+    Both are kept in the rendition cache; returns the path of the requested one ('peaks' or 'preview').
+    """
+    def produce(source_path, output_path):
+        other = 'preview' if requested == 'peaks' else 'peaks'
+        paths = {requested: output_path, other: f"{output_path}.{other}.tmp"}
+        started = time.time()
+        process = popen_ffmpeg(
+            'analysis',
+            [shutil.which('ffmpeg') or 'ffmpeg', '-nostdin', '-y', '-i', source_path,
+             '-map', '0:a', *PREVIEW_ENCODER_ARGS, '-f', 'adts', paths['preview'],
+             '-map', '0:a', '-f', 'f32le', '-ar', str(SEGMENT_SAMPLE_RATE), '-ac', '2', 'pipe:1'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            frames, levels = compute_peaks(process)
+            if process.wait() != 0:
+                raise Exception(f"FFmpeg failed to analyze {filename}")
+            write_peaks_file(paths['peaks'], frames, levels)
+            rendition_cache.add(job_id, filename, other, paths[other])
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            if os.path.exists(paths[other]):
+                os.remove(paths[other])
+        metrics.observe('separator_stage_seconds', time.time() - started, stage='analysis')
     
+    return rendition_cache.get(job_id, filename, requested, produce)
+
+pretranscode_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=max(1, PRETRANSCODE_CONCURRENCY),
+    thread_name_prefix='pretranscode'
+)
+pretranscode_lock = threading.Lock()
+
+def set_rendition_status(job_id, filename, requested_format, status):
+    """Record the pre-transcoding status of one stem rendition in the job's progress"""
+    with pretranscode_lock:
+        if job_id not in progress_data:
+            return
+        renditions = json.loads(json.dumps(progress_data[job_id].get('renditions', {})))
+        renditions.setdefault(filename, {})[requested_format] = status
+        update_progress(job_id, renditions=renditions)
+
+def pretranscode_rendition(job_id, filename, requested_format):
+    """Encode one stem rendition into the rendition cache"""
+    set_rendition_status(job_id, filename, requested_format, 'encoding')
     try:
-        # Generate a unique ID for this separation job
-        job_id = str(uuid.uuid4())
-        job_dir = os.path.join(OUTPUT_FOLDER, job_id)
-        os.makedirs(job_dir, exist_ok=True)
-        
-        # Save the uploaded file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, f"{job_id}_{filename}")
-        file.save(filepath)
+        rendition_cache.get(job_id, filename, requested_format)
+        set_rendition_status(job_id, filename, requested_format, 'ready')
+    except Exception as e:
+        print(f"Pre-transcoding {filename} to {requested_format} failed: {str(e)}")
+        set_rendition_status(job_id, filename, requested_format, 'failed')
+
+def pretranscode_analysis(job_id, filename):
+    """Compute one stem's waveform peaks and preview into the rendition cache"""
+    for kind in ('peaks', 'preview'):
+        set_rendition_status(job_id, filename, kind, 'encoding')
+    try:
+        analyze_stem(job_id, filename)
+        status = 'ready'
+    except Exception as e:
+        print(f"Analyzing {filename} failed: {str(e)}")
+        status = 'failed'
+    for kind in ('peaks', 'preview'):
+        set_rendition_status(job_id, filename, kind, status)
+
+def schedule_pretranscode(job_id, output_files):
+    """Queue the peaks and preview of every stem and its encodes into PRETRANSCODE_FORMATS after a job completes"""
+    for filename in output_files:
+        if STEM_ANALYSIS:
+            if rendition_cache.lookup(job_id, filename, 'peaks') and rendition_cache.lookup(job_id, filename, 'preview'):
+                for kind in ('peaks', 'preview'):
+                    set_rendition_status(job_id, filename, kind, 'ready')
+            else:
+                for kind in ('peaks', 'preview'):
+                    set_rendition_status(job_id, filename, kind, 'queued')
+                pretranscode_executor.submit(pretranscode_analysis, job_id, filename)
         
-        # Initialize progress tracking
-        progress_data[job_id] = {
-            'progress': 5,
-            'status': 'File uploaded',
-            'complete': False,
-            'error': None
+        original_ext = filename.rsplit('.', 1)[-1].lower()
+        for requested_format in PRETRANSCODE_FORMATS:
+            if requested_format == original_ext or requested_format not in FORMAT_ENCODER_ARGS:
+                continue
+            if rendition_cache.lookup(job_id, filename, requested_format):
+                set_rendition_status(job_id, filename, requested_format, 'ready')
+                continue
+            set_rendition_status(job_id, filename, requested_format, 'queued')
+            pretranscode_executor.submit(pretranscode_rendition, job_id, filename, requested_format)
+
+def get_rendition_statuses(job_id, output_files, recorded):
+    """Per-stem, per-format rendition status: queued, encoding, ready, failed or on_demand"""
+    statuses = {}
+    for filename in output_files:
+        original_ext = filename.rsplit('.', 1)[-1].lower()
+        statuses[filename] = {}
+        for requested_format in list(FORMAT_ENCODER_ARGS) + ['preview', 'peaks']:
+            if requested_format == original_ext:
+                continue
+            status = recorded.get(filename, {}).get(requested_format)
+            if status is None:
+                try:
+                    ready = rendition_cache.contains(job_id, filename, requested_format)
+                except FileNotFoundError:
+                    ready = False
+                status = 'ready' if ready else 'on_demand'
+            statuses[filename][requested_format] = status
+    return statuses
+
+def probe_audio(path, ffmpeg_path=None):
+    """Duration, sample rate, channel count and codec of an audio file, None where it cannot be probed"""
+    info = {'duration': None, 'sample_rate': None, 'channels': None, 'codec': None}
+    ffprobe_path = find_ffprobe(ffmpeg_path)
+    if not ffprobe_path:
+        return info
+    try:
+        result = run_ffmpeg(
+            'probe',
+            [ffprobe_path, '-v', 'error', '-select_streams', 'a:0',
+             '-show_entries', 'stream=codec_name,sample_rate,channels:format=duration', '-of', 'json', path],
+            capture_output=True, text=True, check=True, timeout=30
+        )
+        probed = json.loads(result.stdout)
+        stream = (probed.get('streams') or [{}])[0]
+        if probed.get('format', {}).get('duration'):
+            info['duration'] = round(float(probed['format']['duration']), 3)
+        if stream.get('sample_rate'):
+            info['sample_rate'] = int(stream['sample_rate'])
+        info['channels'] = stream.get('channels')
+        info['codec'] = stream.get('codec_name')
+    except (subprocess.SubprocessError, ValueError, OSError, AttributeError):
+        pass
+    return info
+
+def stem_url(job_id, checksum, filename):
+    """Content-addressed URL of a stem: it names the exact bytes served, so it never changes meaning"""
+    return f"/api/stems/{job_id}/{checksum}/{urllib.parse.quote(filename)}"
+
+def write_manifest(job_id, output_files=None, ffmpeg_path=None):
+    """Describe a finished job's stems in its manifest file, which never changes afterwards.
+
+    Each stem is listed with its size, checksum, duration, sample rate, channels,
+    codec, content-addressed URL and the URLs of its renditions. The manifest has
+    no timestamps, so writing it twice gives the same bytes.
+    """
+    job_dir = os.path.join(OUTPUT_FOLDER, job_id)
+    if output_files is None:
+        output_files = list_output_files(job_id)
+    stems = []
+    for filename in sorted(output_files):
+        path = os.path.join(job_dir, filename)
+        checksum = file_sha256(path)
+        url = stem_url(job_id, checksum, filename)
+        original_ext = filename.rsplit('.', 1)[-1].lower()
+        renditions = {
+            requested_format: f"{url}?format={requested_format}&v={RENDITION_SETTINGS_TAGS[requested_format]}"
+            for requested_format in FORMAT_ENCODER_ARGS if requested_format != original_ext
         }
+        renditions['preview'] = f"/api/preview/{job_id}/{urllib.parse.quote(filename)}"
+        renditions['peaks'] = f"/api/peaks/{job_id}/{urllib.parse.quote(filename)}"
+        stems.append(dict(
+            filename=filename,
+            size=os.path.getsize(path),
+            sha256=checksum,
+            url=url,
+            renditions=renditions,
+            **probe_audio(path, ffmpeg_path)
+        ))
+    
+    data = json.dumps({
+        'job_id': job_id,
+        'success': True,
+        'message': 'Separation completed successfully',
+        'output_files': [stem['filename'] for stem in stems],
+        'stems': stems,
+        'rendition_settings': RENDITION_SETTINGS_TAGS
+    }, sort_keys=True).encode('utf-8')
+    manifest_path = os.path.join(job_dir, MANIFEST_FILENAME)
+    temp_path = f"{manifest_path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, manifest_path)
+    return data
+
+@functools.lru_cache(maxsize=1024)
+def read_manifest(path, mtime_ns):
+    """(JSON bytes, strong ETag, {filename: sha256}, rendition settings tags) of a manifest file, cached per file version"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    manifest = json.loads(data)
+    checksums = {stem['filename']: stem['sha256'] for stem in manifest['stems']}
+    return data, hashlib.sha256(data).hexdigest(), checksums, manifest.get('rendition_settings')
+
+def load_manifest(job_id):
+    """A finished job's manifest as read_manifest returns it, or None if its outputs are gone.
+
+    Jobs served from the result cache, and jobs that finished before manifests
+    existed, get theirs on first use. A manifest whose rendition URLs were made
+    with other encoder settings is written again.
+    """
+    path = os.path.join(OUTPUT_FOLDER, job_id, MANIFEST_FILENAME)
+    try:
+        manifest = read_manifest(path, os.stat(path).st_mtime_ns)
+        if manifest[3] == RENDITION_SETTINGS_TAGS:
+            return manifest
+    except FileNotFoundError:
+        pass
+    if not os.path.isdir(os.path.join(OUTPUT_FOLDER, job_id)):
+        return None
+    write_manifest(job_id)
+    return read_manifest(path, os.stat(path).st_mtime_ns)
+
+
+def build_download_name(job_id, filename):
+    """Build the user-facing name of a stem, e.g. "Song-Vocals", without extension"""
+    # Extract the original filename without the job_id prefix and extension
+    original_filename = filename
+    if original_filename.startswith(job_id):
+        # Remove the job_id prefix and the underscore
+        original_filename = original_filename[len(job_id) + 1:]
         
-        # Get parameters - default to htdemucs_ft.yaml
-        model = request.form.get('model', 'htdemucs_ft.yaml')
-        
-        # Create a queue for the thread to return results
-        result_queue = queue.Queue()
+    # Extract stem type from the filename
+    stem_suffix = ""
+    if '(Vocals)' in filename:
+        stem_suffix = "-Vocals"
+    elif '(Instrumental)' in filename:
+        stem_suffix = "-Instrumental"
+    elif '(Drums)' in filename:
+        stem_suffix = "-Drums"
+    elif '(Bass)' in filename:
+        stem_suffix = "-Bass"
+    elif '(Other)' in filename:
+        stem_suffix = "-Other"
         
-        # Start processing in a separate thread to not block the response
-        processing_thread = threading.Thread(
-            target=process_audio_in_thread,
-            args=(job_id, filepath, model, job_dir, result_queue)
-        )
-        processing_thread.daemon = True
-        processing_thread.start()
+    # Remove any existing stem markers from the original filename
+    clean_name = original_filename
+    for marker in ['(Vocals)', '(Instrumental)', '(Drums)', '(Bass)', '(Other)']:
+        clean_name = clean_name.replace(marker, '')
         
-        # Return the job ID immediately so the client can check progress
-        return jsonify({
-            'job_id': job_id,
-            'message': 'Separation process started',
-            'status': 'processing'
-        })
+    # Remove "htdemucs_ft" from the filename if present
+    clean_name = clean_name.replace("htdemucs_ft_", "").replace("_htdemucs_ft", "")
+    clean_name = clean_name.replace("htdemucs_ft.", ".")
+    clean_name = clean_name.replace("htdemucs_ft", "")
     
-    except Exception as e:
-        print(f"Unexpected error in separate_audio: {str(e)}")
+    # Remove the extension from clean_name to avoid duplicating it
+    if '.' in clean_name:
+        clean_name = clean_name.rsplit('.', 1)[0]
         
-        # Clean up on error
-        if 'filepath' in locals() and os.path.exists(filepath):
-            os.remove(filepath)
-        if 'job_dir' in locals() and os.path.exists(job_dir):
-            shutil.rmtree(job_dir)
-            
-        return jsonify({'error': f"Unexpected error: {str(e)}"}), 500
+    # Clean up any double spaces or underscores that might have been introduced
+    clean_name = clean_name.replace('  ', ' ').replace('__', '_')
+    
+    return f"{clean_name}{stem_suffix}"
 
-@app.route('/api/progress/<job_id>', methods=['GET'])
-def get_progress(job_id):
-    """Get progress of a separation job"""
-    if job_id in progress_data:
-        return jsonify(progress_data[job_id])
-    else:
-        return jsonify({'error': 'Job not found'}), 404
+def send_audio_file(path, download_filename, mimetype, etag=None, max_age=0):
+    """Send a stem or rendition with Range (206) and strong ETag/If-None-Match (304) support.
 
-@app.route('/api/result/<job_id>', methods=['GET'])
-def get_result(job_id):
-    """Get result of a completed separation job"""
-    if job_id in progress_data and progress_data[job_id]['complete']:
-        # If job completed with an error
-        if progress_data[job_id]['error']:
-            return jsonify({
-                'job_id': job_id,
-                'success': False,
-                'error': progress_data[job_id]['error']
-            }), 500
+    Content-addressed files pass their own etag and a max_age, and are marked immutable.
+    """
+    if etag is None:
+        stat = os.stat(path)
+        etag = hashlib.sha1(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8')).hexdigest()
+    response = send_file(
+        path,
+        as_attachment=True,
+        download_name=download_filename,
+        mimetype=mimetype,
+        conditional=True,
+        etag=etag,
+        max_age=max_age
+    )
+    if max_age:
+        response.cache_control.immutable = True
+    
+    # Add additional headers to help with download issues
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+def stream_transcode(source_path, download_filename, requested_format):
+    """Pipe FFmpeg output straight into a chunked response instead of waiting for a file"""
+    ffmpeg_cmd = [
+        shutil.which('ffmpeg') or 'ffmpeg',
+        '-nostdin',
+        '-i', source_path
+    ]
+    ffmpeg_cmd.extend(FORMAT_ENCODER_ARGS[requested_format])
+    ffmpeg_cmd.extend(['-f', FORMAT_CONTAINERS[requested_format], 'pipe:1'])
+    process = popen_ffmpeg('stream', ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    started = time.time()
+    
+    def generate():
+        try:
+            while True:
+                chunk = process.stdout.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+            process.wait()
+            metrics.observe('separator_transcode_seconds', time.time() - started, format=requested_format, mode='stream')
+        finally:
+            # The client may disconnect mid-stream; never leave ffmpeg running
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+    
+    response = Response(generate(), mimetype=FORMAT_MIMETYPES[requested_format])
+    response.headers.set('Content-Disposition', 'attachment', filename=download_filename)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+def directory_size(path):
+    """Total size in bytes of the files under a directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class RetentionManager:
+    """Evicts old job outputs and compacts finished progress entries.
+
+    Job directories are evicted once older than OUTPUT_TTL_SECONDS, or least
+    recently downloaded first while OUTPUT_FOLDER is above OUTPUT_QUOTA_BYTES.
+    A job directory's mtime is its last access, since downloads touch it.
+    Jobs that are queued, running or being downloaded are never evicted.
+    Downloads hold a shared lock on the job's DOWNLOAD_LOCK_FILENAME, which
+    eviction must take exclusively, so downloads served by any server process
+    protect the job, and a process that dies releases its locks with it.
+    """
+
+    def __init__(self):
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None or RETENTION_INTERVAL_SECONDS <= 0:
+            return
+        self.thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(RETENTION_INTERVAL_SECONDS)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Retention sweep failed: {str(e)}")
+
+    @staticmethod
+    def _open_download_lock(job_id, create=True):
+        """Open a job's download lock file, or return None if the job (or the file) does not exist"""
+        flags = os.O_RDONLY | (os.O_CREAT if create else 0)
+        try:
+            return os.fdopen(os.open(os.path.join(OUTPUT_FOLDER, job_id, DOWNLOAD_LOCK_FILENAME), flags, 0o644))
+        except OSError:
+            return None
+
+    def begin_download(self, job_id):
+        """Protect a job from eviction until end_download(lease) is called with the returned lease"""
+        lease = self._open_download_lock(job_id)
+        if lease is None:
+            return None
+        # Waits only while the job is being evicted; the download then finds its files gone
+        fcntl.flock(lease, fcntl.LOCK_SH)
+        try:
+            os.utime(os.path.join(OUTPUT_FOLDER, job_id))
+        except OSError:
+            pass
+        return lease
+
+    def end_download(self, lease):
+        if lease is not None:
+            lease.close()
+
+    def is_downloading(self, job_id):
+        """True while any server process is sending one of the job's files"""
+        guard = self._open_download_lock(job_id, create=False)
+        if guard is None:
+            return False
+        with guard:
+            try:
+                fcntl.flock(guard, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            return False
+
+    def is_running(self, job_id):
+        """True while a job is queued or running"""
+        progress = get_job(job_id)
+        return progress is not None and not progress.get('complete')
+
+    def list_jobs(self):
+        """(job_id, last_access, bytes) for every job directory, least recently used first"""
+        jobs = []
+        for job_id in os.listdir(OUTPUT_FOLDER):
+            job_dir = os.path.join(OUTPUT_FOLDER, job_id)
+            if not os.path.isdir(job_dir):
+                continue
+            try:
+                jobs.append((job_id, os.path.getmtime(job_dir), directory_size(job_dir)))
+            except OSError:
+                continue
+        return sorted(jobs, key=lambda job: job[1])
+
+    def evict_job(self, job_id):
+        """Delete a job's outputs, renditions and finished progress; returns False if protected"""
+        if self.is_running(job_id):
+            return False
+        guard = self._open_download_lock(job_id)
+        try:
+            if guard is not None:
+                try:
+                    fcntl.flock(guard, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            # Downloads that start now wait for the lock and then find the files gone
+            shutil.rmtree(os.path.join(OUTPUT_FOLDER, job_id), ignore_errors=True)
+        finally:
+            if guard is not None:
+                guard.close()
+        rendition_cache.remove_job(job_id)
+        remove_progress(job_id)
+        print(f"Evicted job {job_id}")
+        return True
+
+    def sweep(self, ttl_seconds=None, quota_bytes=None):
+        """Apply TTL and quota eviction, then compact progress entries; returns evicted job ids"""
+        ttl_seconds = OUTPUT_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        quota_bytes = OUTPUT_QUOTA_BYTES if quota_bytes is None else quota_bytes
+        now = time.time()
+        evicted = []
         
-        # If job completed successfully
-        output_files = []
-        job_dir = os.path.join(OUTPUT_FOLDER, job_id)
-        if os.path.exists(job_dir):
-            for f in os.listdir(job_dir):
-                if os.path.isfile(os.path.join(job_dir, f)):
-                    output_files.append(f)
+        jobs = self.list_jobs()
+        total_bytes = sum(size for _, _, size in jobs)
+        for job_id, last_access, size in jobs:
+            expired = ttl_seconds > 0 and now - last_access > ttl_seconds
+            over_quota = quota_bytes > 0 and total_bytes > quota_bytes
+            if not (expired or over_quota):
+                continue
+            if self.evict_job(job_id):
+                evicted.append(job_id)
+                total_bytes -= size
         
-        return jsonify({
-            'job_id': job_id,
-            'success': True,
-            'message': 'Separation completed successfully',
-            'output_files': output_files
-        })
-    
-    elif job_id in progress_data:
-        return jsonify({
-            'job_id': job_id,
-            'success': False,
-            'message': 'Job still in progress',
-            'status': progress_data[job_id]['status'],
-            'progress': progress_data[job_id]['progress']
-        }), 202
+        self.compact_progress(now)
+        self.remove_stale_uploads(now)
+        return evicted
+
+    def compact_progress(self, now):
+        """Drop long-finished progress entries and trim stored error text"""
+        for job_id, progress in list(progress_data.items()):
+            if not progress.get('complete'):
+                continue
+            finished_at = progress.get('finished_at') or now
+            if PROGRESS_TTL_SECONDS > 0 and now - finished_at > PROGRESS_TTL_SECONDS:
+                remove_progress(job_id)
+            elif progress.get('error') and len(progress['error']) > ERROR_TEXT_LIMIT:
+                update_progress(job_id, error=progress['error'][-ERROR_TEXT_LIMIT:])
+        if PROGRESS_TTL_SECONDS > 0:
+            job_store.purge_finished(now - PROGRESS_TTL_SECONDS)
+
+    def remove_stale_uploads(self, now):
+        """Delete chunked uploads nobody has written to, and held jobs nobody started, for UPLOAD_TTL_SECONDS"""
+        for name in os.listdir(UPLOAD_FOLDER):
+            if name.startswith('held_') and name.endswith('.json'):
+                try:
+                    held_since = os.path.getmtime(os.path.join(UPLOAD_FOLDER, name))
+                except OSError:
+                    continue
+                if now - held_since > UPLOAD_TTL_SECONDS:
+                    discard_held_job(name[len('held_'):-len('.json')], f'not started within {UPLOAD_TTL_SECONDS}s')
+                continue
+            if not (name.startswith('upload_') and name.endswith('.json')):
+                continue
+            upload_id = name[len('upload_'):-len('.json')]
+            data_path, _ = chunked_uploads._paths(upload_id)
+            try:
+                last_write = os.path.getmtime(data_path)
+            except OSError:
+                last_write = os.path.getmtime(os.path.join(UPLOAD_FOLDER, name))
+            if now - last_write > UPLOAD_TTL_SECONDS:
+                chunked_uploads.delete(upload_id)
+
+    def usage(self):
+        jobs = self.list_jobs()
+        downloading = [job_id for job_id, _, _ in jobs if self.is_downloading(job_id)]
+        return {
+            'outputs': {
+                'bytes': sum(size for _, _, size in jobs),
+                'jobs': len(jobs),
+                'quota_bytes': OUTPUT_QUOTA_BYTES,
+                'ttl_seconds': OUTPUT_TTL_SECONDS
+            },
+            'uploads': {'bytes': directory_size(UPLOAD_FOLDER)},
+            'result_cache': {'bytes': directory_size(RESULT_CACHE_FOLDER), 'max_bytes': RESULT_CACHE_MAX_BYTES},
+            'rendition_cache': {'bytes': directory_size(RENDITION_CACHE_FOLDER), 'max_bytes': RENDITION_CACHE_MAX_BYTES},
+            'progress_entries': len(progress_data),
+            'active_jobs': [job_id for job_id, progress in list(progress_data.items()) if not progress.get('complete')],
+            'active_downloads': downloading
+        }
+
+
+retention_manager = RetentionManager()
+
+def tracks_download(view):
+    """Protect a job from eviction while one of its files is being sent, and count the bytes"""
+    @functools.wraps(view)
+    def wrapper(job_id, *args, **kwargs):
+        lease = retention_manager.begin_download(job_id)
+        try:
+            response = app.make_response(view(job_id, *args, **kwargs))
+        except Exception:
+            retention_manager.end_download(lease)
+            raise
+        return track_download_response([lease], response)
+    return wrapper
+
+def track_download_response(leases, response):
+    """End the download protection leases once the response is closed, counting its bytes"""
+    def release():
+        for lease in leases:
+            retention_manager.end_download(lease)
     
+    body = response.response
+    if response.direct_passthrough:
+        # send_file bodies must reach the server unwrapped so it can use sendfile(), and
+        # werkzeug skips Response.close() hooks for them, so hook the body's own close()
+        sent_bytes = (response.content_length or 0) if request.method != 'HEAD' else 0
+        body_close = getattr(body, 'close', None)
+        
+        def close():
+            try:
+                if body_close is not None:
+                    body_close()
+            finally:
+                metrics.inc('separator_bytes_served_total', sent_bytes, kind='file')
+                release()
+        body.close = close
     else:
-        return jsonify({'error': 'Job not found'}), 404
+        def count_bytes():
+            for chunk in body:
+                metrics.inc('separator_bytes_served_total', len(chunk), kind='stream')
+                yield chunk
+        callbacks = [callback for callback in (getattr(body, 'close', None),) if callback]
+        callbacks.append(release)
+        response.response = ClosingIterator(count_bytes(), callbacks)
+    return response
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """Write-only sink for zipfile that hands out what has been written so far"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+zip_transcode_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=max(1, ZIP_TRANSCODE_CONCURRENCY),
+    thread_name_prefix='zip-transcode'
+)
+
+def list_output_files(job_id):
+    """List the stem files of a job"""
+    job_dir = os.path.join(OUTPUT_FOLDER, job_id)
+    if not os.path.isdir(job_dir):
+        return []
+    return sorted(
+        f for f in os.listdir(job_dir) if not f.startswith('.') and os.path.isfile(os.path.join(job_dir, f))
+    )
+
+def resolve_zip_member(job_id, filename, requested_format):
+    """Return (path, extension) of the file to put in the archive for one stem"""
+    original_ext = filename.split('.')[-1].lower()
+    if requested_format in FORMAT_ENCODER_ARGS and requested_format != original_ext:
+        try:
+            return rendition_cache.get(job_id, filename, requested_format), requested_format
+        except Exception as e:
+            # Fall back to original file if conversion fails
+            print(f"Conversion error: {str(e)}")
+    return os.path.join(OUTPUT_FOLDER, job_id, filename), original_ext
+
+@app.route('/api/download/<job_id>/all.zip', methods=['GET'])
+@tracks_download
+def download_all(job_id):
+    """Download every stem of a job as one ZIP archive built while it is sent"""
+    output_files = list_output_files(job_id)
+    if not output_files:
+        return jsonify({'error': 'Job not found or has no output files'}), 404
+    
+    archive_name = build_download_name(job_id, output_files[0])
+    for suffix in ['-Vocals', '-Instrumental', '-Drums', '-Bass', '-Other']:
+        if archive_name.endswith(suffix):
+            archive_name = archive_name[:-len(suffix)]
+    
+    members = [(job_id, filename, build_download_name(job_id, filename)) for filename in output_files]
+    return stream_zip_response(members, request.args.get('format', '').lower(), f"{archive_name}-stems.zip")
+
+def stream_zip_response(members, requested_format, download_filename):
+    """Stream a ZIP of (job_id, filename, name in archive without extension) stems, built while it is sent"""
+    # Convert the stems in parallel; they are appended in the order they finish
+    futures = {
+        zip_transcode_executor.submit(resolve_zip_member, job_id, filename, requested_format): member_name
+        for job_id, filename, member_name in members
+    }
+    
+    def generate():
+        sink = _ZipStreamBuffer()
+        with zipfile.ZipFile(sink, mode='w') as archive:
+            for future in concurrent.futures.as_completed(futures):
+                path, extension = future.result()
+                info = zipfile.ZipInfo(
+                    f"{futures[future]}.{extension}",
+                    date_time=time.localtime(os.path.getmtime(path))[:6]
+                )
+                info.compress_type = zipfile.ZIP_STORED if extension in ZIP_STORED_FORMATS else zipfile.ZIP_DEFLATED
+                size = os.path.getsize(path)
+                with open(path, 'rb') as source, archive.open(info, mode='w', force_zip64=size > 0x7FFFFFFF) as member:
+                    while True:
+                        chunk = source.read(STREAM_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        member.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+                yield sink.drain()
+        # Central directory
+        yield sink.drain()
+    
+    response = Response(generate(), mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=download_filename)
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
 
 @app.route('/api/download/<job_id>/<filename>', methods=['GET'])
+@tracks_download
 def download_file(job_id, filename):
-    """Download a processed file with format conversion"""
+    """Download a processed file with format conversion.
+
+    With ?stream=true a conversion that is not cached yet is streamed from
+    FFmpeg as it is encoded instead of being written to disk first.
+    """
+    return send_stem(job_id, filename)
+
+@app.route('/api/stems/<job_id>/<checksum>/<filename>', methods=['GET'])
+@tracks_download
+def download_stem(job_id, checksum, filename):
+    """Download a stem by the content-addressed URL in its job's manifest, cacheable for good"""
+    manifest = load_manifest(job_id)
+    if manifest is None or manifest[2].get(filename) != checksum:
+        return jsonify({'error': 'File not found'}), 404
+    return send_stem(job_id, filename, checksum)
+
+def send_stem(job_id, filename, checksum=None):
+    """Send a stem, or a rendition of it in ?format=.
+
+    With the stem's checksum the response is marked immutable, unless it had to
+    fall back to the original format or is streamed.
+    """
     try:
         # Don't use secure_filename here as it strips special characters like parentheses
         file_path = os.path.join(OUTPUT_FOLDER, job_id, filename)
@@ -490,146 +4909,363 @@ def download_file(job_id, filename):
         
         # Get requested format from query parameter (default to original format)
         requested_format = request.args.get('format', '').lower()
-        valid_formats = ['wav', 'mp3', 'flac', 'aac']
-        
-        # Extract the original filename without the job_id prefix and extension
-        original_filename = filename
-        if original_filename.startswith(job_id):
-            # Remove the job_id prefix and the underscore
-            original_filename = original_filename[len(job_id) + 1:]
+        stream = request.args.get('stream', 'false').lower() == 'true'
         
         # Extract original file extension
-        original_ext = original_filename.split('.')[-1].lower()
-            
-        # Extract stem type from the filename
-        stem_suffix = ""
-        if '(Vocals)' in filename:
-            stem_suffix = "-Vocals"
-        elif '(Instrumental)' in filename:
-            stem_suffix = "-Instrumental"
-        elif '(Drums)' in filename:
-            stem_suffix = "-Drums"
-        elif '(Bass)' in filename:
-            stem_suffix = "-Bass"
-        elif '(Other)' in filename:
-            stem_suffix = "-Other"
-            
-        # Remove any existing stem markers from the original filename
-        clean_name = original_filename
-        for marker in ['(Vocals)', '(Instrumental)', '(Drums)', '(Bass)', '(Other)']:
-            clean_name = clean_name.replace(marker, '')
-            
-        # Remove "htdemucs_ft" from the filename if present
-        clean_name = clean_name.replace("htdemucs_ft_", "").replace("_htdemucs_ft", "")
-        clean_name = clean_name.replace("htdemucs_ft.", ".")
-        clean_name = clean_name.replace("htdemucs_ft", "")
-        
-        # Remove the extension from clean_name to avoid duplicating it
-        if '.' in clean_name:
-            clean_name = clean_name.rsplit('.', 1)[0]
-            
-        # Clean up any double spaces or underscores that might have been introduced
-        clean_name = clean_name.replace('  ', ' ').replace('__', '_')
+        original_ext = filename.split('.')[-1].lower()
         
         # If format conversion is requested and valid
-        if requested_format in valid_formats and requested_format != original_ext:
-            # Create a temporary file for the converted output
-            fd, temp_path = tempfile.mkstemp(suffix=f'.{requested_format}')
-            os.close(fd)
-            
+        if requested_format in FORMAT_ENCODER_ARGS and requested_format != original_ext:
             try:
-                # Prepare the FFmpeg command
-                ffmpeg_cmd = [
-                    shutil.which('ffmpeg') or 'ffmpeg',
-                    '-i', file_path,
-                    '-y'  # Overwrite output if exists
-                ]
-                
-                # Add format-specific options
-                if requested_format == 'mp3':
-                    ffmpeg_cmd.extend(['-c:a', 'libmp3lame', '-q:a', '2'])
-                elif requested_format == 'aac':
-                    ffmpeg_cmd.extend(['-c:a', 'aac', '-b:a', '256k'])
-                elif requested_format == 'wav':
-                    ffmpeg_cmd.extend(['-c:a', 'pcm_s16le'])
-                elif requested_format == 'flac':
-                    ffmpeg_cmd.extend(['-c:a', 'flac'])
-                
-                # Add output path
-                ffmpeg_cmd.append(temp_path)
-                
-                # Run FFmpeg conversion
-                process = subprocess.run(ffmpeg_cmd, check=True, capture_output=True)
-                
                 # Construct the final filename with the new extension
-                download_filename = f"{clean_name}{stem_suffix}.{requested_format}"
-                
-                # Set appropriate MIME type
-                if requested_format == 'mp3':
-                    mimetype = 'audio/mpeg'
-                elif requested_format == 'aac':
-                    mimetype = 'audio/aac'
-                elif requested_format == 'wav':
-                    mimetype = 'audio/wav'
-                else:  # flac
-                    mimetype = 'audio/flac'
+                download_filename = f"{build_download_name(job_id, filename)}.{requested_format}"
                 
-                # Send the converted file
-                response = send_file(
-                    temp_path,
-                    as_attachment=True,
-                    download_name=download_filename,
-                    mimetype=mimetype
-                )
+                # Stream the encoder output when asked to and nothing is cached yet
+                if stream and not rendition_cache.lookup(job_id, filename, requested_format):
+                    return stream_transcode(file_path, download_filename, requested_format)
                 
-                # Add cleanup callback to remove temp file after response is sent
-                @response.call_on_close
-                def cleanup():
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
+                # Reuse a cached rendition or wait for the conversion already running
+                rendition_path = rendition_cache.get(job_id, filename, requested_format)
                 
-                # Add additional headers to help with download issues
-                response.headers['X-Content-Type-Options'] = 'nosniff'
-                response.headers['Access-Control-Expose-Headers'] = 'Content-Disposition'
-                return response
+                # Send the converted file; only a URL naming the current encoder settings is immutable
+                settings_tag = RENDITION_SETTINGS_TAGS[requested_format]
+                if checksum and request.args.get('v') == settings_tag:
+                    return send_audio_file(
+                        rendition_path, download_filename, FORMAT_MIMETYPES[requested_format],
+                        etag=f"{checksum}.{requested_format}.{settings_tag}", max_age=IMMUTABLE_MAX_AGE
+                    )
+                return send_audio_file(rendition_path, download_filename, FORMAT_MIMETYPES[requested_format])
                 
             except Exception as e:
-                # Clean up temp file if conversion fails
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
                 print(f"Conversion error: {str(e)}")
                 # Fall back to original file if conversion fails
                 pass
         
         # If no conversion was requested or conversion failed, send original file
         # Construct the final filename with the original extension
-        download_filename = f"{clean_name}{stem_suffix}.{original_ext}"
-        
-        # Set mimetype based on the original file extension
-        if original_ext == 'mp3':
-            mimetype = 'audio/mpeg'
-        elif original_ext == 'aac':
-            mimetype = 'audio/aac'
-        elif original_ext == 'wav':
-            mimetype = 'audio/wav'
-        else:  # flac or other
-            mimetype = 'audio/flac'
-        
-        response = send_file(
-            file_path,
-            as_attachment=True,
-            download_name=download_filename,
-            mimetype=mimetype
-        )
+        download_filename = f"{build_download_name(job_id, filename)}.{original_ext}"
         
-        # Add additional headers to help with download issues
-        response.headers['X-Content-Type-Options'] = 'nosniff'
-        response.headers['Access-Control-Expose-Headers'] = 'Content-Disposition'
-        return response
+        # Set mimetype based on the original file extension (flac or other by default)
+        mimetype = FORMAT_MIMETYPES.get(original_ext, 'audio/flac')
+        
+        # A requested conversion that failed must not be cached as if it were that format
+        if checksum and requested_format in ('', original_ext):
+            return send_audio_file(file_path, download_filename, mimetype, etag=checksum, max_age=IMMUTABLE_MAX_AGE)
+        return send_audio_file(file_path, download_filename, mimetype)
+    except FileNotFoundError:
+        # The job's outputs were deleted meanwhile
+        return jsonify({'error': 'File not found'}), 404
     except Exception as e:
         print(f"Error downloading file: {str(e)}")
         return jsonify({'error': f"Error downloading file: {str(e)}"}), 500
 
+@app.route('/api/preview/<job_id>/<filename>', methods=['GET'])
+@tracks_download
+def get_preview(job_id, filename):
+    """Send the low-bitrate AAC preview of a stem, for playback in the browser"""
+    if not os.path.exists(os.path.join(OUTPUT_FOLDER, job_id, filename)):
+        return jsonify({'error': 'File not found'}), 404
+    try:
+        preview_path = rendition_cache.lookup(job_id, filename, 'preview') or analyze_stem(job_id, filename, 'preview')
+        return send_audio_file(preview_path, f"{build_download_name(job_id, filename)}-preview.aac", 'audio/aac')
+    except FileNotFoundError:
+        # The job's outputs were deleted meanwhile
+        return jsonify({'error': 'File not found'}), 404
+    except Exception as e:
+        print(f"Error creating preview: {str(e)}")
+        return jsonify({'error': f"Error creating preview: {str(e)}"}), 500
+
+@app.route('/api/peaks/<job_id>/<filename>', methods=['GET'])
+@tracks_download
+def get_peaks(job_id, filename):
+    """Waveform peaks of a stem as interleaved min/max values scaled to -127..127.
+
+    ?width=<peaks> picks the coarsest resolution with at least that many peaks
+    (default 1000); ?frames_per_peak=<n> asks for one of PEAK_RESOLUTIONS.
+    """
+    if not os.path.exists(os.path.join(OUTPUT_FOLDER, job_id, filename)):
+        return jsonify({'error': 'File not found'}), 404
+    try:
+        width = int(request.args.get('width', '1000'))
+        frames_per_peak = int(request.args['frames_per_peak']) if 'frames_per_peak' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'width and frames_per_peak must be integers'}), 400
+    if frames_per_peak is not None and frames_per_peak not in PEAK_RESOLUTIONS:
+        return jsonify({'error': f"frames_per_peak must be one of {', '.join(map(str, PEAK_RESOLUTIONS))}"}), 400
+    
+    def choose_level(levels):
+        if frames_per_peak is not None:
+            return next(level for level in levels if level['frames_per_peak'] == frames_per_peak)
+        coarsest_first = sorted(levels, key=lambda level: -level['frames_per_peak'])
+        return next((level for level in coarsest_first if level['length'] >= width), coarsest_first[-1])
+    
+    try:
+        header, level, peaks = read_peaks_file(analyze_stem(job_id, filename), choose_level)
+    except Exception as e:
+        print(f"Error computing peaks: {str(e)}")
+        return jsonify({'error': f"Error computing peaks: {str(e)}"}), 500
+    return jsonify({
+        'sample_rate': header['sample_rate'],
+        'duration': round(header['frames'] / header['sample_rate'], 3),
+        'frames_per_peak': level['frames_per_peak'],
+        'length': level['length'],
+        'resolutions': [l['frames_per_peak'] for l in header['levels']],
+        'peaks': peaks.tolist()
+    })
+
+@app.route('/api/mix/<job_id>', methods=['GET'])
+@tracks_download
+def get_mix(job_id):
+    """Mix some of a job's stems into one file, e.g. ?stems=drums,bass,other&gains=1,0.8,1&format=mp3.
+
+    gains are linear factors, one per stem (default 1). Mixes are cached like
+    renditions, so a popular combination is produced only once.
+    """
+    stem_files = {}
+    for filename in list_output_files(job_id):
+        match = STEM_MARKER_PATTERN.search(filename)
+        if match:
+            stem_files[match.group(1).lower()] = (match.group(1), filename)
+    if not stem_files:
+        return jsonify({'error': 'Job not found or has no stems'}), 404
+    
+    stems = [stem.strip().lower() for stem in request.args.get('stems', '').split(',') if stem.strip()]
+    if not stems:
+        return jsonify({'error': f"stems is required, some of: {', '.join(sorted(stem_files))}"}), 400
+    unknown = [stem for stem in stems if stem not in stem_files]
+    if unknown or len(set(stems)) != len(stems):
+        return jsonify({'error': f"stems must be distinct stems of this job: {', '.join(sorted(stem_files))}"}), 400
+    try:
+        gains = [float(gain) for gain in request.args['gains'].split(',')] if 'gains' in request.args else [1.0] * len(stems)
+    except ValueError:
+        return jsonify({'error': 'gains must be numbers'}), 400
+    if len(gains) != len(stems) or not all(0 <= gain <= MIX_MAX_GAIN for gain in gains):
+        return jsonify({'error': f'gains must give one factor between 0 and {MIX_MAX_GAIN} per stem'}), 400
+    requested_format = request.args.get('format', 'flac').lower()
+    if requested_format not in FORMAT_ENCODER_ARGS:
+        return jsonify({'error': f"format must be one of {', '.join(FORMAT_ENCODER_ARGS)}"}), 400
+    
+    # The same stems and gains in another order make the same mix
+    chosen = sorted(zip(stems, [round(gain, 4) for gain in gains]))
+    filenames = [stem_files[stem][1] for stem, _ in chosen]
+    mix_gains = [gain for _, gain in chosen]
+    try:
+        mix_path = rendition_cache.get(
+            job_id, filenames, requested_format,
+            produce=lambda source_paths, output_path: mix_stems(source_paths, mix_gains, output_path, requested_format),
+            variant={'gains': mix_gains}
+        )
+    except Exception as e:
+        print(f"Error mixing stems: {str(e)}")
+        return jsonify({'error': f"Error mixing stems: {str(e)}"}), 500
+    
+    # e.g. "Song-Drums+Bass.mp3"
+    first_stem = stem_files[stems[0]][0]
+    base_name = build_download_name(job_id, stem_files[stems[0]][1])
+    if base_name.endswith(f'-{first_stem}'):
+        base_name = base_name[:-len(first_stem) - 1]
+    download_filename = f"{base_name}-{'+'.join(stem_files[stem][0] for stem in stems)}.{requested_format}"
+    return send_audio_file(mix_path, download_filename, FORMAT_MIMETYPES[requested_format])
+
+def save_batch_track(tracks, filename, stream, budget):
+    """Save one track of a new batch from stream; budget is a one-item list of bytes still allowed"""
+    if len(tracks) >= MAX_BATCH_TRACKS:
+        raise UploadError(f'A batch can hold at most {MAX_BATCH_TRACKS} tracks', 400)
+    job_id = str(uuid.uuid4())
+    filepath = os.path.join(UPLOAD_FOLDER, f"{job_id}_{filename}")
+    tracks.append({'job_id': job_id, 'filename': filename, 'filepath': filepath})
+    content_hash, size = save_stream_with_hash(stream, filepath, budget[0])
+    budget[0] -= size
+    tracks[-1]['content_hash'] = content_hash
+
+@app.route('/api/batches', methods=['POST'])
+def create_batch():
+    """Separate many tracks in one model session.
+
+    Takes several multipart 'files', a ZIP 'archive' of audio files, or both.
+    Every track becomes a job of its own, grouped under the returned batch_id.
+    """
+    model = request.form.get('model', 'htdemucs_ft.yaml')
+    if not model_registry.is_supported(model.split()[0].strip() if model else model):
+        return jsonify({'error': f'Model {model} is not supported by audio-separator'}), 400
+    try:
+        stems = parse_stems(request.form.get('stems'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    options = {'stems': stems} if stems else {}
+    batch_id = str(uuid.uuid4())
+    tracks = []
+    budget = [MAX_UPLOAD_BYTES]
+    try:
+        for file in request.files.getlist('files'):
+            if not file.filename:
+                continue
+            if not allowed_file(file.filename):
+                raise UploadError(f'File type not allowed: {file.filename}. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}', 400)
+            save_batch_track(tracks, secure_filename(file.filename), file.stream, budget)
+        
+        archive = request.files.get('archive')
+        if archive is not None and archive.filename:
+            with zipfile.ZipFile(archive.stream) as zip_file:
+                for info in zip_file.infolist():
+                    filename = secure_filename(os.path.basename(info.filename))
+                    # Skip folders, macOS resource forks and anything that is not audio
+                    if info.is_dir() or info.filename.startswith('__MACOSX/') or not allowed_file(filename):
+                        continue
+                    with zip_file.open(info) as member:
+                        save_batch_track(tracks, filename, member, budget)
+        
+        if not tracks:
+            raise UploadError('No audio files in the batch', 400)
+    except (UploadError, zipfile.BadZipFile) as e:
+        for track in tracks:
+            if os.path.exists(track['filepath']):
+                os.remove(track['filepath'])
+        status_code = e.status_code if isinstance(e, UploadError) else 400
+        return jsonify({'error': str(e) if isinstance(e, UploadError) else 'Archive is not a valid ZIP file'}), status_code
+    
+    # Tracks already separated before are served from the result cache right away
+    cache_model = model.split()[0].strip() if model else model
+    pending = []
+    for track in tracks:
+        job_id = track['job_id']
+        job_dir = os.path.join(OUTPUT_FOLDER, job_id)
+        input_base = os.path.splitext(os.path.basename(track['filepath']))[0]
+        cache_key = ResultCache.make_key(
+            track['content_hash'], cache_model, dict(options, long_input=False, output_format=SEPARATOR_OUTPUT_FORMAT)
+        )
+        cache_state, inflight_job_id = result_cache.claim(cache_key, job_id)
+        metrics.inc('separator_cache_requests_total', cache='result', result=cache_state)
+        output_files = None
+        if cache_state == 'hit':
+            os.makedirs(job_dir, exist_ok=True)
+            output_files = result_cache.materialize(cache_key, job_dir, input_base)
+            if output_files is None:
+                # The entry was evicted since the lookup, so separate the track after all
+                cache_state, inflight_job_id = result_cache.claim_producer(cache_key, job_id)
+        if cache_state == 'inflight':
+            # The same audio is being separated by another job; the track follows that job
+            os.remove(track['filepath'])
+            shutil.rmtree(job_dir, ignore_errors=True)
+            track['job_id'] = inflight_job_id
+            metrics.inc('separator_jobs_total', outcome='deduplicated')
+            continue
+        
+        os.makedirs(job_dir, exist_ok=True)
+        if output_files is not None:
+            os.remove(track['filepath'])
+            update_progress(
+                job_id,
+                replace=True,
+                progress=100,
+                status='Separation completed successfully!',
+                complete=True,
+                finished_at=time.time(),
+                error=None,
+                cached=True
+            )
+            schedule_pretranscode(job_id, output_files)
+            metrics.inc('separator_jobs_total', outcome='cached')
+            continue
+        
+        update_progress(
+            job_id, replace=True, progress=5, status='Waiting for the batch to start...', complete=False, error=None,
+            batch_id=batch_id
+        )
+        pending.append([job_id, track['filepath'], job_dir, cache_key])
+    
+    update_progress(
+        batch_id,
+        replace=True,
+        batch=True,
+        model=model,
+        tracks=[{'job_id': track['job_id'], 'filename': track['filename']} for track in tracks],
+        progress=0 if pending else 100,
+        status='Batch queued' if pending else 'Batch completed successfully!',
+        complete=not pending,
+        finished_at=None if pending else time.time(),
+        error=None
+    )
+    
+    if pending:
+        # The whole batch takes one execution slot and one model session
+        try:
+            submit_job(batch_id, 'batch', [batch_id, model, pending, options])
+        except (SchedulerQueueFull, SchedulerUnavailable) as e:
+            for job_id, filepath, job_dir, cache_key in pending:
+                result_cache.release(cache_key, job_id)
+                remove_progress(job_id)
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+                shutil.rmtree(job_dir, ignore_errors=True)
+            remove_progress(batch_id)
+            metrics.inc('separator_jobs_total', value=len(pending), outcome='rejected')
+            return scheduler_rejection(e)
+    
+    print(f"Batch {batch_id}: {len(tracks)} tracks, {len(pending)} to separate")
+    return jsonify({
+        'batch_id': batch_id,
+        'tracks': [{'job_id': track['job_id'], 'filename': track['filename']} for track in tracks],
+        'status': 'queued' if pending else 'completed'
+    })
+
+@app.route('/api/batches/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    """Per-track and aggregate progress of a batch, with each finished track's output files"""
+    note_job_polled(batch_id)
+    batch = get_job(batch_id)
+    if batch is None or not batch.get('batch'):
+        return jsonify({'error': 'Batch not found'}), 404
+    
+    tracks = []
+    for track in batch['tracks']:
+        progress = get_job(track['job_id']) or {'status': 'Job not found', 'progress': 0, 'complete': True, 'error': 'Job not found'}
+        entry = {
+            'job_id': track['job_id'],
+            'filename': track['filename'],
+            'status': progress.get('status'),
+            'progress': progress.get('progress', 0),
+            'complete': bool(progress.get('complete')),
+            'error': progress.get('error'),
+            'cached': bool(progress.get('cached')),
+            'cancelled': bool(progress.get('cancelled'))
+        }
+        if entry['complete'] and not entry['error']:
+            entry['output_files'] = list_output_files(track['job_id'])
+        tracks.append(entry)
+    
+    return jsonify({
+        'batch_id': batch_id,
+        'model': batch.get('model'),
+        'status': batch.get('status'),
+        'progress': int(sum(track['progress'] for track in tracks) / len(tracks)),
+        'eta_seconds': batch.get('eta_seconds'),
+        'complete': all(track['complete'] for track in tracks),
+        'completed': sum(1 for track in tracks if track['complete'] and not track['error']),
+        'failed': sum(1 for track in tracks if track['error'] and not track['cancelled']),
+        'cancelled': sum(1 for track in tracks if track['cancelled']),
+        'tracks': tracks
+    })
+
+@app.route('/api/batches/<batch_id>/all.zip', methods=['GET'])
+def download_batch(batch_id):
+    """Download the stems of every finished track of a batch as one ZIP, a folder per track"""
+    batch = get_job(batch_id)
+    if batch is None or not batch.get('batch'):
+        return jsonify({'error': 'Batch not found'}), 404
+    
+    members = []
+    for track in batch['tracks']:
+        folder = os.path.splitext(track['filename'])[0]
+        for filename in list_output_files(track['job_id']):
+            members.append((track['job_id'], filename, f"{folder}/{build_download_name(track['job_id'], filename)}"))
+    if not members:
+        return jsonify({'error': 'Batch has no output files yet'}), 404
+    
+    leases = [retention_manager.begin_download(job_id) for job_id in sorted({job_id for job_id, _, _ in members})]
+    response = stream_zip_response(members, request.args.get('format', '').lower(), f"batch-{batch_id[:8]}-stems.zip")
+    return track_download_response(leases, response)
+
 @app.route('/api/check-installation', methods=['GET'])
 def check_installation():
     """Check if all required dependencies are installed and working"""
@@ -667,16 +5303,316 @@ def check_installation():
         'message': 'All dependencies installed and working' if all_installed else 'Some dependencies are missing'
     }), 200
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Queue, job, stage timing, download, cache and FFmpeg metrics in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def admin_allowed():
+    """Admin endpoints need ADMIN_TOKEN in X-Admin-Token, or a local client when no token is set"""
+    if ADMIN_TOKEN:
+        return request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+@app.route('/api/admin/storage', methods=['GET'])
+def get_storage_usage():
+    """Report disk and memory usage of job outputs, caches and progress entries"""
+    if not admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify(retention_manager.usage())
+
+@app.route('/api/admin/storage/evict', methods=['POST'])
+def evict_storage():
+    """Evict on demand: specific job_ids, or a sweep with optional ttl_seconds/quota_bytes overrides"""
+    if not admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    params = request.get_json(silent=True) or {}
+    if params.get('job_ids'):
+        evicted = []
+        skipped = []
+        for job_id in params['job_ids']:
+            (evicted if retention_manager.evict_job(secure_filename(job_id)) else skipped).append(job_id)
+        return jsonify({'evicted': evicted, 'skipped': skipped, 'usage': retention_manager.usage()})
+    
+    evicted = retention_manager.sweep(
+        ttl_seconds=params.get('ttl_seconds'),
+        quota_bytes=params.get('quota_bytes')
+    )
+    return jsonify({'evicted': evicted, 'usage': retention_manager.usage()})
+
+class JobQueue:
+    """Hands separation jobs from the HTTP worker processes to the job runner process.
+
+    Jobs wait in a table next to the SQLite job store. HTTP workers enqueue them
+    and the job runner claims them in priority order as its scheduler has room.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        with store._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS job_queue (seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'job_id TEXT UNIQUE NOT NULL, priority INTEGER NOT NULL, args TEXT NOT NULL, state TEXT NOT NULL)'
+            )
+            # Columns added for cancellation; tables created before them gain them here
+            for column in ['last_polled REAL', 'cancel_reason TEXT']:
+                try:
+                    conn.execute(f'ALTER TABLE job_queue ADD COLUMN {column}')
+                except sqlite3.OperationalError:
+                    pass
+
+    def enqueue(self, job_id, target, args, priority=PRIORITY_NORMAL):
+        """Queue a job, or raise SchedulerQueueFull when MAX_QUEUED_JOBS are already waiting"""
+        conn = self.store._connect()
+        # BEGIN IMMEDIATE takes the write lock first, so two workers cannot both fill the last place
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            waiting = conn.execute("SELECT COUNT(*) FROM job_queue WHERE state != 'done'").fetchone()[0]
+            if waiting >= MAX_QUEUED_JOBS + MAX_CONCURRENT_JOBS:
+                raise SchedulerQueueFull(
+                    f'Job queue is full ({MAX_QUEUED_JOBS} jobs waiting)',
+                    retry_after=DEFAULT_JOB_DURATION_ESTIMATE
+                )
+            conn.execute(
+                "INSERT INTO job_queue (job_id, priority, args, state, last_polled) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, priority, json.dumps({'target': target, 'args': args}), time.time())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def claim_next(self):
+        """Take the highest-priority queued job; returns (job_id, target, args, priority) or None"""
+        conn = self.store._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT job_id, args, priority FROM job_queue WHERE state = 'queued' ORDER BY priority, seq LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE job_queue SET state = 'claimed' WHERE job_id = ?", (row[0],))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if row is None:
+            return None
+        job = json.loads(row[1])
+        return row[0], job['target'], job['args'], row[2]
+
+    def finish(self, job_id):
+        with self.store._connect() as conn:
+            conn.execute('DELETE FROM job_queue WHERE job_id = ?', (job_id,))
+
+    def cancel(self, job_id, reason):
+        """Cancel a job: a queued one is taken off the queue, a claimed one is flagged for the job runner.
+
+        Returns ('queued', target, args), ('running', None, None), or None if the job is not in the queue.
+        """
+        conn = self.store._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT state, args FROM job_queue WHERE job_id = ?', (job_id,)).fetchone()
+            if row is not None and row[0] == 'queued':
+                conn.execute('DELETE FROM job_queue WHERE job_id = ?', (job_id,))
+            elif row is not None and row[0] == 'claimed':
+                conn.execute(
+                    "UPDATE job_queue SET state = 'cancelling', cancel_reason = ? WHERE job_id = ?", (reason, job_id)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if row is None:
+            return None
+        if row[0] == 'queued':
+            job = json.loads(row[1])
+            return 'queued', job['target'], job['args']
+        return 'running', None, None
+
+    def take_cancel_requests(self):
+        """Claimed jobs flagged for cancellation since the last call, as (job_id, reason)"""
+        conn = self.store._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute("SELECT job_id, cancel_reason FROM job_queue WHERE state = 'cancelling'").fetchall()
+            conn.execute("UPDATE job_queue SET state = 'cancelled' WHERE state = 'cancelling'")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return rows
+
+    def touch(self, job_id):
+        with self.store._connect() as conn:
+            conn.execute('UPDATE job_queue SET last_polled = ? WHERE job_id = ?', (time.time(), job_id))
+
+    def idle_jobs(self, seconds):
+        """Ids of the queued and claimed jobs nobody has polled for the given number of seconds"""
+        with self.store._connect() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT job_id FROM job_queue WHERE state IN ('queued', 'claimed') AND last_polled < ?",
+                (time.time() - seconds,)
+            )]
+
+    def recover(self):
+        """Drop jobs a previous job runner claimed but never finished; returns the ids still queued"""
+        with self.store._connect() as conn:
+            conn.execute("DELETE FROM job_queue WHERE state != 'queued'")
+            return [row[0] for row in conn.execute("SELECT job_id FROM job_queue")]
+
+
+# Set in production mode, where separation runs in the job runner process
+job_queue = None
+
+def run_queued_job(job_id, target, args):
+    """Run a job the job runner claimed and take it off the queue afterwards"""
+    try:
+        run_job(job_id, target, args)
+    finally:
+        job_queue.finish(job_id)
+
+def run_job_runner():
+    """Main loop of the production job runner process: claims queued jobs and runs them"""
+    global job_queue
+    job_queue = JobQueue(job_store)
+    metrics.share(METRICS_FOLDER)
+    recover_interrupted_jobs(keep=job_queue.recover())
+    start_separator_pool()
+    retention_manager.start()
+    start_idle_canceller()
+    print(f"Job runner started (pid {os.getpid()})")
+    
+    # Exit with the production server even if it could not stop us
+    server_pid = os.getppid()
+    while os.getppid() == server_pid:
+        while job_scheduler.has_capacity():
+            claimed = job_queue.claim_next()
+            if claimed is None:
+                break
+            job_id, target, args, priority = claimed
+            adopt_progress(job_id)
+            active_jobs.register(job_id, job_progress_ids(job_id, target, args))
+            job_scheduler.submit(job_id, run_queued_job, (job_id, target, args), priority=priority)
+        for job_id, reason in job_queue.take_cancel_requests():
+            if not cancel_local_job(job_id, reason):
+                job_queue.finish(job_id)
+        time.sleep(JOB_RUNNER_POLL_INTERVAL)
+
+
+class JobRunnerSupervisor:
+    """Keeps one job runner process alive for as long as the production server runs"""
+
+    def __init__(self):
+        self.process = None
+        self.stopping = False
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._supervise, name='job-runner-supervisor', daemon=True)
+        self.thread.start()
+
+    def _supervise(self):
+        restarts = 0
+        while not self.stopping:
+            # A fresh interpreter rather than a fork, so the runner shares none of the
+            # HTTP server's sockets and state (and forked workers inherit no child handle)
+            # Its own session keeps Ctrl+C away from it, so running jobs end only via stop()
+            self.process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--job-runner'],
+                start_new_session=True
+            )
+            exit_code = self.process.wait()
+            if self.stopping:
+                return
+            restarts += 1
+            delay = min(2 ** restarts, 60)
+            print(f"Job runner exited with code {exit_code}, restarting in {delay}s")
+            time.sleep(delay)
+
+    def stop(self):
+        self.stopping = True
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def run_production_server(port, workers, threads):
+    """Serve the API with gunicorn worker processes and a separate job runner process"""
+    global job_queue
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("Production mode needs gunicorn: pip install gunicorn")
+        sys.exit(1)
+    if not job_store.persistent:
+        print("Production mode needs the shared job store: unset JOB_STORE or set JOB_STORE=sqlite")
+        sys.exit(1)
+    
+    # Checked once here; the HTTP workers are forked from this process afterwards
+    ffmpeg = check_ffmpeg()
+    print(f"FFmpeg: {ffmpeg.get('version') if ffmpeg['installed'] else ffmpeg['error']}")
+    job_queue = JobQueue(job_store)
+    supervisor = JobRunnerSupervisor()
+    
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'0.0.0.0:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('keepalive', SERVER_KEEPALIVE_SECONDS)
+            # Requests may stream for minutes; threaded workers keep heartbeating meanwhile
+            self.cfg.set('timeout', 120)
+            self.cfg.set('graceful_timeout', 30)
+            self.cfg.set('when_ready', lambda server: supervisor.start())
+            self.cfg.set('post_fork', lambda server, worker: metrics.share(METRICS_FOLDER))
+            self.cfg.set('on_exit', lambda server: supervisor.stop())
+        
+        def load(self):
+            return app
+    
+    print(f"Starting production server on port {port} with {workers} workers x {threads} threads")
+    ProductionServer().run()
+
 if __name__ == '__main__':
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Audio Separator Flask Server')
     parser.add_argument('--port', type=int, default=5000, help='Port to run the server on')
+    parser.add_argument('--production', action='store_true',
+                        help='Serve with gunicorn workers and a separate job runner instead of the debug server')
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='HTTP worker processes in production mode')
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help='Threads per HTTP worker in production mode')
+    # Used by the production server to start its job runner process
+    parser.add_argument('--job-runner', action='store_true', help=argparse.SUPPRESS)
     args = parser.parse_args()
     
+    if args.job_runner:
+        run_job_runner()
+        sys.exit(0)
+    
     # Preload models before starting the server
     print(f"Starting server on port {args.port} with preloaded models...")
     models = preload_models()
     print(f"Server has {len(models)} models preloaded and ready")
     
+    if args.production:
+        run_production_server(args.port, args.workers, args.threads)
+        sys.exit(0)
+    
+    # Fail jobs the previous run left unfinished, load the models into persistent workers
+    # and start the retention sweeps. With the debug reloader only the serving child
+    # process (WERKZEUG_RUN_MAIN=true) does this.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        recover_interrupted_jobs()
+        start_separator_pool()
+        retention_manager.start()
+        start_idle_canceller()
+    
     # Start the Flask app
     app.run(debug=True, host='0.0.0.0', port=args.port) 
\ No newline at end of file
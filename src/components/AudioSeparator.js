@@ -10,7 +10,6 @@ const AudioSeparator = () => {
   const [jobId, setJobId] = useState(null);
   const [progress, setProgress] = useState(0);
   const [status, setStatus] = useState('');
-  const [progressInterval, setProgressInterval] = useState(null);
   const [dependencies, setDependencies] = useState({});
   const [playingStemUrl, setPlayingStemUrl] = useState(null);
   const [playingStemName, setPlayingStemName] = useState(null);
@@ -18,6 +17,7 @@ const AudioSeparator = () => {
   const [stemType, setStemType] = useState('multi_stem');
   const [selectedFormat, setSelectedFormat] = useState('mp3');
   const audioPlayerRef = useRef(null);
+  const progressSubscriptionRef = useRef(null);
 
   // Use static model configuration
   const selectedModel = 'htdemucs_ft.yaml';
@@ -101,49 +101,93 @@ const AudioSeparator = () => {
     checkDependencies();
   }, []);
 
-  // Clean up progress interval on unmount
+  // Stop listening for progress updates
+  const stopProgressUpdates = () => {
+    if (progressSubscriptionRef.current) {
+      progressSubscriptionRef.current();
+      progressSubscriptionRef.current = null;
+    }
+  };
+
+  // Clean up progress subscription on unmount
   useEffect(() => {
-    return () => {
-      if (progressInterval) {
-        clearInterval(progressInterval);
+    return () => stopProgressUpdates();
+  }, []);
+
+  // Apply a progress update; returns true once the job is complete
+  const handleProgressUpdate = (id, data) => {
+    console.log("Progress update:", data);
+
+    setProgress(data.progress || 0);
+    setStatus(data.status || 'Processing...');
+
+    // If the job is complete, stop listening and fetch the results
+    if (data.complete) {
+      stopProgressUpdates();
+      fetchResults(id);
+      return true;
+    }
+    return false;
+  };
+
+  // Fallback: long-poll for progress, the server answers only when something changed
+  const startProgressLongPolling = (id, since = -1) => {
+    let cancelled = false;
+    progressSubscriptionRef.current = () => { cancelled = true; };
+
+    const poll = async (version) => {
+      while (!cancelled) {
+        try {
+          const response = await fetch(`/api/progress/${id}?since=${version}&timeout=25`);
+          if (response.status === 404) {
+            setError('The separation job is no longer available');
+            setIsProcessing(false);
+            return;
+          }
+          if (!response.ok) {
+            throw new Error(`HTTP error! Status: ${response.status}`);
+          }
+
+          const data = await response.json();
+          if (cancelled) return;
+          version = data.version;
+          if (handleProgressUpdate(id, data)) return;
+        } catch (error) {
+          console.error('Error polling for progress:', error);
+          // Don't stop polling on errors, just back off briefly
+          await new Promise(resolve => setTimeout(resolve, 1000));
+        }
       }
     };
-  }, [progressInterval]);
 
-  // Function to poll for progress updates
+    poll(since);
+  };
+
+  // Subscribe to pushed progress updates for a job
   const startProgressPolling = (id) => {
-    // Clear any existing interval
-    if (progressInterval) {
-      clearInterval(progressInterval);
+    // Clear any existing subscription
+    stopProgressUpdates();
+
+    if (!window.EventSource) {
+      startProgressLongPolling(id);
+      return;
     }
 
-    // Set up a new interval to poll for progress
-    const interval = setInterval(async () => {
-      try {
-        const response = await fetch(`/api/progress/${id}`);
-        if (!response.ok) {
-          throw new Error(`HTTP error! Status: ${response.status}`);
-        }
-        
-        const data = await response.json();
-        console.log("Progress update:", data);
-        
-        setProgress(data.progress || 0);
-        setStatus(data.status || 'Processing...');
-        
-        // If the job is complete, stop polling and fetch the results
-        if (data.complete) {
-          clearInterval(interval);
-          setProgressInterval(null);
-          fetchResults(id);
-        }
-      } catch (error) {
-        console.error('Error polling for progress:', error);
-        // Don't stop polling on errors, just log them
-      }
-    }, 1000); // Poll every second
-    
-    setProgressInterval(interval);
+    let lastVersion = -1;
+    const source = new EventSource(`/api/progress/${id}/stream`);
+    progressSubscriptionRef.current = () => source.close();
+
+    source.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      lastVersion = data.version;
+      handleProgressUpdate(id, data);
+    };
+
+    source.onerror = (error) => {
+      console.error('Progress stream error, falling back to long-polling:', error);
+      source.close();
+      startProgressLongPolling(id, lastVersion);
+    };
   };
 
   // Function to fetch final results
@@ -230,7 +274,7 @@ const AudioSeparator = () => {
     const formData = new FormData();
     formData.append('file', file);
     formData.append('model', selectedModel);
-    formData.append('stem_type', stemType);
+    formData.append('stems', stemType === 'vocals_instruments' ? 'vocals,instrumental' : 'all');
 
     try {
       console.log("Sending separation request to /api/separate with model:", selectedModel);
@@ -372,6 +416,16 @@ const AudioSeparator = () => {
       });
   };
 
+  // Download every stem in one streamed ZIP archive
+  const downloadAllStems = (id, format) => {
+    const link = document.createElement('a');
+    link.href = `/api/download/${id}/all.zip?format=${format}`;
+    link.setAttribute('download', '');
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+  };
+
   // Add audio player event listeners
   useEffect(() => {
     const audioEl = audioPlayerRef.current;
@@ -427,6 +481,12 @@ const AudioSeparator = () => {
     // Organize files by stem type
     const stems = categorizeFiles(results.output_files || []);
 
+    // Size, codec and content-addressed URL of each stem, from the job's manifest
+    const stemDetails = {};
+    (results.stems || []).forEach(stem => {
+      stemDetails[stem.filename] = stem;
+    });
+
     // Function to extract original name from filename
     const getOriginalName = (filename) => {
       // Extract original filename from the format jobId_originalName_(Stem).ext
@@ -538,6 +598,13 @@ const AudioSeparator = () => {
                   <option value="flac">FLAC</option>
                   <option value="aac">AAC</option>
                 </select>
+                <button
+                  className="download-all-button"
+                  onClick={() => downloadAllStems(results.job_id, selectedFormat)}
+                  aria-label="Download all stems"
+                >
+                  Download All (ZIP)
+                </button>
               </div>
               
               <div className="stems-list">
@@ -545,8 +612,13 @@ const AudioSeparator = () => {
                   if (files.length === 0) return null;
                   
                   return files.map((filename, index) => {
-                    const baseUrl = `/api/download/${results.job_id}/${encodeURIComponent(filename)}`;
-                    const isPlaying = playingStemUrl === baseUrl && isAudioPlaying;
+                    const details = stemDetails[filename];
+                    const baseUrl = details ? details.url : `/api/download/${results.job_id}/${encodeURIComponent(filename)}`;
+                    // The manifest's rendition URL names the encoder settings, so browsers may cache it for good
+                    const renditionUrl = details && details.renditions ? details.renditions[selectedFormat] : null;
+                    // Play the small preview rendition instead of the full-resolution stem
+                    const previewUrl = `/api/preview/${results.job_id}/${encodeURIComponent(filename)}`;
+                    const isPlaying = playingStemUrl === previewUrl && isAudioPlaying;
                     
                     // Get stem icon based on type
                     const getStemIcon = () => {
@@ -565,20 +637,24 @@ const AudioSeparator = () => {
                           {getStemIcon()}
                           <div className="stem-name">
                             <span className="stem-type">{stemType.charAt(0).toUpperCase() + stemType.slice(1)}</span>
-                            <span className="stem-format">MPEG • 319.03 KB</span>
+                            {details && (
+                              <span className="stem-format">
+                                {(details.codec || filename.split('.').pop()).toUpperCase()} • {(details.size / 1024 / 1024).toFixed(2)} MB
+                              </span>
+                            )}
                           </div>
                         </div>
                         <div className="stem-actions">
                           <button 
                             className="play-action"
-                            onClick={() => playStem(baseUrl, stemType)}
+                            onClick={() => playStem(previewUrl, stemType)}
                             aria-label={isPlaying ? "Pause stem" : "Play stem"}
                           >
                             <span className="headphones-icon">🎧</span>
                           </button>
                           <button 
                             className="download-action"
-                            onClick={() => downloadFile(baseUrl, `${originalFileName}-${stemType}.${selectedFormat}`, selectedFormat)}
+                            onClick={() => downloadFile(renditionUrl || baseUrl, `${originalFileName}-${stemType}.${selectedFormat}`, renditionUrl ? null : selectedFormat)}
                             aria-label="Download stem"
                           >
                             <span className="download-icon">⬇️</span>